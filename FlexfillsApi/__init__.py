@@ -8,4 +8,76 @@ Library to use Flex Fills WebSocket communication with FlexFills trading service
 __author__ = "Djordje Nikolic"
 __credits__ = "FlexFills"
 
-from .flexfillsapi import initialize, FlexfillsConnectException, FlexfillsParamsException
+import importlib
+
+# Public names and their modules. Modules are imported on first access, so importing
+# the package does not load asyncio, websockets, ssl or numpy before they are used.
+_EXPORTS = {
+    'initialize': '.lazy',
+    'initialize_async': '.lazy',
+    'LazyFlexfillsApi': '.lazy',
+    'FlexfillsConnectException': '.exceptions',
+    'FlexfillsParamsException': '.exceptions',
+    'FlexfillsAuthException': '.exceptions',
+    'FlexfillsCircuitOpenException': '.exceptions',
+    'FlexfillsApi': '.flexfillsapi',
+    'FlexfillsApiClient': '.flexfillsapi',
+    'AsyncFlexfillsApi': '.flexfillsapi',
+    'AsyncFlexfillsApiClient': '.flexfillsapi',
+    'OrderBook': '.orderbook',
+    'OrderBookStore': '.orderbook',
+    'ReferenceDataCache': '.refdata',
+    'CandleStore': '.candles',
+    'Backoff': '.reconnect',
+    'CircuitBreaker': '.reconnect',
+    'TokenManager': '.auth',
+    'get_token_manager': '.auth',
+    'Dispatcher': '.dispatch',
+    'ChannelPolicy': '.dispatch',
+    'AsyncSubscriptionHub': '.hub',
+    'SubscriptionHub': '.hub',
+    'OrderMetrics': '.metrics',
+    'LatencyHistogram': '.metrics',
+    'StatsDExporter': '.metrics',
+    'OrderScheduler': '.scheduler',
+    'TokenBucket': '.scheduler',
+    'JournalWriter': '.journal',
+    'JournalReplayer': '.journal',
+    'PrivateStateMirror': '.state',
+    'AsyncPrivateState': '.state',
+    'PrivateState': '.state',
+    'MarketDataPublisher': '.shm',
+    'MarketDataReader': '.shm',
+    'AsyncMarketDataGateway': '.shm',
+    'MarketDataGateway': '.shm',
+    'Bar': '.bars',
+    'BarBuilder': '.bars',
+    'AsyncBarFeed': '.bars',
+    'BarFeed': '.bars',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        # Submodules, FlexfillsApi.auth for instance
+        try:
+            return importlib.import_module(f'.{name}', __name__)
+        except ModuleNotFoundError as e:
+            if e.name != f'{__name__}.{name}':
+                raise
+
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(module, __name__), name)
+
+    # Later accesses skip this function
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,223 @@
+import base64
+import json
+import threading
+import time
+
+from .constants import (BASE_DOMAIN_TEST, BASE_DOMAIN_PROD, retry_delay, token_refresh_margin)
+from .http_pool import get_pool
+from .reconnect import Backoff
+
+
+def get_auth_token(username, password, is_test=False, host=None):
+    conn_url = host or (BASE_DOMAIN_TEST if is_test else BASE_DOMAIN_PROD)
+    pool = get_pool(conn_url)
+
+    payload = f"username={username}&password={password}"
+
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded'
+    }
+
+    # Send first request to get JSESSIONID
+
+    session_res = pool.request("POST", "/auth/login", payload, headers)
+
+    cookies = session_res.getheader('Set-Cookie')
+
+    jsession_id = None
+    if cookies:
+        for cookie in cookies.split(';'):
+            if 'SESSION' in cookie:
+                jsession_id = cookie.strip()
+                break
+
+    if not jsession_id:
+        raise Exception('Could not authenticate.')
+
+    payload = ''
+    headers = {
+        'Accept': '*/*',
+        'Cookie': jsession_id,
+        'clientSecret': password,
+    }
+
+    # Send second request to get auth token
+
+    token_res = pool.request(
+        "POST", f"/auth/auth/jwt/clients/{username}/token", payload, headers)
+    token_data = token_res.data
+
+    if token_res.status != 200 or not token_data:
+        raise Exception('Could not authenticate.')
+
+    auth_token = token_data.decode("utf-8")
+
+    return auth_token
+
+
+def token_expiry(auth_token):
+    """ Returns the exp claim of a JWT as epoch seconds, or None when it cannot be read.
+    The signature is not verified, the server does that.
+    """
+
+    token = auth_token.strip()
+    if token.lower().startswith('bearer '):
+        token = token[7:]
+
+    parts = token.split('.')
+    if len(parts) != 3:
+        return None
+
+    payload = parts[1] + '=' * (-len(parts[1]) % 4)
+
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims['exp'])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class TokenManager:
+    """
+    Auth token of one account, shared by every client of the process. The token is
+    renewed in a background thread refresh_margin seconds before its JWT expiry, so
+    the two-request login never runs on the request path, and every new token is
+    handed to the listeners (the clients), which swap it into their connections.
+    """
+
+    def __init__(self, username, password, is_test=False, refresh_margin=token_refresh_margin,
+                 fetcher=get_auth_token, host=None):
+        self.username = username
+        self.is_test = is_test
+        self.host = host
+        self.refresh_margin = refresh_margin
+
+        self._password = password
+        self._fetcher = fetcher
+
+        self._token = None
+        self._expires_at = None
+        self._lock = threading.RLock()
+        self._listeners = []
+
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def expires_at(self):
+        return self._expires_at
+
+    def get_token(self):
+        """ Returns the current token, logging in first when there is none or it has expired.
+        """
+
+        with self._lock:
+            if self._token is None or (self._expires_at is not None and time.time() >= self._expires_at):
+                self._set_token(self._fetch())
+
+            self._start()
+
+            return self._token
+
+    def refresh(self):
+        """ Logs in again now and hands the new token to the listeners.
+        """
+
+        with self._lock:
+            self._set_token(self._fetch())
+            token = self._token
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            try:
+                listener(token)
+            except Exception as e:
+                print(f"Could not update FlexfillsApi auth token: {str(e)}")
+
+        self._wakeup.set()
+
+        return token
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    # Protected Methods
+
+    def _fetch(self):
+        if self.host is None:
+            return self._fetcher(self.username, self._password, self.is_test)
+
+        return self._fetcher(self.username, self._password, self.is_test, host=self.host)
+
+    def _set_token(self, auth_token):
+        if not auth_token:
+            raise Exception('Flexfills API authentication failed!')
+
+        self._token = auth_token
+        self._expires_at = token_expiry(auth_token)
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(
+                target=self._refresh_loop, name='FlexfillsApiTokenRefresh', daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        backoff = Backoff(max_delay=retry_delay)
+        attempts = 0
+
+        while not self._stopped:
+            # Without an exp claim the token is only renewed when it is rejected
+            if self._expires_at is None:
+                wait = None
+            elif attempts:
+                wait = backoff.delay(attempts)
+            else:
+                # Short lived tokens are renewed half way through their remaining life
+                remaining = self._expires_at - time.time()
+                wait = max(0, remaining - self.refresh_margin, remaining / 2)
+
+            self._wakeup.wait(wait)
+            if self._wakeup.is_set():
+                self._wakeup.clear()
+                attempts = 0
+                continue
+
+            try:
+                self.refresh()
+                attempts = 0
+            except Exception as e:
+                attempts += 1
+                print(f"Could not refresh FlexfillsApi auth token: {str(e)}")
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_token_manager(username, password, is_test=False, host=None):
+    """ Returns the process wide TokenManager of an account, creating it on first use.
+    host overrides the login gateway of is_test, for a local or proxied gateway.
+    """
+
+    key = (username, is_test, host)
+
+    with _managers_lock:
+        manager = _managers.get(key)
+
+        if manager is None or manager._password != password:
+            manager = _managers[key] = TokenManager(username, password, is_test, host=host)
+
+        return manager
@@ -0,0 +1,75 @@
+import collections
+import time
+
+from .constants import PERIODS, PERIOD_SECONDS
+from .exceptions import FlexfillsParamsException
+
+default_backfill_parallelism = 8  # Candle pages requested at once
+default_backfill_rate = 20  # Candle pages requested per second, over all targets
+default_backfill_page_size = 1000  # Candles requested per trades_data_provider call
+
+_TARGET_KEYS = ('exchange', 'instrument', 'period')
+
+# Candles of one (exchange, instrument, period) target, rows as candles.parse_candles
+# returns them, oldest first. error is the exception of a page that failed every retry,
+# rows is then empty.
+BackfillResult = collections.namedtuple(
+    'BackfillResult', ['exchange', 'instrument', 'period', 'rows', 'error'])
+
+
+def backfill_targets(targets):
+    """ Returns the targets as (exchange, instrument, period) tuples, without duplicates.
+    Targets are tuples in that order or dicts with those keys, a missing exchange is FLEXFILLS.
+    """
+
+    normalized = []
+    for target in targets:
+        if isinstance(target, dict):
+            target = tuple(target.get(key) for key in _TARGET_KEYS)
+
+        exchange, instrument, period = target
+
+        if period not in PERIODS:
+            raise FlexfillsParamsException('the period param is not correct')
+
+        normalized.append((exchange or 'FLEXFILLS', instrument, period))
+
+    return list(dict.fromkeys(normalized))
+
+
+def candle_pages(period, count, end=None, page_size=default_backfill_page_size):
+    """ Splits the count candles of the period ending at end (epoch milliseconds, default
+    now) into (page_end, page_count) requests, newest first.
+    """
+
+    step = PERIOD_SECONDS[period] * 1000
+    end = int(time.time() * 1000) if end is None else int(end)
+    end -= end % step
+
+    pages = []
+    while count > 0:
+        page_count = min(page_size, count)
+        pages.append((end, page_count))
+
+        end -= page_count * step
+        count -= page_count
+
+    return pages
+
+
+def merge_pages(period, pages):
+    """ Returns the rows of the (page_end, page_count, rows) pages of one target, oldest
+    first, keeping the candles inside their page once.
+    """
+
+    step = PERIOD_SECONDS[period] * 1000
+
+    candles = {}
+    for page_end, page_count, rows in pages:
+        page_start = page_end - (page_count - 1) * step
+
+        for row in rows:
+            if page_start <= row[0] <= page_end:
+                candles[row[0]] = row
+
+    return [candles[timestamp] for timestamp in sorted(candles)]
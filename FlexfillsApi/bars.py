@@ -0,0 +1,465 @@
+import asyncio
+import collections
+import time
+
+from .constants import (CH_TRADE_PUBLIC, PERIODS, PERIOD_SECONDS, bar_capacity, bar_close_delay)
+from .exceptions import FlexfillsParamsException
+from .records import frame_items, first, to_ms
+
+# Local channel of the bar close events, delivered by the client dispatcher
+CH_BARS = 'BARS'
+
+_INSTRUMENT_KEYS = ('globalInstrumentCd', 'instrument')
+_PRICE_KEYS = ('price', 'px')
+_AMOUNT_KEYS = ('amount', 'quantity', 'size', 'volume')
+_TIMESTAMP_KEYS = ('timestamp', 'ts', 'time')
+
+# A bar of one period, timestamp being the epoch milliseconds of its start. Backfilled
+# bars have no vwap (NaN) and no trade count (0), the data provider does not serve them.
+Bar = collections.namedtuple(
+    'Bar', ['instrument', 'period', 'timestamp', 'open', 'high', 'low', 'close', 'volume',
+            'vwap', 'count'])
+
+# Fields of an open bar, kept in a list updated in place
+_START, _OPEN, _HIGH, _LOW, _CLOSE, _VOLUME, _NOTIONAL, _COUNT = range(8)
+
+
+def _to_bar(instrument, period, bar):
+    volume = bar[_VOLUME]
+    vwap = bar[_NOTIONAL] / volume if volume else bar[_CLOSE]
+
+    return Bar(instrument, period, bar[_START], bar[_OPEN], bar[_HIGH], bar[_LOW], bar[_CLOSE],
+               volume, vwap, bar[_COUNT])
+
+
+class BarBuilder:
+    """
+    Rolling OHLCV bars of every instrument for several periods, built trade by trade.
+    The open bar of a period is closed by the first trade of a later bar, or by
+    close_due() once its end has passed. The closed bars are kept in a ring buffer of
+    capacity bars per instrument and period, and handed to on_close when set.
+    Periods without trades have no bar. Trades older than the open bar are counted in
+    late and otherwise ignored.
+    """
+
+    def __init__(self, periods=None, capacity=bar_capacity):
+        periods = list(periods or PERIODS)
+        for period in periods:
+            if period not in PERIODS:
+                raise FlexfillsParamsException('the period param is not correct')
+
+        self.periods = periods
+        self.capacity = capacity
+
+        # Called with every closed Bar
+        self.on_close = None
+
+        self.trades = 0
+        self.late = 0
+
+        self._steps = [(period, PERIOD_SECONDS[period] * 1000) for period in periods]
+
+        # Open bars and the start of the last closed bar per instrument, one per period
+        self._open = {}
+        self._last_closed = {}
+
+        self._closed = {}
+
+    @property
+    def instruments(self):
+        return list(self._open)
+
+    def add_trade(self, instrument, price, amount, timestamp):
+        """ Adds a trade, timestamp in epoch milliseconds, to the bars of every period.
+        """
+
+        bars = self._open.get(instrument)
+        if bars is None:
+            bars = self._open[instrument] = [None] * len(self._steps)
+            self._last_closed[instrument] = [None] * len(self._steps)
+
+        self.trades += 1
+
+        for index, (period, step) in enumerate(self._steps):
+            start = timestamp - timestamp % step
+            bar = bars[index]
+
+            if bar is not None and start == bar[_START]:
+                if price > bar[_HIGH]:
+                    bar[_HIGH] = price
+                elif price < bar[_LOW]:
+                    bar[_LOW] = price
+
+                bar[_CLOSE] = price
+                bar[_VOLUME] += amount
+                bar[_NOTIONAL] += price * amount
+                bar[_COUNT] += 1
+                continue
+
+            if bar is not None and start < bar[_START]:
+                self.late += 1
+                continue
+
+            last_closed = self._last_closed[instrument][index]
+            if last_closed is not None and start <= last_closed:
+                self.late += 1
+                continue
+
+            if bar is not None:
+                self._close(instrument, index, bar)
+
+            bars[index] = [start, price, price, price, price, amount, price * amount, 1]
+
+    def close_due(self, now=None):
+        """ Closes the open bars ended before now (epoch milliseconds, default the current time).
+
+        Returns:
+        -------
+        Return the number of bars closed.
+
+        """
+
+        now = int(time.time() * 1000) if now is None else now
+
+        closed = 0
+        for instrument, bars in self._open.items():
+            for index, (period, step) in enumerate(self._steps):
+                bar = bars[index]
+                if bar is not None and bar[_START] + step <= now:
+                    bars[index] = None
+                    self._close(instrument, index, bar)
+                    closed += 1
+
+        return closed
+
+    def bars(self, instrument, period, count=None, include_open=False):
+        """ Returns the closed bars of the instrument and period, oldest first.
+
+        Parameters:
+        ----------
+        instrument: pair of currencies (BTC/USD, ...).
+        period: One of the periods of the builder.
+        count: Only the last count bars.
+        include_open: Also return the open bar, last.
+
+        """
+
+        bars = list(self._closed.get((instrument, period), ()))
+
+        if include_open:
+            current = self.current(instrument, period)
+            if current is not None:
+                bars.append(current)
+
+        return bars[-count:] if count else bars
+
+    def current(self, instrument, period):
+        """ Returns the open bar of the instrument and period, or None.
+        """
+
+        bars = self._open.get(instrument)
+        if bars is None:
+            return None
+
+        bar = bars[self.periods.index(period)]
+
+        return _to_bar(instrument, period, bar) if bar is not None else None
+
+    def load(self, instrument, period, rows):
+        """ Merges backfilled candles, rows of (timestamp, open, high, low, close, volume) like
+        candles.parse_candles returns, into the closed bars. Bars built from trades are kept,
+        candles of the open bar or later are ignored.
+
+        Returns:
+        -------
+        Return the number of candles added.
+
+        """
+
+        index = self.periods.index(period)
+
+        bars = self._open.get(instrument)
+        if bars is None:
+            bars = self._open[instrument] = [None] * len(self._steps)
+            self._last_closed[instrument] = [None] * len(self._steps)
+
+        limit = bars[index][_START] if bars[index] is not None else None
+
+        closed = {bar.timestamp: bar for bar in self._closed.get((instrument, period), ())}
+
+        added = 0
+        for row in rows:
+            timestamp = int(row[0])
+            if timestamp in closed or (limit is not None and timestamp >= limit):
+                continue
+
+            closed[timestamp] = Bar(instrument, period, timestamp, row[1], row[2], row[3], row[4],
+                                    row[5], float('nan'), 0)
+            added += 1
+
+        if added:
+            self._closed[(instrument, period)] = collections.deque(
+                (closed[timestamp] for timestamp in sorted(closed)), self.capacity)
+
+            # Trades of the backfilled bars are already in them
+            last = self._closed[(instrument, period)][-1].timestamp
+            last_closed = self._last_closed[instrument]
+            if last_closed[index] is None or last_closed[index] < last:
+                last_closed[index] = last
+
+        return added
+
+    # Protected Methods
+
+    def _close(self, instrument, index, bar):
+        period = self._steps[index][0]
+
+        closed = _to_bar(instrument, period, bar)
+        self._last_closed[instrument][index] = bar[_START]
+
+        ring = self._closed.get((instrument, period))
+        if ring is None:
+            ring = self._closed[(instrument, period)] = collections.deque(maxlen=self.capacity)
+        ring.append(closed)
+
+        if self.on_close is not None:
+            self.on_close(closed)
+
+
+class AsyncBarFeed:
+    """
+    Feeds a BarBuilder from the public trades received by a client, so live bars need
+    no polling of trades_data_provider. Trades are added in the socket reader, the bars
+    of quiet instruments are closed close_delay seconds after their end, and every
+    closed bar is handed to the listeners through the client dispatcher, as a frame of
+    the BARS channel with the fields of the Bar as data. start() can backfill the closed bars from
+    trades_data_provider.
+    """
+
+    def __init__(self, client, periods=None, capacity=bar_capacity, close_delay=bar_close_delay):
+        self._client = client
+
+        self.builder = BarBuilder(periods, capacity)
+        self.builder.on_close = self._on_close
+        self.close_delay = close_delay
+
+        self.instruments = []
+
+        self._listeners = []
+        self._bar_listeners = []
+        self._task = None
+
+        # Bars waiting for space in the full BARS queue, queued in order by one task
+        self._backlog = collections.deque()
+        self._flushing = None
+
+    def add_listener(self, callback, instruments=None):
+        """ Registers a callback for the bars closed for the instruments (default all).
+        """
+
+        listener = [set(instruments) if instruments else None, callback, CH_BARS, False]
+        self._bar_listeners.append(listener)
+
+        return listener
+
+    def remove_listener(self, listener):
+        if listener in self._bar_listeners:
+            self._bar_listeners.remove(listener)
+
+        listener[1] = None
+
+    def bars(self, instrument, period, count=None, include_open=False):
+        return self.builder.bars(instrument, period, count, include_open)
+
+    def current(self, instrument, period):
+        return self.builder.current(instrument, period)
+
+    async def start(self, instruments, backfill=0, exchange=None):
+        """ Subscribes the public trades of the instruments.
+
+        Parameters:
+        ----------
+        instruments: list of pair of currencies.
+        backfill: Closed bars to load from trades_data_provider per instrument and period.
+        exchange: Name of exchange of the backfill, FLEXFILLS by default.
+
+        """
+
+        instruments = [i for i in dict.fromkeys(instruments) if i not in self.instruments]
+        if not instruments:
+            return self
+
+        self._listeners.append(self._client._session.add_listener(
+            CH_TRADE_PUBLIC, self._on_trade, instruments, inline=True))
+        await self._client.trade_book_public(instruments)
+
+        self.instruments += instruments
+
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._close_due())
+
+        # After subscribing, so no trade falls between the backfill and the live bars
+        if backfill:
+            await self.backfill(instruments, backfill, exchange)
+
+        return self
+
+    async def backfill(self, instruments, count, exchange=None):
+        """ Loads the last count closed bars of every period of the instruments, fetched
+        concurrently with iter_candles. The error of a target that failed every retry is
+        raised once the other targets are loaded.
+
+        Returns:
+        -------
+        Return the number of bars loaded.
+
+        """
+
+        now = int(time.time() * 1000)
+        steps = dict(self.builder._steps)
+        targets = [(exchange, instrument, period)
+                   for instrument in instruments for period in self.builder.periods]
+
+        loaded = 0
+        error = None
+
+        # One candle more, the candle of the open bar is dropped
+        async for result in self._client.iter_candles(targets, count + 1, now):
+            if result.error is not None:
+                error = error or result.error
+                continue
+
+            # Start of the last closed bar
+            end = now - now % steps[result.period] - steps[result.period]
+            rows = [row for row in result.rows if row[0] <= end][-count:]
+
+            loaded += self.builder.load(result.instrument, result.period, rows)
+
+        if error is not None:
+            raise error
+
+        return loaded
+
+    async def stop(self):
+        for listener in self._listeners:
+            self._client._session.remove_listener(listener)
+
+        self._listeners = []
+        self.instruments = []
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        if self._flushing is not None:
+            self._flushing.cancel()
+            self._flushing = None
+        self._backlog.clear()
+
+    # Protected Methods
+
+    def _on_trade(self, frame):
+        for item in frame_items(frame):
+            instrument = first(item, _INSTRUMENT_KEYS)
+            price = first(item, _PRICE_KEYS)
+            if instrument is None or price is None:
+                continue
+
+            timestamp = first(item, _TIMESTAMP_KEYS)
+
+            try:
+                self.builder.add_trade(
+                    instrument, float(price), float(first(item, _AMOUNT_KEYS) or 0),
+                    to_ms(timestamp) if timestamp is not None else int(time.time() * 1000))
+            except (TypeError, ValueError):
+                continue
+
+    def _on_close(self, bar):
+        listeners = [listener for listener in self._bar_listeners
+                     if listener[0] is None or bar.instrument in listener[0]]
+        if not listeners:
+            return
+
+        frame = {"channel": CH_BARS, "data": [dict(bar._asdict())]}
+        key = (bar.instrument, bar.period)
+
+        # Behind the bars already waiting, so the listeners get them in order
+        if self._flushing is not None:
+            self._backlog.append((frame, listeners, key))
+            return
+
+        waiter = self._client.dispatcher.dispatch(frame, listeners, key)
+
+        # The BARS queue is full, the bar is queued once there is space
+        if waiter is not None:
+            self._flushing = asyncio.ensure_future(self._flush(waiter))
+
+    async def _flush(self, waiter):
+        try:
+            while True:
+                if waiter is not None:
+                    try:
+                        await waiter
+                    except Exception as e:
+                        print(f"Could not queue a FlexfillsApi bar: {str(e)}")
+
+                if not self._backlog:
+                    break
+
+                waiter = self._client.dispatcher.dispatch(*self._backlog.popleft())
+        finally:
+            self._flushing = None
+
+    async def _close_due(self):
+        while True:
+            await asyncio.sleep(1)
+            self.builder.close_due(int((time.time() - self.close_delay) * 1000))
+
+
+class BarFeed:
+    """
+    Blocking twin of AsyncBarFeed for FlexfillsApiClient and FlexfillsApi.
+    """
+
+    def __init__(self, client, periods=None, capacity=bar_capacity, close_delay=bar_close_delay):
+        client = getattr(client, 'flexfills_api', client)
+
+        self._loop_thread = client._loop_thread
+        self._feed = AsyncBarFeed(client._client, periods, capacity, close_delay)
+
+    @property
+    def builder(self):
+        return self._feed.builder
+
+    @property
+    def instruments(self):
+        return self._feed.instruments
+
+    def add_listener(self, callback, instruments=None):
+        return self._feed.add_listener(callback, instruments)
+
+    def remove_listener(self, listener):
+        self._feed.remove_listener(listener)
+
+    def bars(self, instrument, period, count=None, include_open=False):
+        return self._feed.bars(instrument, period, count, include_open)
+
+    def current(self, instrument, period):
+        return self._feed.current(instrument, period)
+
+    def start(self, instruments, backfill=0, exchange=None):
+        self._loop_thread.run(self._feed.start(instruments, backfill, exchange))
+
+        return self
+
+    def backfill(self, instruments, count, exchange=None):
+        return self._loop_thread.run(self._feed.backfill(instruments, count, exchange))
+
+    def stop(self):
+        return self._loop_thread.run(self._feed.stop())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,276 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .constants import PERIODS, PERIOD_SECONDS
+from .exceptions import FlexfillsParamsException
+from .records import to_ms
+
+COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+_COLUMN_KEYS = {
+    'timestamp': ('timestamp', 'time', 'ts', 't', 'startTime', 'start'),
+    'open': ('open', 'o'),
+    'high': ('high', 'h'),
+    'low': ('low', 'l'),
+    'close': ('close', 'c'),
+    'volume': ('volume', 'v', 'amount'),
+}
+
+default_page_size = 1000  # Candles requested per trades_data_provider call
+
+
+def period_ms(period):
+    if period not in PERIODS:
+        raise FlexfillsParamsException('the period param is not correct')
+
+    return PERIOD_SECONDS[period] * 1000
+
+
+def parse_candles(resp):
+    """ Returns the candles of a trades_data_provider response as rows of COLUMNS.
+    """
+
+    data = resp.get('data', resp) if isinstance(resp, dict) else resp
+
+    rows = []
+    for item in data or []:
+        if isinstance(item, dict):
+            row = []
+            for column in COLUMNS:
+                value = next((item[k] for k in _COLUMN_KEYS[column] if item.get(k) is not None), None)
+                row.append(value)
+
+            if row[0] is None:
+                continue
+        else:
+            row = list(item[:len(COLUMNS)])
+
+        rows.append((to_ms(row[0]),) + tuple(float(v) if v is not None else float('nan')
+                                             for v in row[1:]))
+
+    return rows
+
+
+def _subtract(span, covered, step):
+    """ Returns the parts of the [start, end] span not inside the covered spans.
+    Spans are candle start timestamps `step` apart.
+    """
+
+    start, end = span
+    missing = []
+
+    for covered_start, covered_end in covered:
+        if covered_end < start:
+            continue
+
+        if covered_start > end:
+            break
+
+        if covered_start > start:
+            missing.append((start, covered_start - step))
+
+        start = max(start, covered_end + step)
+        if start > end:
+            return missing
+
+    missing.append((start, end))
+
+    return missing
+
+
+def _merge(spans, step):
+    merged = []
+
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1] + step:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return merged
+
+
+class CandleStore:
+    """
+    Local store of candles keyed by (exchange, instrument, period). Every series is
+    kept as one .npy file per column and opened memory mapped, so the arrays returned
+    by get() are zero-copy views. The spans already fetched are recorded next to the
+    columns, and only the missing part of a requested range is downloaded, split
+    into pages of page_size candles.
+
+    fetcher is called like FlexfillsApi.trades_data_provider(exchange, instrument,
+    period, timestamp, candle_count), with timestamp being the epoch milliseconds of
+    the last candle of the page.
+    """
+
+    def __init__(self, root, fetcher, page_size=default_page_size):
+        if np is None:
+            raise ImportError(
+                'CandleStore requires numpy, install it with `pip install FlexfillsApi[numpy]`')
+
+        self.root = root
+        self.page_size = page_size
+        self._fetcher = fetcher
+        self._lock = threading.Lock()
+        self._series_locks = {}
+        self._columns = {}
+
+    def get(self, exchange, instrument, period, start, end, fetch=True):
+        """ Returns the candles with start <= timestamp <= end as a dict of column arrays.
+
+        Parameters:
+        ----------
+        exchange: Name of exchange.
+        instrument: pair of currencies (BTC/USD, ...).
+        period: One of PERIODS.
+        start: Start of the range, epoch seconds/milliseconds, ISO 8601 string or datetime.
+        end: End of the range, same formats as start.
+        fetch: Download the spans of the range that are not stored yet.
+
+        Returns:
+        -------
+        Return a dict of read-only memory mapped views, one per column of COLUMNS.
+
+        """
+
+        key = (exchange or 'FLEXFILLS', instrument, period)
+        step = period_ms(period)
+        start_ms, end_ms = to_ms(start), to_ms(end)
+
+        # Align the range on candle boundaries
+        start_ms -= start_ms % step
+        end_ms -= end_ms % step
+
+        with self._series_lock(key):
+            if fetch:
+                for missing_start, missing_end in _subtract((start_ms, end_ms), self._coverage(key), step):
+                    self._fetch(key, missing_start, missing_end, step)
+
+            columns = self._load(key)
+
+        timestamps = columns['timestamp']
+        lo = int(np.searchsorted(timestamps, start_ms, 'left'))
+        hi = int(np.searchsorted(timestamps, end_ms, 'right'))
+
+        return {column: columns[column][lo:hi] for column in COLUMNS}
+
+    def missing(self, exchange, instrument, period, start, end):
+        """ Returns the (start, end) spans in epoch milliseconds that are not stored yet.
+        """
+
+        key = (exchange or 'FLEXFILLS', instrument, period)
+        step = period_ms(period)
+        start_ms, end_ms = to_ms(start), to_ms(end)
+
+        return _subtract((start_ms - start_ms % step, end_ms - end_ms % step), self._coverage(key), step)
+
+    def add(self, exchange, instrument, period, rows, start=None, end=None):
+        """ Merges candle rows into the store and marks [start, end] as fetched.
+        """
+
+        key = (exchange or 'FLEXFILLS', instrument, period)
+
+        with self._series_lock(key):
+            self._write(key, rows, start, end)
+
+    # Protected Methods
+
+    def _series_lock(self, key):
+        with self._lock:
+            return self._series_locks.setdefault(key, threading.RLock())
+
+    def _path(self, key, name):
+        exchange, instrument, period = key
+        directory = os.path.join(self.root, exchange,
+                                 instrument.replace('/', '_'), period)
+
+        return os.path.join(directory, name)
+
+    def _coverage(self, key):
+        try:
+            with open(self._path(key, 'coverage.json'), 'r', encoding='utf-8') as f:
+                return [tuple(span) for span in json.load(f)]
+        except (OSError, ValueError):
+            return []
+
+    def _fetch(self, key, start_ms, end_ms, step):
+        exchange, instrument, period = key
+
+        page_end = end_ms
+        while page_end >= start_ms:
+            count = min(self.page_size, (page_end - start_ms) // step + 1)
+
+            resp = self._fetcher(exchange, instrument, period, page_end, count)
+            page_start = page_end - (count - 1) * step
+
+            rows = [row for row in parse_candles(resp) if page_start <= row[0] <= page_end]
+
+            # The candle still open may change, never mark it as fetched
+            now_ms = int(time.time() * 1000)
+            covered_end = min(page_end, now_ms - now_ms % step - step)
+
+            if covered_end >= page_start:
+                self._write(key, rows, page_start, covered_end)
+            else:
+                self._write(key, rows)
+
+            page_end = page_start - step
+
+    def _load(self, key):
+        columns = self._columns.get(key)
+        if columns is not None:
+            return columns
+
+        columns = {}
+        for column in COLUMNS:
+            path = self._path(key, f"{column}.npy")
+            if os.path.exists(path):
+                columns[column] = np.load(path, mmap_mode='r')
+            else:
+                columns[column] = np.empty(
+                    0, dtype=np.int64 if column == 'timestamp' else np.float64)
+
+        self._columns[key] = columns
+
+        return columns
+
+    def _write(self, key, rows, start=None, end=None):
+        columns = self._load(key)
+
+        if rows:
+            new = np.array(rows, dtype=np.float64)
+            timestamps = np.concatenate(
+                [columns['timestamp'], new[:, 0].astype(np.int64)])
+
+            # Newly fetched candles replace stored ones with the same timestamp
+            order = np.argsort(timestamps[::-1], kind='stable')
+            timestamps, index = np.unique(timestamps[::-1][order], return_index=True)
+            index = order[index]
+
+            os.makedirs(os.path.dirname(self._path(key, 'timestamp.npy')), exist_ok=True)
+
+            merged = {'timestamp': timestamps}
+            for i, column in enumerate(COLUMNS[1:], 1):
+                values = np.concatenate([columns[column], new[:, i]])[::-1]
+                merged[column] = values[index]
+
+            self._columns.pop(key, None)
+            for column in COLUMNS:
+                path = self._path(key, f"{column}.npy")
+                tmp_path = self._path(key, f"{column}.tmp.npy")
+                np.save(tmp_path, merged[column])
+                os.replace(tmp_path, path)
+
+        if start is not None and end is not None:
+            coverage = _merge(self._coverage(key) + [(start, end)], period_ms(key[2]))
+
+            os.makedirs(os.path.dirname(self._path(key, 'coverage.json')), exist_ok=True)
+            with open(self._path(key, 'coverage.json'), 'w', encoding='utf-8') as f:
+                json.dump(coverage, f)
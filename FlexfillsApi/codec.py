@@ -0,0 +1,169 @@
+import functools
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+from .exceptions import FlexfillsParamsException
+
+# Preferred order of the JSON backends, the first installed one is the default
+CODEC_NAMES = ('orjson', 'msgspec', 'json')
+
+
+class JsonCodec:
+    """
+    JSON encoder/decoder pair. dumps() always returns str, so messages are sent as
+    text frames whatever the backend, and loads() raises ValueError on invalid input.
+    native is True for the compiled backends.
+    """
+
+    __slots__ = ('name', 'loads', 'dumps', 'native')
+
+    def __init__(self, name, loads, dumps, native=False):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+        self.native = native
+
+    def __repr__(self):
+        return f"JsonCodec({self.name!r})"
+
+
+def _json_codec():
+    return JsonCodec('json', json.loads, functools.partial(json.dumps, separators=(',', ':')))
+
+
+def _orjson_codec():
+    _dumps = orjson.dumps
+
+    def dumps(obj):
+        return _dumps(obj).decode('utf-8')
+
+    return JsonCodec('orjson', orjson.loads, dumps, native=True)
+
+
+def _msgspec_codec():
+    encode = msgspec.json.Encoder().encode
+    decode = msgspec.json.Decoder().decode
+    DecodeError = msgspec.DecodeError
+
+    def loads(data):
+        try:
+            return decode(data)
+        except DecodeError as e:
+            raise ValueError(str(e))
+
+    def dumps(obj):
+        return encode(obj).decode('utf-8')
+
+    return JsonCodec('msgspec', loads, dumps, native=True)
+
+
+_FACTORIES = {
+    'orjson': (lambda: orjson is not None, _orjson_codec),
+    'msgspec': (lambda: msgspec is not None, _msgspec_codec),
+    'json': (lambda: True, _json_codec),
+}
+
+_codecs = {}
+
+
+def available_codecs():
+    return [name for name in CODEC_NAMES if _FACTORIES[name][0]()]
+
+
+def get_codec(name=None):
+    """ Returns the codec of the named backend, or of the fastest installed one.
+    A JsonCodec given as name is returned as is.
+    """
+
+    if isinstance(name, JsonCodec):
+        return name
+
+    if name is None:
+        name = available_codecs()[0]
+
+    if name not in _FACTORIES:
+        raise FlexfillsParamsException(
+            f"codec should be one of {', '.join(CODEC_NAMES)}")
+
+    is_available, factory = _FACTORIES[name]
+    if not is_available():
+        raise FlexfillsParamsException(
+            f"the {name} codec is not installed, install it with `pip install {name}`")
+
+    codec = _codecs.get(name)
+    if codec is None:
+        codec = _codecs[name] = factory()
+
+    return codec
+
+
+class TemplateMessage(dict):
+    """
+    Message dict rendered from a MessageTemplate, carrying its encoded text so it
+    is not encoded again when sent. It must not be modified once rendered.
+    """
+
+    __slots__ = ('encoded',)
+
+
+class MessageTemplate:
+    """
+    Message with constant fields (command, signature, channel, ...) encoded once.
+    render() only encodes the variable fields and joins them to the constant
+    prefix, instead of encoding the whole message on every send. Compiled codecs
+    encode a whole message faster than building and joining its pieces, with them
+    render() returns a plain dict, encoded once when sent.
+    """
+
+    def __init__(self, codec=None, **fields):
+        self.codec = get_codec(codec)
+        self.fields = fields
+
+        self._prefix = self.codec.dumps(fields)[:-1] if fields else '{'
+        self._separator = ',' if fields else ''
+        self._keys = {}
+
+    def render(self, **fields):
+        """ Returns a TemplateMessage of the constant fields followed by the given ones,
+        or a dict with a compiled codec.
+        """
+
+        if self.codec.native:
+            return dict(self.fields, **fields)
+
+        dumps = self.codec.dumps
+        keys = self._keys
+
+        encoded = self._prefix
+        separator = self._separator
+        for key, value in fields.items():
+            encoded_key = keys.get(key)
+            if encoded_key is None:
+                encoded_key = keys[key] = dumps(key) + ':'
+
+            encoded += separator + encoded_key + dumps(value)
+            separator = ','
+
+        message = TemplateMessage(self.fields, **fields)
+        message.encoded = encoded + '}'
+
+        return message
+
+
+def encode_message(message, codec):
+    """ Returns the text of a message, reusing the encoding of a TemplateMessage.
+    """
+
+    if message.__class__ is TemplateMessage:
+        return message.encoded
+
+    return codec.dumps(message)
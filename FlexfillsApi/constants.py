@@ -0,0 +1,70 @@
+# Define Auth Urls
+
+AUTH_STEP_1_TEST = 'https://uat.flexfills.com/auth/login'
+AUTH_STEP_2_TEST = 'https://uat.flexfills.com/auth/auth/jwt/clients/{}/token'
+
+AUTH_STEP_1_PROD = 'https://terminal.flexfills.com/auth/login'
+AUTH_STEP_2_PROD = 'https://terminal.flexfills.com/auth/auth/jwt/clients/{}/token'
+
+BASE_DOMAIN_TEST = "uat.flexfills.com"
+BASE_DOMAIN_PROD = "terminal.flexfills.com"
+
+WS_URL_TEST = 'wss://uat.flexfills.com/exchange/ws'
+WS_URL_PROD = 'wss://terminal.flexfills.com/exchange/ws'
+
+# Define public and private channels
+
+CH_ASSET_LIST = 'ASSET_LIST'
+CH_INSTRUMENT_LIST = 'INSTRUMENT_LIST'
+CH_ORDER_BOOK_PUBLIC = 'ORDER_BOOK_PUBLIC'
+CH_TRADE_PUBLIC = 'TRADE_PUBLIC'
+CH_ACTIVE_SUBSCRIPTIONS = 'ACTIVE_SUBSCRIPTIONS'
+
+CH_PRV_BALANCE = 'BALANCE'
+CH_PRV_TRADE_PRIVATE = 'TRADE_PRIVATE'
+CH_PRV_TRADE_POSITIONS = 'TRADE_POSITIONS'
+
+# Define available constants
+
+ORDER_DIRECTIONS = ['SELL', 'BUY']
+ORDER_TYPES = ['MARKET', 'LIMIT', 'POST_ONLY']
+TIME_IN_FORCES = ['GTC', 'GTD', 'GTT', 'FOK', 'IOC']
+PERIODS = ['ONE_MIN',
+           'FIVE_MIN',
+           'FIFTEEN_MIN',
+           'THIRTY_MIN',
+           'FORTY_FIVE_MIN',
+           'ONE_HOUR',
+           'TWO_HOUR',
+           'FOUR_HOURS',
+           'TWELVE_HOURS',
+           'ONE_DAY']
+PERIOD_SECONDS = {'ONE_MIN': 60,
+                  'FIVE_MIN': 300,
+                  'FIFTEEN_MIN': 900,
+                  'THIRTY_MIN': 1800,
+                  'FORTY_FIVE_MIN': 2700,
+                  'ONE_HOUR': 3600,
+                  'TWO_HOUR': 7200,
+                  'FOUR_HOURS': 14400,
+                  'TWELVE_HOURS': 43200,
+                  'ONE_DAY': 86400}
+
+max_tries = 5
+retry_delay = 5  # Maximum seconds between reconnection attempts
+retry_backoff_base = 0.25  # Seconds before the first retry, doubled on every attempt
+circuit_failure_threshold = 5  # Failed connection attempts opening the circuit breaker
+circuit_reset_timeout = 30  # Seconds before an open circuit breaker allows a new attempt
+max_orders_in_flight = 50  # Pipelined orders awaiting a response
+max_pool_connections = 10  # Concurrent HTTPS requests per gateway host
+token_refresh_margin = 60  # Seconds before the JWT expiry the token is renewed
+dispatch_queue_size = 10000  # Frames queued per channel for the subscription callbacks
+journal_max_bytes = 256 * 1024 * 1024  # Journal file size before rotating to a new file
+journal_buffer_size = 1024 * 1024  # Journal bytes buffered before they are written
+journal_flush_interval = 1  # Seconds after which buffered journal records are written anyway
+state_reconcile_interval = 60  # Seconds between reconciliations of the private state mirror
+shm_ring_name = 'flexfills-market-data'  # Shared memory segment of the market data gateway
+shm_ring_slots = 16384  # Book and trade records kept in the shared memory ring
+shm_book_depth = 20  # Levels per side of the books published to the shared memory ring
+bar_capacity = 1000  # Closed bars kept per instrument and period by the bar builder
+bar_close_delay = 1  # Seconds after its end a bar without newer trades is closed
@@ -0,0 +1,231 @@
+import asyncio
+import collections
+import inspect
+
+from .constants import CH_ORDER_BOOK_PUBLIC, CH_PRV_TRADE_PRIVATE, dispatch_queue_size
+from .exceptions import FlexfillsParamsException
+
+# Queue policies
+CONFLATE = 'CONFLATE'  # Keep only the latest frame per instrument, for full snapshots
+DROP_OLDEST = 'DROP_OLDEST'  # Drop the oldest queued frame when full
+DROP_NEWEST = 'DROP_NEWEST'  # Drop the incoming frame when full
+BLOCK = 'BLOCK'  # Never drop, pause reading the socket when full
+
+POLICIES = [CONFLATE, DROP_OLDEST, DROP_NEWEST, BLOCK]
+
+
+class ChannelPolicy:
+    """
+    How frames of a channel wait for its callbacks: the queue policy and the
+    maximum number of queued frames (of distinct instruments when conflating).
+    """
+
+    __slots__ = ('policy', 'maxsize')
+
+    def __init__(self, policy=BLOCK, maxsize=dispatch_queue_size):
+        if policy not in POLICIES:
+            raise FlexfillsParamsException(
+                f"policy should be one of {', '.join(POLICIES)}")
+
+        self.policy = policy
+        self.maxsize = maxsize
+
+    def __repr__(self):
+        return f"ChannelPolicy({self.policy!r}, {self.maxsize})"
+
+
+DEFAULT_POLICIES = {
+    CH_ORDER_BOOK_PUBLIC: ChannelPolicy(CONFLATE, 1000),
+    CH_PRV_TRADE_PRIVATE: ChannelPolicy(BLOCK),
+}
+
+
+class _ChannelQueue:
+    """
+    Frames of one channel waiting for their callbacks, delivered in order by one
+    worker task so a slow channel never delays the others.
+    """
+
+    def __init__(self, channel, policy, dispatcher):
+        self.channel = channel
+        self.policy = policy
+        self.dispatcher = dispatcher
+
+        self.items = collections.OrderedDict() if policy.policy == CONFLATE else collections.deque()
+        self.max_depth = 0
+        self.delivering = False
+        self.delivered = 0
+        self.dropped = 0
+        self.conflated = 0
+
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    @property
+    def depth(self):
+        return len(self.items)
+
+    def put(self, frame, listeners, key):
+        """ Queues the frame, returning an awaitable when the reader has to wait for space.
+        """
+
+        items = self.items
+        policy = self.policy.policy
+
+        if policy == CONFLATE:
+            if key in items:
+                items[key] = (frame, listeners)
+                self.conflated += 1
+                return None
+
+            if len(items) >= self.policy.maxsize:
+                items.popitem(last=False)
+                self.dropped += 1
+
+            items[key] = (frame, listeners)
+
+        elif len(items) >= self.policy.maxsize:
+            if policy == BLOCK:
+                return self._put_when_free(frame, listeners)
+
+            self.dropped += 1
+            if policy == DROP_NEWEST:
+                return None
+
+            items.popleft()
+            items.append((frame, listeners))
+
+        else:
+            items.append((frame, listeners))
+
+        self.max_depth = max(self.max_depth, len(items))
+        self._ready.set()
+
+        return None
+
+    async def _put_when_free(self, frame, listeners):
+        while len(self.items) >= self.policy.maxsize:
+            self._space.clear()
+            await self._space.wait()
+
+        self.items.append((frame, listeners))
+        self.max_depth = max(self.max_depth, len(self.items))
+        self._ready.set()
+
+    async def _run(self):
+        while True:
+            if not self.items:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            if self.policy.policy == CONFLATE:
+                _, (frame, listeners) = self.items.popitem(last=False)
+            else:
+                frame, listeners = self.items.popleft()
+
+            self._space.set()
+
+            self.delivering = True
+            try:
+                await self.dispatcher.deliver(frame, listeners)
+            finally:
+                self.delivering = False
+
+            self.delivered += 1
+
+    def stats(self):
+        return {
+            'policy': self.policy.policy,
+            'maxsize': self.policy.maxsize,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'conflated': self.conflated,
+        }
+
+    def close(self):
+        self._task.cancel()
+
+
+class Dispatcher:
+    """
+    Stage between the socket reader and the subscription callbacks. Every channel
+    has its own bounded queue, handled by the policy of the channel (CONFLATE,
+    DROP_OLDEST, DROP_NEWEST or BLOCK). Callbacks run on the event loop, or in the
+    executor when one is given (a ThreadPoolExecutor lets callbacks block, a
+    ProcessPoolExecutor needs picklable callbacks and frames). Coroutine
+    callbacks are awaited on the event loop.
+    """
+
+    def __init__(self, policies=None, executor=None, default_policy=None):
+        self.policies = dict(DEFAULT_POLICIES)
+        self.policies.update(policies or {})
+        self.default_policy = default_policy or ChannelPolicy()
+        self.executor = executor
+
+        self._queues = {}
+
+    def set_policy(self, channel, policy, maxsize=dispatch_queue_size):
+        """ Sets the policy of a channel. Set it before subscribing, the frames still
+        queued for the channel are discarded.
+        """
+
+        self.policies[channel] = ChannelPolicy(policy, maxsize)
+
+        queue = self._queues.pop(channel, None)
+        if queue is not None:
+            queue.close()
+
+    def dispatch(self, frame, listeners, key=None):
+        """ Queues a frame for the listeners, returning an awaitable when the reader has to wait.
+        """
+
+        channel = frame.get('channel')
+
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = _ChannelQueue(
+                channel, self.policies.get(channel, self.default_policy), self)
+
+        return queue.put(frame, listeners, key)
+
+    async def deliver(self, frame, listeners):
+        for listener in listeners:
+            callback = listener[1]
+
+            # The listener was removed while the frame was queued
+            if callback is None:
+                continue
+
+            try:
+                if self.executor is not None and not inspect.iscoroutinefunction(callback):
+                    await asyncio.get_running_loop().run_in_executor(self.executor, callback, frame)
+                    continue
+
+                result = callback(frame)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"Error in FlexfillsApi callback: {str(e)}")
+
+    async def drain(self):
+        """ Waits until every queued frame has been delivered.
+        """
+
+        while any(queue.items or queue.delivering for queue in self._queues.values()):
+            await asyncio.sleep(0.001)
+
+    def stats(self):
+        """ Returns the queue depth, drop and conflation counters of every channel.
+        """
+
+        return {channel: queue.stats() for channel, queue in self._queues.items()}
+
+    def close(self):
+        for queue in self._queues.values():
+            queue.close()
+
+        self._queues.clear()
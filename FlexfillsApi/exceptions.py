@@ -0,0 +1,24 @@
+class FlexfillsConnectException(Exception):
+    "Raised when unauthorized access to Flexfills API"
+
+    def __init__(self, message='', sent=False):
+        super().__init__(message)
+
+        # True when the request reached the socket before the failure, so the
+        # server may have acted on it
+        self.sent = sent
+
+
+class FlexfillsAuthException(FlexfillsConnectException):
+    "Raised when the Flexfills API rejects the auth token"
+    pass
+
+
+class FlexfillsCircuitOpenException(FlexfillsConnectException):
+    "Raised without trying to connect while the connection circuit breaker is open"
+    pass
+
+
+class FlexfillsParamsException(Exception):
+    "Raised when parameters are not valid"
+    pass
@@ -1,294 +1,557 @@
-import os
-import json
 import asyncio
-import websockets
-from websockets.exceptions import InvalidStatusCode, ConnectionClosedError
-import http.client
+import collections
+import concurrent.futures
 import ssl
 import time
 import functools
+import uuid
+
+from .constants import (AUTH_STEP_1_TEST, AUTH_STEP_2_TEST, AUTH_STEP_1_PROD, AUTH_STEP_2_PROD,
+                        BASE_DOMAIN_TEST, BASE_DOMAIN_PROD, WS_URL_TEST, WS_URL_PROD,
+                        CH_ASSET_LIST, CH_INSTRUMENT_LIST, CH_ORDER_BOOK_PUBLIC, CH_TRADE_PUBLIC,
+                        CH_ACTIVE_SUBSCRIPTIONS, CH_PRV_BALANCE, CH_PRV_TRADE_PRIVATE,
+                        CH_PRV_TRADE_POSITIONS, PERIODS, max_tries, retry_delay, max_orders_in_flight)
+from .exceptions import FlexfillsConnectException, FlexfillsAuthException, FlexfillsParamsException
+from .reconnect import Backoff, is_idempotent, should_retry
+from .codec import get_codec, MessageTemplate
+from .session import FlexfillsSession, EventLoopThread, shared_loop_thread, message_instruments
+from .orderbook import OrderBookStore
+from .hub import AsyncSubscriptionHub, SubscriptionHub
+from .metrics import OrderMetrics, STAGE_VALIDATE
+from .scheduler import TokenBucket
+from .journal import JournalReplayer
+from .state import AsyncPrivateState, PrivateState
+from .validation import CREATE_ORDER_SCHEMA, CANCEL_ORDER_SCHEMA, MODIFY_ORDER_SCHEMA
+from .http_pool import get_pool
+from .auth import get_auth_token, get_token_manager
+from .backfill import (backfill_targets, candle_pages, merge_pages, BackfillResult,
+                       default_backfill_parallelism, default_backfill_rate, default_backfill_page_size)
+from .history import (date_chunks, history_records, BoundaryDeduplicator, default_history_chunk,
+                      default_history_parallelism, default_instruments_per_chunk)
+# Defined with LazyFlexfillsApi, still importable from this module
+from .lazy import initialize, initialize_async  # noqa: F401
+from .refdata import DS_ASSETS, DS_INSTRUMENTS, DS_EXCHANGES, DS_INSTRUMENTS_BY_TYPE
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
 
-# Define Auth Urls
 
-AUTH_STEP_1_TEST = 'https://uat.flexfills.com/auth/login'
-AUTH_STEP_2_TEST = 'https://uat.flexfills.com/auth/auth/jwt/clients/{}/token'
-
-AUTH_STEP_1_PROD = 'https://terminal.flexfills.com/auth/login'
-AUTH_STEP_2_PROD = 'https://terminal.flexfills.com/auth/auth/jwt/clients/{}/token'
-
-BASE_DOMAIN_TEST = "uat.flexfills.com"
-BASE_DOMAIN_PROD = "terminal.flexfills.com"
-
-# Define public and private channels
-
-CH_ASSET_LIST = 'ASSET_LIST'
-CH_INSTRUMENT_LIST = 'INSTRUMENT_LIST'
-CH_ORDER_BOOK_PUBLIC = 'ORDER_BOOK_PUBLIC'
-CH_TRADE_PUBLIC = 'TRADE_PUBLIC'
-CH_ACTIVE_SUBSCRIPTIONS = 'ACTIVE_SUBSCRIPTIONS'
+def handleAPIException(max_retries=max_tries, delay=retry_delay):
+    def decorator_retry(func):
+        idempotent = is_idempotent(func.__name__)
 
-CH_PRV_BALANCE = 'BALANCE'
-CH_PRV_TRADE_PRIVATE = 'TRADE_PRIVATE'
-CH_PRV_TRADE_POSITIONS = 'TRADE_POSITIONS'
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            backoff = Backoff(max_delay=delay)
+            attempts = 0
 
-# Define available constants
+            while True:
+                try:
+                    return func(self, *args, **kwargs)
+                except Exception as e:
+                    attempts += 1
 
-ORDER_DIRECTIONS = ['SELL', 'BUY']
-ORDER_TYPES = ['MARKET', 'LIMIT', 'POST_ONLY']
-TIME_IN_FORCES = ['GTC', 'GTD', 'GTT', 'FOK', 'IOC']
-PERIODS = ['ONE_MIN',
-           'FIVE_MIN',
-           'FIFTEEN_MIN',
-           'THIRTY_MIN',
-           'FORTY_FIVE_MIN',
-           'ONE_HOUR',
-           'TWO_HOUR',
-           'FOUR_HOURS',
-           'TWELVE_HOURS',
-           'ONE_DAY']
+                    if attempts >= max_retries or not should_retry(e, idempotent):
+                        print(f"Failed to execute {func.__name__} after {attempts} attempts: {str(e)}")
+                        raise
 
-max_tries = 5
-retry_delay = 5  # Seconds between reconnection attempts
+                    wait = backoff.delay(attempts)
+                    print(
+                        f"Failed to execute {func.__name__}, retrying in {wait:.2f} seconds: {attempts}")
 
+                    # Only the calling thread waits, the connection is restored in the background
+                    time.sleep(wait)
 
-class FlexfillsConnectException(Exception):
-    "Raised when unauthorized access to Flexfills API"
-    pass
+                    if isinstance(e, FlexfillsAuthException):
+                        self.login_flexfills()
 
+        return wrapper
 
-class FlexfillsParamsException(Exception):
-    "Raised when parameters are not valid"
-    pass
+    return decorator_retry
 
 
-def handleAPIException(max_retries=max_tries, delay=retry_delay):
+def handleAsyncAPIException(max_retries=max_tries, delay=retry_delay):
     def decorator_retry(func):
+        idempotent = is_idempotent(func.__name__)
+
         @functools.wraps(func)
-        def wrapper(*args, **kwargs):
+        async def wrapper(self, *args, **kwargs):
+            backoff = Backoff(max_delay=delay)
             attempts = 0
 
-            while attempts < max_retries:
+            while True:
                 try:
-                    return func(*args, **kwargs)
-                except FlexfillsConnectException as e:
-                    # Handling API connection error
-                    attempts += 1
-                    print(
-                        f"Flexfills API connection was closed, retrying: {attempts}")
-
-                    # Reset connection on FlexfillsConnectException and relogin
-
-                    time.sleep(delay)
-                    FlexfillsApi.login_flexfills()
-
+                    await self.wait_ready()
+                    return await func(self, *args, **kwargs)
                 except Exception as e:
                     attempts += 1
-                    print(f"Failed to execute {
-                        func.__name__}, retrying: {attempts}")
 
-                    time.sleep(delay)
+                    if attempts >= max_retries or not should_retry(e, idempotent):
+                        print(f"Failed to execute {func.__name__} after {attempts} attempts: {str(e)}")
+                        raise
 
-            # Reset connection after failure and start over instead of crashing
-            print(
-                f"Failed after {max_retries} attempts while executing {func.__name__}. Dropping connection and starting over.")
+                    wait = backoff.delay(attempts)
+                    print(
+                        f"Failed to execute {func.__name__}, retrying in {wait:.2f} seconds: {attempts}")
 
-            # Drop the connection and reinitialize
-            FlexfillsApi.login_flexfills()
+                    await asyncio.sleep(wait)
 
-            # Start the process again
-            return wrapper(*args, **kwargs)
+                    if isinstance(e, FlexfillsAuthException):
+                        await self.login_flexfills()
 
         return wrapper
 
     return decorator_retry
 
 
-def initialize(username, password, is_test=False):
-    flexfills = FlexfillsApi(username, password, is_test)
-
-    return flexfills
-
-
-def get_auth_token(username, password, is_test=False):
-    conn_url = BASE_DOMAIN_TEST if is_test else BASE_DOMAIN_PROD
-    # context = ssl.create_default_context()
-    context = ssl._create_unverified_context()
-    conn = http.client.HTTPSConnection(conn_url, context=context)
-
-    payload = f"username={username}&password={password}"
-
-    headers = {
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
+class FlexfillsApi:
+    """
+    FlexFills API Wrapper Class
 
-    # Send first request to get JSESSIONID
+    Every instance is one account, with its own connection, subscriptions, order books
+    and metrics. The accounts of a process share the event loop thread, the REST
+    connection pool and the token of each account, so one process can run many.
+    """
 
-    conn.request("POST", "/auth/login", payload, headers)
-    session_res = conn.getresponse()
-    session_data = session_res.read()
+    def __init__(self, username, password, is_test, warm_instruments=None, reference_cache=None,
+                 flexfills_api=None):
+        self.set_flexfills_credentials(username, password, is_test)
+        self.warm_instruments = list(warm_instruments or [])
+        self.reference_cache = reference_cache
 
-    cookies = session_res.getheader('Set-Cookie')
+        # A client logged in by LazyFlexfillsApi is used as is
+        self.flexfills_api = flexfills_api
+        if flexfills_api is None:
+            self.init_flexfills()
 
-    jsession_id = None
-    if cookies:
-        for cookie in cookies.split(';'):
-            if 'SESSION' in cookie:
-                jsession_id = cookie.strip()
-                break
+        self.auth_token = None
 
-    if not jsession_id:
-        raise Exception('Could not authenticate.')
+    def init_flexfills(self):
+        # Initialize FlexfillsApi
+        self.login_flexfills()
 
-    payload = ''
-    headers = {
-        'Accept': '*/*',
-        'Cookie': jsession_id,
-        'clientSecret': password,
-    }
+    def set_flexfills_credentials(self, user, pwd, is_test):
+        self.flexfills_username = user
+        self.flexfills_password = pwd
+        self.is_test = is_test
 
-    # Send second request to get auth token
+    def login_flexfills(self):
+        # The token is shared by every client of the account in the process
+        token_manager = get_token_manager(
+            self.flexfills_username, self.flexfills_password, self.is_test)
 
-    conn.request(
-        "POST", f"/auth/auth/jwt/clients/{username}/token", payload, headers)
-    token_res = conn.getresponse()
-    token_data = token_res.read()
+        # The token was rejected, renew it. The clients keep their connection,
+        # subscriptions and order books.
+        if self.flexfills_api is not None:
+            token_manager.refresh()
+            print(f"FlexfillsApi auth token of {self.flexfills_username} renewed!")
+            return
 
-    if token_res.status != 200 or not token_data:
-        raise Exception('Could not authenticate.')
+        # Initialize FlexfillsApi
+        print("Initializing FlexfillsApi with provided credentials...")
+        auth_token = token_manager.get_token()
 
-    conn.close()
+        flexfills_api = FlexfillsApiClient(
+            auth_token, self.is_test, warm_instruments=self.warm_instruments,
+            reference_cache=self.reference_cache, token_manager=token_manager,
+            metrics=OrderMetrics(account=self.flexfills_username),
+            loop_thread=shared_loop_thread())
 
-    auth_token = token_data.decode("utf-8")
+        self.flexfills_api = flexfills_api
+        flexfills_api.warm_up()
+        print("FlexfillsApi initialized successfully!")
 
-    return auth_token
+    def close(self):
+        """ Closes the connections of the account. The shared event loop keeps running
+        for the other accounts.
+        """
 
+        if self.flexfills_api is not None:
+            self.flexfills_api.close()
 
-class FlexfillsApi:
-    """
-    FlexFills API Wrapper Class
-    """
+    # FlexfillsApi Wrapper Functions
 
-    flexfills_api = None
-    flexfills_username = ''
-    flexfills_password = ''
-    is_test = True
+    @handleAPIException(max_tries, retry_delay)
+    def warm_up(self, instruments=None):
+        return self.flexfills_api.warm_up(instruments)
 
-    def __init__(self, username, password, is_test):
-        FlexfillsApi.set_flexfills_credentials(username, password, is_test)
-        self.init_flexfills()
+    @handleAPIException(max_tries, retry_delay)
+    def get_active_subscriptions(self):
+        return self.flexfills_api.get_active_subscriptions()
 
-        self.auth_token = None
+    def order_book(self, instrument):
+        return self.flexfills_api.order_book(instrument)
 
-    def init_flexfills(self):
-        # Initialize FlexfillsApi
-        FlexfillsApi.login_flexfills()
+    def dispatch_stats(self):
+        return self.flexfills_api.dispatch_stats()
 
-    @classmethod
-    def set_flexfills_credentials(cls, user, pwd, is_test):
-        cls.flexfills_username = user
-        cls.flexfills_password = pwd
-        cls.is_test = is_test
+    def replay(self, path, speed=None):
+        return self.flexfills_api.replay(path, speed)
 
-    @classmethod
-    def login_flexfills(cls):
-        # Initialize FlexfillsApi
-        print("Initializing FlexfillsApi with provided credentials...")
-        auth_token = get_auth_token(
-            cls.flexfills_username, cls.flexfills_password, cls.is_test)
+    @property
+    def hub(self):
+        return self.flexfills_api.hub
 
-        if not auth_token:
-            raise Exception('Flexfills API authentication failed!')
+    @property
+    def state(self):
+        return self.flexfills_api.state
 
-        flexfills_api = FlexfillsApiClient(auth_token, cls.is_test)
+    @property
+    def metrics(self):
+        return self.flexfills_api.metrics
 
-        cls.flexfills_api = flexfills_api
-        print("FlexfillsApi initialized successfully!")
+    @property
+    def scheduler(self):
+        return self.flexfills_api.scheduler
 
-    # FlexfillsApi Wrapper Functions
+    @scheduler.setter
+    def scheduler(self, scheduler):
+        self.flexfills_api.scheduler = scheduler
 
     @handleAPIException(max_tries, retry_delay)
     def get_asset_list(self):
-        self.flexfills_api.get_asset_list()
+        return self.flexfills_api.get_asset_list()
 
     @handleAPIException(max_tries, retry_delay)
     def get_instrument_list(self):
-        self.flexfills_api.get_instrument_list()
+        return self.flexfills_api.get_instrument_list()
 
     @handleAPIException(max_tries, retry_delay)
     def subscribe_order_books(self, instruments, callback=None):
-        self.flexfills_api.subscribe_order_books(instruments, callback)
+        return self.flexfills_api.subscribe_order_books(instruments, callback)
 
     @handleAPIException(max_tries, retry_delay)
     def unsubscribe_order_books(self, instruments):
-        self.flexfills_api.unsubscribe_order_books(instruments)
+        return self.flexfills_api.unsubscribe_order_books(instruments)
 
     @handleAPIException(max_tries, retry_delay)
     def trade_book_public(self, instruments, callback=None):
-        self.flexfills_api.trade_book_public(instruments, callback)
+        return self.flexfills_api.trade_book_public(instruments, callback)
 
     @handleAPIException(max_tries, retry_delay)
     def get_balance(self, currencies):
-        self.flexfills_api.get_balance(currencies)
+        return self.flexfills_api.get_balance(currencies)
 
     @handleAPIException(max_tries, retry_delay)
     def get_private_trades(self, instruments, callback=None):
-        self.flexfills_api.get_private_trades(instruments, callback)
+        return self.flexfills_api.get_private_trades(instruments, callback)
 
     @handleAPIException(max_tries, retry_delay)
     def get_open_orders_list(self, instruments=None):
-        self.flexfills_api.get_open_orders_list(instruments)
+        return self.flexfills_api.get_open_orders_list(instruments)
 
     @handleAPIException(max_tries, retry_delay)
-    def create_order(self, order_datas):
-        self.flexfills_api.create_order(order_datas)
+    def create_order(self, order_datas, pipelined=False, max_in_flight=max_orders_in_flight):
+        return self.flexfills_api.create_order(order_datas, pipelined, max_in_flight)
 
     @handleAPIException(max_tries, retry_delay)
-    def cancel_order(self, order_datas):
-        self.flexfills_api.cancel_order(order_datas)
+    def cancel_order(self, order_datas, pipelined=False, max_in_flight=max_orders_in_flight):
+        return self.flexfills_api.cancel_order(order_datas, pipelined, max_in_flight)
+
+    def iter_create_order(self, order_datas, max_in_flight=max_orders_in_flight):
+        return self.flexfills_api.iter_create_order(order_datas, max_in_flight)
+
+    def iter_cancel_order(self, order_datas, max_in_flight=max_orders_in_flight):
+        return self.flexfills_api.iter_cancel_order(order_datas, max_in_flight)
 
     @handleAPIException(max_tries, retry_delay)
     def modify_order(self, order_data):
-        self.flexfills_api.modify_order(order_data)
+        return self.flexfills_api.modify_order(order_data)
 
     @handleAPIException(max_tries, retry_delay)
     def get_trade_history(self, date_from, date_to, instruments):
-        self.flexfills_api.get_trade_history(date_from, date_to, instruments)
+        return self.flexfills_api.get_trade_history(date_from, date_to, instruments)
 
     @handleAPIException(max_tries, retry_delay)
     def get_order_history(self, date_from, date_to, instruments, statues):
-        self.flexfills_api.get_order_history(
+        return self.flexfills_api.get_order_history(
             date_from, date_to, instruments, statues)
 
+    def iter_trade_history(self, date_from, date_to, instruments, chunk=default_history_chunk,
+                           instruments_per_chunk=default_instruments_per_chunk,
+                           parallelism=default_history_parallelism):
+        return self.flexfills_api.iter_trade_history(
+            date_from, date_to, instruments, chunk, instruments_per_chunk, parallelism)
+
+    def iter_order_history(self, date_from, date_to, instruments, statues, chunk=default_history_chunk,
+                           instruments_per_chunk=default_instruments_per_chunk,
+                           parallelism=default_history_parallelism):
+        return self.flexfills_api.iter_order_history(
+            date_from, date_to, instruments, statues, chunk, instruments_per_chunk, parallelism)
+
     @handleAPIException(max_tries, retry_delay)
     def get_trade_positions(self):
-        self.flexfills_api.get_trade_positions()
+        return self.flexfills_api.get_trade_positions()
 
     @handleAPIException(max_tries, retry_delay)
     def trades_data_provider(self, exchange, instrument, period, timestamp, candle_count):
-        self.flexfills_api.trades_data_provider(
+        return self.flexfills_api.trades_data_provider(
             exchange, instrument, period, timestamp, candle_count)
 
+    def iter_candles(self, targets, count, end=None, parallelism=default_backfill_parallelism,
+                     rate=default_backfill_rate, page_size=default_backfill_page_size):
+        return self.flexfills_api.iter_candles(targets, count, end, parallelism, rate, page_size)
+
     @handleAPIException(max_tries, retry_delay)
     def get_exchange_names(self):
-        self.flexfills_api.get_exchange_names()
+        return self.flexfills_api.get_exchange_names()
 
     @handleAPIException(max_tries, retry_delay)
     def get_instruments_by_type(self, exchange, instrument_type):
-        self.flexfills_api.get_instruments_by_type(exchange, instrument_type)
+        return self.flexfills_api.get_instruments_by_type(exchange, instrument_type)
 
 
-class FlexfillsApiClient:
+class AsyncFlexfillsApi:
+    """
+    FlexFills API Wrapper Class, awaitable twin of FlexfillsApi
+    """
+
+    def __init__(self, username, password, is_test, warm_instruments=None, reference_cache=None):
+        self.flexfills_username = username
+        self.flexfills_password = password
+        self.is_test = is_test
+        self.warm_instruments = list(warm_instruments or [])
+        self.reference_cache = reference_cache
+
+        self.flexfills_api = None
+        self._login_task = None
+
+    async def login_flexfills(self, background=False):
+        token_manager = get_token_manager(
+            self.flexfills_username, self.flexfills_password, self.is_test)
+        loop = asyncio.get_running_loop()
+
+        if self.flexfills_api is not None:
+            await loop.run_in_executor(None, token_manager.refresh)
+            print("FlexfillsApi auth token renewed!")
+            return
+
+        if background:
+            # The client is created now and gets its token when the login completes
+            print("Initializing FlexfillsApi with provided credentials in the background...")
+            self.flexfills_api = AsyncFlexfillsApiClient(
+                None, self.is_test, warm_instruments=self.warm_instruments,
+                reference_cache=self.reference_cache,
+                metrics=OrderMetrics(account=self.flexfills_username))
+            self._login_task = asyncio.ensure_future(self._login_in_background(token_manager))
+            return
+
+        print("Initializing FlexfillsApi with provided credentials...")
+        auth_token = await loop.run_in_executor(None, token_manager.get_token)
+
+        flexfills_api = AsyncFlexfillsApiClient(
+            auth_token, self.is_test, warm_instruments=self.warm_instruments,
+            reference_cache=self.reference_cache, token_manager=token_manager,
+            metrics=OrderMetrics(account=self.flexfills_username))
+
+        self.flexfills_api = flexfills_api
+        await flexfills_api.warm_up()
+        print("FlexfillsApi initialized successfully!")
+
+    async def wait_ready(self):
+        """ Waits for a login started by initialize_async(lazy=True), raising its error.
+        The methods of this class wait for it themselves, call it before using hub or
+        state directly.
+        """
+
+        task = self._login_task
+        if task is None:
+            return
+
+        try:
+            await asyncio.shield(task)
+        finally:
+            # A failed login is raised once, the retry logs in again
+            if task.done():
+                self._login_task = None
+
+    async def close(self):
+        if self._login_task is not None:
+            self._login_task.cancel()
+
+        if self.flexfills_api is not None:
+            await self.flexfills_api.close()
+
+    async def _login_in_background(self, token_manager):
+        loop = asyncio.get_running_loop()
+
+        try:
+            await loop.run_in_executor(None, token_manager.get_token)
+        except Exception as e:
+            print(f"Failed to initialize FlexfillsApi: {str(e)}")
+            self.flexfills_api.fail_auth(e)
+            raise FlexfillsAuthException(f"Could not authenticate: {str(e)}") from e
+
+        self.flexfills_api.use_token_manager(token_manager)
+        await self.flexfills_api.connect()
+        await self.flexfills_api.warm_up()
+        print("FlexfillsApi initialized successfully!")
+
+    # FlexfillsApi Wrapper Functions
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def warm_up(self, instruments=None):
+        return await self.flexfills_api.warm_up(instruments)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def get_active_subscriptions(self):
+        return await self.flexfills_api.get_active_subscriptions()
+
+    def order_book(self, instrument):
+        return self.flexfills_api.order_book(instrument)
+
+    def dispatch_stats(self):
+        return self.flexfills_api.dispatch_stats()
+
+    async def replay(self, path, speed=None):
+        return await self.flexfills_api.replay(path, speed)
+
+    @property
+    def hub(self):
+        return self.flexfills_api.hub
+
+    @property
+    def state(self):
+        return self.flexfills_api.state
+
+    @property
+    def metrics(self):
+        return self.flexfills_api.metrics
+
+    @property
+    def scheduler(self):
+        return self.flexfills_api.scheduler
+
+    @scheduler.setter
+    def scheduler(self, scheduler):
+        self.flexfills_api.scheduler = scheduler
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def get_asset_list(self):
+        return await self.flexfills_api.get_asset_list()
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def get_instrument_list(self):
+        return await self.flexfills_api.get_instrument_list()
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def subscribe_order_books(self, instruments, callback=None):
+        return await self.flexfills_api.subscribe_order_books(instruments, callback)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def unsubscribe_order_books(self, instruments):
+        return await self.flexfills_api.unsubscribe_order_books(instruments)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def trade_book_public(self, instruments, callback=None):
+        return await self.flexfills_api.trade_book_public(instruments, callback)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def get_balance(self, currencies):
+        return await self.flexfills_api.get_balance(currencies)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def get_private_trades(self, instruments, callback=None):
+        return await self.flexfills_api.get_private_trades(instruments, callback)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def get_open_orders_list(self, instruments=None):
+        return await self.flexfills_api.get_open_orders_list(instruments)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def create_order(self, order_datas, pipelined=False, max_in_flight=max_orders_in_flight):
+        return await self.flexfills_api.create_order(order_datas, pipelined, max_in_flight)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def cancel_order(self, order_datas, pipelined=False, max_in_flight=max_orders_in_flight):
+        return await self.flexfills_api.cancel_order(order_datas, pipelined, max_in_flight)
+
+    def iter_create_order(self, order_datas, max_in_flight=max_orders_in_flight):
+        return self.flexfills_api.iter_create_order(order_datas, max_in_flight)
+
+    def iter_cancel_order(self, order_datas, max_in_flight=max_orders_in_flight):
+        return self.flexfills_api.iter_cancel_order(order_datas, max_in_flight)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def modify_order(self, order_data):
+        return await self.flexfills_api.modify_order(order_data)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def get_trade_history(self, date_from, date_to, instruments):
+        return await self.flexfills_api.get_trade_history(date_from, date_to, instruments)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def get_order_history(self, date_from, date_to, instruments, statues):
+        return await self.flexfills_api.get_order_history(
+            date_from, date_to, instruments, statues)
+
+    def iter_trade_history(self, date_from, date_to, instruments, chunk=default_history_chunk,
+                           instruments_per_chunk=default_instruments_per_chunk,
+                           parallelism=default_history_parallelism):
+        return self.flexfills_api.iter_trade_history(
+            date_from, date_to, instruments, chunk, instruments_per_chunk, parallelism)
+
+    def iter_order_history(self, date_from, date_to, instruments, statues, chunk=default_history_chunk,
+                           instruments_per_chunk=default_instruments_per_chunk,
+                           parallelism=default_history_parallelism):
+        return self.flexfills_api.iter_order_history(
+            date_from, date_to, instruments, statues, chunk, instruments_per_chunk, parallelism)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def get_trade_positions(self):
+        return await self.flexfills_api.get_trade_positions()
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def trades_data_provider(self, exchange, instrument, period, timestamp, candle_count):
+        return await self.flexfills_api.trades_data_provider(
+            exchange, instrument, period, timestamp, candle_count)
+
+    def iter_candles(self, targets, count, end=None, parallelism=default_backfill_parallelism,
+                     rate=default_backfill_rate, page_size=default_backfill_page_size):
+        return self.flexfills_api.iter_candles(targets, count, end, parallelism, rate, page_size)
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def get_exchange_names(self):
+        return await self.flexfills_api.get_exchange_names()
+
+    @handleAsyncAPIException(max_tries, retry_delay)
+    async def get_instruments_by_type(self, exchange, instrument_type):
+        return await self.flexfills_api.get_instruments_by_type(exchange, instrument_type)
+
+    def order_books(self, instruments):
+        return self.flexfills_api.order_books(instruments)
+
+    def public_trades(self, instruments):
+        return self.flexfills_api.public_trades(instruments)
+
+    def private_trades(self, instruments):
+        return self.flexfills_api.private_trades(instruments)
+
+
+class AsyncFlexfillsApiClient:
     """
     Flex Fills provides Quotes and Limit Order book for SPOT Crypto.
+
+    Every API method is a coroutine running on the caller's event loop, so many
+    requests and streams can be awaited concurrently over one shared connection.
     """
 
-    WS_URL_TEST = 'wss://uat.flexfills.com/exchange/ws'
+    WS_URL_TEST = WS_URL_TEST
 
-    WS_URL_PROD = 'wss://terminal.flexfills.com/exchange/ws'
+    WS_URL_PROD = WS_URL_PROD
 
-    def __init__(self, auth_token, is_test=False):
+    def __init__(self, auth_token, is_test=False, socket_url=None, warm_instruments=None,
+                 reference_cache=None, codec=None, token_manager=None, dispatcher=None,
+                 metrics=None, gateway_host=None, recorder=None, scheduler=None):
         self._is_test = is_test
-        self._socket_url = self.WS_URL_TEST if self._is_test else self.WS_URL_PROD
+        self._socket_url = socket_url or (
+            self.WS_URL_TEST if self._is_test else self.WS_URL_PROD)
+        self._gateway_host = gateway_host or (
+            BASE_DOMAIN_TEST if self._is_test else BASE_DOMAIN_PROD)
         self._auth_token = auth_token
         self._auth_header = {"Authorization": self._auth_token}
 
@@ -297,7 +560,229 @@ class FlexfillsApiClient:
         self.ssl_context.check_hostname = False
         self.ssl_context.verify_mode = ssl.CERT_NONE
 
-    def get_asset_list(self):
+        # JSON backend of every frame, orjson or msgspec when installed
+        self.codec = get_codec(codec)
+        self._templates = {}
+
+        # One authenticated connection shared by all requests and subscriptions
+        self._session = FlexfillsSession(
+            self._socket_url, self._auth_header, self.ssl_context, codec=self.codec,
+            dispatcher=dispatcher, recorder=recorder)
+        self.dispatcher = self._session.dispatcher
+
+        # Pairs to subscribe for private trades before the first order
+        self.warm_instruments = list(warm_instruments or [])
+
+        # Extra connections used to fetch history chunks concurrently
+        self._history_session_pool = []
+
+        # Threads of the blocking candle requests of iter_candles, created on first use
+        self._backfill_pool = None
+        self._backfill_workers = 0
+
+        # Optional ReferenceDataCache serving assets, instruments and exchanges
+        self.reference_cache = reference_cache
+
+        # Local order books, updated in place from every ORDER_BOOK_PUBLIC frame
+        self.order_book_store = OrderBookStore()
+        self._session.add_listener(
+            CH_ORDER_BOOK_PUBLIC, self.order_book_store.apply, inline=True)
+
+        # Market data subscriptions shared by several consumers
+        self.hub = AsyncSubscriptionHub(self)
+
+        # Local mirror of the open orders, positions and balances, started with state.start()
+        self.state = AsyncPrivateState(self)
+
+        # Latency histograms of every order, from validation to the first fill
+        self.metrics = metrics if metrics is not None else OrderMetrics()
+        self._session.add_listener(
+            CH_PRV_TRADE_PRIVATE, self.metrics.on_frame, inline=True)
+
+        # Optional OrderScheduler rate limiting and prioritizing the order messages
+        self.scheduler = scheduler
+
+        # Optional TokenManager pushing renewed tokens before the current one expires
+        self.token_manager = token_manager
+        if token_manager is not None:
+            token_manager.add_listener(self._on_auth_token)
+
+    async def close(self):
+        """ Closes the shared WebSocket connection.
+        """
+
+        if self.token_manager is not None:
+            self.token_manager.remove_listener(self._on_auth_token)
+
+        await self.state.stop()
+        await self._session.close()
+
+        for session in self._history_session_pool:
+            await session.close()
+
+        if self._backfill_pool is not None:
+            self._backfill_pool.shutdown(wait=False)
+            self._backfill_pool, self._backfill_workers = None, 0
+
+    async def reauthenticate(self, auth_token):
+        """ Signs the next messages and connections with a new auth token, keeping
+        the open connections and their subscriptions.
+        """
+
+        self.set_auth_token(auth_token)
+
+    def set_auth_token(self, auth_token):
+        # No await in between, so no message is built with a mix of both tokens
+        self._auth_token = auth_token
+        self._auth_header = {"Authorization": auth_token}
+        self._templates.clear()
+
+        for session in [self._session] + self._history_session_pool:
+            session.update_auth(auth_token)
+
+    def _on_auth_token(self, auth_token):
+        # Called from the token refresh thread, swap the token on the event loop
+        loop = self._session.loop
+        if loop is None or loop.is_closed() or _running_loop() is loop:
+            self.set_auth_token(auth_token)
+        else:
+            loop.call_soon_threadsafe(self.set_auth_token, auth_token)
+
+    def use_token_manager(self, token_manager):
+        """ Signs with the tokens of the TokenManager from now on. A client created without
+        a token, while the login runs in the background, gets its first token this way.
+        """
+
+        if self.token_manager is not None:
+            self.token_manager.remove_listener(self._on_auth_token)
+
+        self.token_manager = token_manager
+        token_manager.add_listener(self._on_auth_token)
+
+        self._on_auth_token(token_manager.get_token())
+
+    def fail_auth(self, error):
+        """ Fails the connections waiting for the first token when the login failed.
+        """
+
+        for session in [self._session] + self._history_session_pool:
+            session.fail_auth(error)
+
+    async def connect(self):
+        """ Opens the shared WebSocket connection ahead of the first request. A client
+        without a token yet waits for it first.
+        """
+
+        await self._session.connect()
+
+    async def warm_up(self, instruments=None):
+        """ Subscribes private trades of the instruments ahead of time, so orders for them
+        do not wait for a subscribe round trip.
+
+        Parameters:
+        ----------
+        instruments: list of pair of currencies, defaults to warm_instruments.
+
+        Returns:
+        -------
+        Return the subscribe response, or None when all pairs were already subscribed.
+
+        """
+
+        instruments = instruments if instruments is not None else self.warm_instruments
+        if not instruments:
+            return None
+
+        message = {
+            "command": "SUBSCRIBE",
+            "signature": self._auth_token,
+            "channel": CH_PRV_TRADE_PRIVATE,
+            "channelArgs": [
+                {
+                    "name": "instrument",
+                    "value": f"[{', '.join(instruments)}]"
+                }
+            ]
+        }
+
+        resp = await self._session.ensure_subscribed(message, self._validate_response)
+
+        return resp
+
+    def dispatch_stats(self):
+        """ Returns the callback queue depth, drop and conflation counters per channel.
+        """
+
+        return self.dispatcher.stats()
+
+    def add_listener(self, channel, callback, instruments=None):
+        """ Calls callback with every frame of the channel (of the instruments), without
+        subscribing. Returns the listener to pass to remove_listener().
+        """
+
+        return self._session.add_listener(channel, callback, instruments)
+
+    def remove_listener(self, listener):
+        self._session.remove_listener(listener)
+
+    async def replay(self, path, speed=None):
+        """ Replays a journal recorded by a JournalWriter through the receive path:
+        order books, listeners and subscription callbacks get the frames as if they
+        came from the connection. The requests and orders pending on the connection are
+        left alone, recorded responses never complete them.
+
+        Parameters:
+        ----------
+        path: Journal base path, or one journal file.
+        speed: None to replay as fast as possible, else the pace relative to the
+        recording (1 is real time, 10 ten times faster).
+
+        Returns:
+        -------
+        Return the number of frames replayed.
+
+        """
+
+        return await JournalReplayer(path).replay(self._session, speed)
+
+    def order_book(self, instrument):
+        """ Returns the local OrderBook of a subscribed instrument, or None before its first snapshot.
+        """
+
+        return self.order_book_store.get(instrument)
+
+    def active_subscriptions(self, channel=None):
+        """ Returns the instruments subscribed on the shared connection, per channel.
+        """
+
+        return self._session.registry.active(channel)
+
+    async def get_active_subscriptions(self):
+        """ Requests the active subscriptions from FlexFills and adds them to the registry.
+
+        Parameters:
+        ----------
+
+        Returns:
+        -------
+        Return the active subscriptions response.
+
+        """
+
+        message = {
+            "command": "GET",
+            "signature": self._auth_token,
+            "channel": CH_ACTIVE_SUBSCRIPTIONS
+        }
+
+        resp = await self._send_message(message)
+
+        if resp.get('event') != 'ERROR':
+            self._session.registry.seed(resp)
+
+        return resp
+
+    async def get_asset_list(self):
         """ Provides a list of supported assets and their trading specifications.
 
         Parameters:
@@ -313,11 +798,12 @@ class FlexfillsApiClient:
             "channel": CH_ASSET_LIST
         }
 
-        resp = asyncio.get_event_loop().run_until_complete(self._send_message(message))
+        resp = await self._cached(
+            DS_ASSETS, functools.partial(self._send_message, message))
 
         return resp
 
-    def get_instrument_list(self):
+    async def get_instrument_list(self):
         """ Provides a list of supported Instruments and their trading specifications.
         When no symbol is provided, all Instruments are returned, a specific Instrument is provided only selected is returned.
 
@@ -334,11 +820,12 @@ class FlexfillsApiClient:
             "channel": CH_INSTRUMENT_LIST
         }
 
-        resp = asyncio.get_event_loop().run_until_complete(self._send_message(message))
+        resp = await self._cached(
+            DS_INSTRUMENTS, functools.partial(self._send_message, message))
 
         return resp
 
-    def subscribe_order_books(self, instruments, callback=None):
+    async def subscribe_order_books(self, instruments, callback=None):
         """ Provides streaming services a trading book (public trades) for selected symbol.
         Once subscribed updates will be pushed to user as they appear at FlexFills.
 
@@ -357,12 +844,11 @@ class FlexfillsApiClient:
                              "value": f"[{', '.join(instruments)}]"}]
         }
 
-        resp = asyncio.get_event_loop().run_until_complete(
-            self._send_message(message, callback))
+        resp = await self._send_message(message, callback)
 
         return resp
 
-    def unsubscribe_order_books(self, instruments):
+    async def unsubscribe_order_books(self, instruments):
         """ Provides streaming services a trading book (public trades) for selected symbol.
         Once subscribed updates will be pushed to user as they appear at FlexFills.
 
@@ -381,11 +867,14 @@ class FlexfillsApiClient:
                              "value": f"[{', '.join(instruments)}]"}]
         }
 
-        resp = asyncio.get_event_loop().run_until_complete(self._send_message(message))
+        resp = await self._send_message(message)
+
+        for instrument in instruments:
+            self.order_book_store.discard(instrument)
 
         return resp
 
-    def trade_book_public(self, instruments, callback=None):
+    async def trade_book_public(self, instruments, callback=None):
         """ Provides streaming services a trading book (public trades) for selected symbol.
         Once subscribed updates will be pushed to user as they appear at FlexFills.
 
@@ -404,12 +893,11 @@ class FlexfillsApiClient:
                             "value": f"[{', '.join(instruments)}]"}]
         }
 
-        resp = asyncio.get_event_loop().run_until_complete(
-            self._send_message(message, callback))
+        resp = await self._send_message(message, callback)
 
         return resp
 
-    def get_balance(self, currencies):
+    async def get_balance(self, currencies):
         """ Private trades subscription will provide a snapshot of
         currently open ACTIVE orders and then updates via WebSocket.
 
@@ -429,11 +917,11 @@ class FlexfillsApiClient:
             "channel": CH_PRV_BALANCE
         }
 
-        resp = asyncio.get_event_loop().run_until_complete(self._send_message(message))
+        resp = await self._send_message(message)
 
         return resp
 
-    def get_private_trades(self, instruments, callback=None):
+    async def get_private_trades(self, instruments, callback=None):
         """ Private trades subscription will provide a snapshot of
         currently open ACTIVE orders and then updates via WebSocket.
 
@@ -458,12 +946,11 @@ class FlexfillsApiClient:
             ]
         }
 
-        resp = asyncio.get_event_loop().run_until_complete(
-            self._send_message(message, callback))
+        resp = await self._send_message(message, callback)
 
         return resp
 
-    def get_open_orders_list(self, instruments=None):
+    async def get_open_orders_list(self, instruments=None):
         """ Get current list of open orders. One time request/response.
 
         Parameters:
@@ -494,137 +981,335 @@ class FlexfillsApiClient:
 
         message["channelArgs"] = channel_args
 
-        resp = asyncio.get_event_loop().run_until_complete(
-            self._send_message(message))
+        resp = await self._send_message(message)
 
         return resp
 
-    def create_order(self, order_datas):
+    async def create_order(self, order_datas, pipelined=False, max_in_flight=max_orders_in_flight):
         """ Send new order
 
         Parameters:
         ----------
         order_data: List of order objects, including globalInstrumentCd, clientOrderId, direction
-        orderType, timeInForce, price, amount
+        orderType, timeInForce, price, amount. Or the same fields as columns, a dict of
+        equal length lists or NumPy arrays, or a NumPy record array.
+        pipelined: Send all orders at once and match the responses by clientOrderId
+        instead of waiting for each response before sending the next order.
+        max_in_flight: Maximum number of pipelined orders awaiting a response.
 
         Returns:
         -------
-        Return current list of open orders.
+        Return the list of order responses, in the order of order_datas.
 
         """
 
-        if not order_datas:
+        if order_datas is None or len(order_datas) == 0:
             return None
 
-        required_keys = ['globalInstrumentCd', 'exchange',
-                         'direction', 'orderType', 'amount']
+        subscribe_message, message, traces = self._create_order_messages(
+            order_datas, pipelined)
 
-        optional_keys = ['exchangeName', 'orderSubType',
-                         'price', 'clientOrderId', 'timeInForce', 'tradeSide']
+        if pipelined:
+            resp = await self._subscribe_and_pipeline_messages(
+                subscribe_message, message, max_in_flight, traces)
+        else:
+            resp = await self._subscribe_and_send_message(
+                subscribe_message, message, None, traces=traces)
 
-        valid_datas = []
-        for order_data in order_datas:
-            valid_data = self._validate_payload(
-                order_data, required_keys, optional_keys, 'order_data')
+        return resp
 
-            valid_data['class'] = 'Order'
+    async def iter_create_order(self, order_datas, max_in_flight=max_orders_in_flight):
+        """ Send new orders pipelined and yield each response as soon as it arrives.
+        Orders without clientOrderId are given a generated one.
 
-            if valid_data['orderType'] == 'LIMIT' and 'price' not in valid_data:
-                raise FlexfillsParamsException(
-                    "Price should be included in order_data.")
+        Parameters:
+        ----------
+        order_data: List of order objects, see create_order.
+        max_in_flight: Maximum number of orders awaiting a response.
 
-            valid_datas.append(valid_data)
+        Returns:
+        -------
+        Yield order responses in the order they arrive.
 
-        # Before sending the new order, request user must first be subscribed to desired pair, otherwise order will be rejected.
+        """
 
-        subscribe_message = {
-            "command": "SUBSCRIBE",
-            "signature": self._auth_token,
-            "channel": CH_PRV_TRADE_PRIVATE,
-            "channelArgs": [
-                {
-                    "name": "instrument",
-                    "value": f"[{str(valid_datas[0]['globalInstrumentCd'])}]"
-                }
-            ]
-        }
+        if order_datas is None or len(order_datas) == 0:
+            return
 
-        message = {
-            "command": "CREATE",
-            "signature": self._auth_token,
-            "channel": CH_PRV_TRADE_PRIVATE,
-            "data": valid_datas
-        }
+        subscribe_message, message, traces = self._create_order_messages(
+            order_datas, True)
 
-        resp = asyncio.get_event_loop().run_until_complete(
-            self._subscribe_and_send_message(subscribe_message, message, None))
+        async for resp in self._iter_pipelined_messages(
+                subscribe_message, message, max_in_flight, traces):
+            yield resp
+
+    async def cancel_order(self, order_datas, pipelined=False, max_in_flight=max_orders_in_flight):
+        if order_datas is None or len(order_datas) == 0:
+            return None
+
+        subscribe_message, message, traces = self._cancel_order_messages(order_datas)
+
+        if pipelined:
+            resp = await self._subscribe_and_pipeline_messages(
+                subscribe_message, message, max_in_flight, traces)
+        else:
+            resp = await self._subscribe_and_send_message(
+                subscribe_message, message, traces=traces)
 
         return resp
 
-    def cancel_order(self, order_datas):
-        if not order_datas:
-            return None
+    async def iter_cancel_order(self, order_datas, max_in_flight=max_orders_in_flight):
+        """ Cancel orders pipelined and yield each response as soon as it arrives.
+        """
 
-        required_keys = ['globalInstrumentCd', 'clientOrderId', 'direction',
-                         'orderType', 'timeInForce', 'price', 'amount', 'exchange']
+        if order_datas is None or len(order_datas) == 0:
+            return
 
-        valid_datas = []
-        for order_data in order_datas:
-            valid_data = self._validate_payload(
-                order_data, required_keys, [], 'order_data')
-            valid_data['class'] = "Order"
-            valid_datas.append(valid_data)
+        subscribe_message, message, traces = self._cancel_order_messages(order_datas)
 
-        subscribe_message = {
-            "command": "SUBSCRIBE",
-            "signature": self._auth_token,
-            "channel": CH_PRV_TRADE_PRIVATE,
-            "channelArgs": [
-                {
-                    "name": "instrument",
-                    "value": f"[{str(valid_datas[0]['globalInstrumentCd'])}]"
-                }
-            ]
-        }
+        async for resp in self._iter_pipelined_messages(
+                subscribe_message, message, max_in_flight, traces):
+            yield resp
+
+    async def modify_order(self, order_data):
+        start = time.perf_counter_ns()
+
+        order_payload = MODIFY_ORDER_SCHEMA.validate(order_data)
+
+        def message(data):
+            return {
+                "command": "MODIFY",
+                "signature": self._auth_token,
+                "channel": CH_PRV_TRADE_PRIVATE,
+                "data": [data]
+            }
+
+        trace = self.metrics.trace('MODIFY', order_payload['globalInstrumentCd'], start=start)
+        trace.mark(STAGE_VALIDATE, start)
+
+        resp = await self._order_request(
+            'MODIFY', message, order_payload, self._validate_response, trace=trace)
+
+        return resp
+
+    async def get_trade_history(self, date_from, date_to, instruments):
+        message = self._trade_history_message(date_from, date_to, instruments)
+
+        resp = await self._send_message(message)
+
+        return resp
+
+    async def get_order_history(self, date_from, date_to, instruments, statues):
+        message = self._order_history_message(
+            date_from, date_to, instruments, statues)
 
+        resp = await self._send_message(message)
+
+        return resp
+
+    async def iter_trade_history(self, date_from, date_to, instruments, chunk=default_history_chunk,
+                                 instruments_per_chunk=default_instruments_per_chunk,
+                                 parallelism=default_history_parallelism):
+        """ Streams trade history records, fetching the range in chunks concurrently.
+
+        Parameters:
+        ----------
+        date_from: Start date of required time frame, string or datetime. example: "2022-12-01T00:00:00"
+        date_to: End date of required time frame, string or datetime.
+        instruments: list of pair of currencies.
+        chunk: datetime.timedelta covered by one request.
+        instruments_per_chunk: Number of instruments covered by one request.
+        parallelism: Maximum number of concurrent requests, each on its own connection, at
+        least 1.
+
+        Returns:
+        -------
+        Yield trade records as their chunks arrive, without the duplicates of chunk boundaries.
+
+        """
+
+        async for record in self._iter_history(
+                lambda _from, _to, _instruments: self._trade_history_message(_from, _to, _instruments),
+                date_from, date_to, instruments, chunk, instruments_per_chunk, parallelism):
+            yield record
+
+    async def iter_order_history(self, date_from, date_to, instruments, statues,
+                                 chunk=default_history_chunk,
+                                 instruments_per_chunk=default_instruments_per_chunk,
+                                 parallelism=default_history_parallelism):
+        """ Streams order history records, fetching the range in chunks concurrently.
+        See iter_trade_history for the chunking parameters.
+        """
+
+        async for record in self._iter_history(
+                lambda _from, _to, _instruments: self._order_history_message(
+                    _from, _to, _instruments, statues),
+                date_from, date_to, instruments, chunk, instruments_per_chunk, parallelism):
+            yield record
+
+    async def get_trade_positions(self):
         message = {
-            "command": "CANCEL",
-            "signature": self._auth_token,
-            "channel": CH_PRV_TRADE_PRIVATE,
-            "data": valid_datas
+            "command": "GET",
+            "channel": CH_PRV_TRADE_POSITIONS
         }
 
-        resp = asyncio.get_event_loop().run_until_complete(
-            self._subscribe_and_send_message(subscribe_message, message))
+        resp = await self._send_message(message)
 
         return resp
 
-    def modify_order(self, order_data):
-        order_payload = {
-            "class": "Order",
-            "globalInstrumentCd": str(order_data['globalInstrumentCd']),
-            "orderId": str(order_data['orderId']),
-            "exchangeOrderId": str(order_data['exchangeOrderId'])
+    async def trades_data_provider(self, exchange, instrument, period, timestamp, candle_count):
+        print("Start tardes data provider function...")
+
+        if period not in PERIODS:
+            raise Exception('the period param is not correct')
+
+        provider_url = self._candles_url(exchange, instrument, period, timestamp, candle_count)
+
+        data = await self._run_blocking(
+            self._gateway_get, provider_url, "Could not connect to Data provider")
+
+        return data
+
+    async def iter_candles(self, targets, count, end=None, parallelism=default_backfill_parallelism,
+                           rate=default_backfill_rate, page_size=default_backfill_page_size):
+        """ Streams the candles of many (exchange, instrument, period) targets, fetching their
+        pages concurrently.
+
+        Parameters:
+        ----------
+        targets: list of (exchange, instrument, period) tuples or dicts with those keys.
+        count: Number of candles per target.
+        end: Epoch milliseconds of the last candle, now by default.
+        parallelism: Maximum number of concurrent page requests.
+        rate: Maximum page requests per second over all targets, or a scheduler.TokenBucket
+        shared with other backfills of the event loop. None for no limit.
+        page_size: Number of candles per trades_data_provider request.
+
+        Returns:
+        -------
+        Yield a backfill.BackfillResult per target as soon as all its pages arrived. A page
+        is retried alone, a target whose page failed every retry has error set.
+
+        """
+
+        if count <= 0:
+            raise FlexfillsParamsException('the count param should be greater than 0')
+
+        async for result in self._iter_candles(
+                backfill_targets(targets), count, end, parallelism, rate, page_size):
+            yield result
+
+    async def get_exchange_names(self):
+        print("Start to get exchange names...")
+
+        provider_url = "/gateway/hermes-eag-private/exchanges"
+
+        data = await self._cached(DS_EXCHANGES, functools.partial(
+            self._run_blocking, self._gateway_get, provider_url, "Could not connect to Exchange API"))
+
+        return data
+
+    async def get_instruments_by_type(self, exchange, instrument_type):
+        print("Start to get instruments by type...")
+
+        provider_url = f"/gateway/hermes-exchange-api-gateway/exchanges/{exchange}/instruments/{instrument_type}"
+
+        data = await self._cached(f"{DS_INSTRUMENTS_BY_TYPE}:{exchange}:{instrument_type}", functools.partial(
+            self._run_blocking, self._gateway_get, provider_url, "Could not connect to Exchange API"))
+
+        return data
+
+    async def order_books(self, instruments):
+        """ Streams order books of the instruments as an async iterator.
+        Unsubscribes when the iteration stops.
+
+        Parameters:
+        ----------
+        instruments: list of pair of currencies.
+
+        Returns:
+        -------
+        Yield order book frames as they are pushed by FlexFills.
+
+        """
+
+        message = {
+            "command": "SUBSCRIBE",
+            "channel": CH_ORDER_BOOK_PUBLIC,
+            "channelArgs": [{"name": "instrument",
+                             "value": f"[{', '.join(instruments)}]"}]
+        }
+
+        async for resp in self._stream(message):
+            yield resp
+
+    async def public_trades(self, instruments):
+        """ Streams public trades of the instruments as an async iterator.
+
+        Parameters:
+        ----------
+        instruments: list of pair of currencies.
+
+        Returns:
+        -------
+        Yield public trade frames as they are pushed by FlexFills.
+
+        """
+
+        message = {
+            "command": "SUBSCRIBE",
+            "channel": CH_TRADE_PUBLIC,
+            "channelArgs": [{"name": "instrument",
+                            "value": f"[{', '.join(instruments)}]"}]
         }
 
-        if 'price' in order_data:
-            order_payload['price'] = str(order_data['price'])
+        async for resp in self._stream(message):
+            yield resp
+
+    async def private_trades(self, instruments):
+        """ Streams private trades (order updates) of the instruments as an async iterator.
+
+        Parameters:
+        ----------
+        instruments: list of pair of currencies.
+
+        Returns:
+        -------
+        Yield private trade frames as they are pushed by FlexFills.
 
-        if 'amount' in order_data:
-            order_payload['amount'] = str(order_data['amount'])
+        """
 
         message = {
-            "command": "MODIFY",
+            "command": "SUBSCRIBE",
             "signature": self._auth_token,
             "channel": CH_PRV_TRADE_PRIVATE,
-            "data": [order_payload]
+            "channelArgs": [
+                {
+                    "name": "instrument",
+                    "value": f"[{', '.join(instruments)}]"
+                }
+            ]
         }
 
-        resp = asyncio.get_event_loop().run_until_complete(self._send_message(message))
+        async for resp in self._stream(message):
+            yield resp
 
-        return resp
+    # Protected Methods
 
-    def get_trade_history(self, date_from, date_to, instruments):
+    def _template(self, command, channel):
+        """ Returns the cached template of the signed messages of a command on a channel.
+        """
+
+        key = (command, channel)
+
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = MessageTemplate(
+                self.codec, command=command, signature=self._auth_token, channel=channel)
+
+        return template
+
+    def _trade_history_message(self, date_from, date_to, instruments):
         message = {
             "command": "GET",
             "signature": self._auth_token,
@@ -650,11 +1335,9 @@ class FlexfillsApiClient:
             ]
         }
 
-        resp = asyncio.get_event_loop().run_until_complete(self._send_message(message))
-
-        return resp
+        return message
 
-    def get_order_history(self, date_from, date_to, instruments, statues):
+    def _order_history_message(self, date_from, date_to, instruments, statues):
         message = {
             "command": "GET",
             "signature": self._auth_token,
@@ -686,196 +1369,423 @@ class FlexfillsApiClient:
             ]
         }
 
-        resp = asyncio.get_event_loop().run_until_complete(self._send_message(message))
+        return message
 
-        return resp
+    async def _iter_history(self, build_message, date_from, date_to, instruments, chunk,
+                            instruments_per_chunk, parallelism):
+        # Without a connection no chunk would ever be fetched
+        if parallelism < 1:
+            raise FlexfillsParamsException('the parallelism param should be greater than 0')
 
-    def get_trade_positions(self):
-        message = {
-            "command": "GET",
-            "channel": CH_PRV_TRADE_POSITIONS
-        }
+        date_ranges = date_chunks(date_from, date_to, chunk)
+        groups = [instruments[i:i + instruments_per_chunk]
+                  for i in range(0, len(instruments), instruments_per_chunk)] or [[]]
 
-        resp = asyncio.get_event_loop().run_until_complete(self._send_message(message))
+        jobs = collections.deque((group_index, range_index)
+                                 for range_index in range(len(date_ranges))
+                                 for group_index in range(len(groups)))
+        job_count = len(jobs)
 
-        return resp
+        sessions = self._history_sessions(min(parallelism, job_count))
 
-    def trades_data_provider(self, exchange, instrument, period, timestamp, candle_count):
-        print("Start tardes data provider function...")
+        # Bounded, so slow consumers pause the fetching instead of buffering the history
+        results = asyncio.Queue(maxsize=max(parallelism, 1))
 
-        if period not in PERIODS:
-            raise Exception('the period param is not correct')
+        async def worker(session):
+            try:
+                while jobs:
+                    group_index, range_index = jobs.popleft()
+                    message = build_message(
+                        *date_ranges[range_index], groups[group_index])
+
+                    resp = await session.request(message, self._validate_response)
+                    await results.put((group_index, range_index, resp, None))
+            except Exception as e:
+                await results.put((None, None, None, e))
+
+        workers = [asyncio.ensure_future(worker(session)) for session in sessions]
+        deduplicator = BoundaryDeduplicator()
+
+        try:
+            for _ in range(job_count):
+                group_index, range_index, resp, error = await results.get()
+
+                if error is not None:
+                    raise error
+
+                if resp.get('event') == 'ERROR':
+                    raise FlexfillsParamsException(str(resp))
+
+                records = deduplicator.filter(
+                    group_index, range_index, len(date_ranges) - 1, history_records(resp))
+
+                for record in records:
+                    yield record
+        finally:
+            for task in workers:
+                task.cancel()
+
+    def _history_sessions(self, count):
+        """ Returns `count` extra connections for history requests. Responses to GETs
+        on one channel carry no request id, so concurrent GETs need their own connection.
+        """
+
+        while len(self._history_session_pool) < count:
+            self._history_session_pool.append(FlexfillsSession(
+                self._socket_url, self._auth_header, self.ssl_context, codec=self.codec))
+
+        return self._history_session_pool[:count]
+
+    async def _iter_candles(self, targets, count, end, parallelism, rate, page_size):
+        from .candles import parse_candles
+
+        pages = {target: candle_pages(target[2], count, end, page_size) for target in targets}
+
+        # Target by target, so the first targets complete while the others are fetched
+        jobs = collections.deque((target, page_end, page_count)
+                                 for target in targets for page_end, page_count in pages[target])
+
+        fetched = {target: [] for target in targets}
+        failed = set()
+
+        bucket = rate if isinstance(rate, TokenBucket) else (TokenBucket(rate) if rate else None)
 
-        conn_url = BASE_DOMAIN_TEST if self._is_test else BASE_DOMAIN_PROD
-        context = ssl._create_unverified_context()
-        conn = http.client.HTTPSConnection(conn_url, context=context)
+        # Blocking pooled requests, bounded by the workers and by the pool of the host
+        executor = self._backfill_executor(max(parallelism, 1))
+        loop = asyncio.get_running_loop()
 
+        # Bounded, so slow consumers pause the fetching instead of buffering the candles
+        results = asyncio.Queue(maxsize=max(parallelism, 1))
+
+        async def fetch(target, page_end, page_count):
+            url = self._candles_url(target[0], target[1], target[2], page_end, page_count)
+            backoff = Backoff(max_delay=retry_delay)
+            attempts = 0
+
+            while True:
+                if bucket is not None:
+                    delay = bucket.delay()
+                    if delay:
+                        await asyncio.sleep(delay)
+                        continue
+
+                    bucket.take()
+
+                try:
+                    resp = await loop.run_in_executor(
+                        executor, self._gateway_get, url, "Could not connect to Data provider")
+
+                    return parse_candles(resp)
+                except Exception as e:
+                    attempts += 1
+
+                    if attempts >= max_tries or not should_retry(e, True):
+                        raise
+
+                    await asyncio.sleep(backoff.delay(attempts))
+
+        async def worker():
+            while jobs:
+                target, page_end, page_count = jobs.popleft()
+
+                # The target already failed, its result is out
+                if target in failed:
+                    continue
+
+                try:
+                    rows = await fetch(target, page_end, page_count)
+                except Exception as e:
+                    if target not in failed:
+                        failed.add(target)
+                        fetched.pop(target)
+                        await results.put(BackfillResult(*target, [], e))
+                    continue
+
+                # Another page of the target failed while this one was fetched
+                if target in failed:
+                    continue
+
+                fetched[target].append((page_end, page_count, rows))
+
+                if len(fetched[target]) == len(pages[target]):
+                    await results.put(BackfillResult(
+                        *target, merge_pages(target[2], fetched.pop(target)), None))
+
+        workers = [asyncio.ensure_future(worker())
+                   for _ in range(max(min(parallelism, len(jobs)), 1))]
+
+        try:
+            for _ in range(len(targets)):
+                yield await results.get()
+        finally:
+            for task in workers:
+                task.cancel()
+
+    def _backfill_executor(self, workers):
+        """ Returns the thread pool of the candle requests, shared by the backfills of the
+        client and replaced by a larger one when a backfill asks for more workers.
+        """
+
+        if self._backfill_pool is None or self._backfill_workers < workers:
+            # Not shut down, the backfills running on the old pool keep using it. Its idle
+            # threads exit once the last of them drops it.
+            self._backfill_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='FlexfillsBackfill')
+            self._backfill_workers = workers
+
+        return self._backfill_pool
+
+    def _candles_url(self, exchange, instrument, period, timestamp, candle_count):
         _exchange = exchange if exchange else 'FLEXFILLS'
         _instrument = instrument.replace('/', '%2F')
 
-        provider_url = f"/gateway/hermes-data-provider/trades/agg/{_exchange}?instrument={
-            _instrument}&period={period}&end={timestamp}&count={candle_count}"
+        return (f"/gateway/hermes-data-provider/trades/agg/{_exchange}"
+                f"?instrument={_instrument}&period={period}&end={timestamp}&count={candle_count}")
 
-        headers = {
-            'Accept': '*/*',
-            'Authorization': self._auth_token,
-        }
+    def _order_instruments(self, valid_datas):
+        return sorted({str(valid_data['globalInstrumentCd']) for valid_data in valid_datas})
 
-        conn.request("GET", provider_url, headers=headers)
-        res = conn.getresponse()
-        res_data = res.read()
+    def _create_order_messages(self, order_datas, pipelined=False):
+        start = time.perf_counter_ns()
 
-        if res.status != 200 or not res_data:
-            raise Exception(
-                f"Could not connect to Data provider: {res.reason}")
+        valid_datas = CREATE_ORDER_SCHEMA.validate_any(order_datas)
 
-        conn.close()
+        # Pipelined responses can only be matched by clientOrderId
+        if pipelined:
+            for valid_data in valid_datas:
+                if 'clientOrderId' not in valid_data:
+                    valid_data['clientOrderId'] = uuid.uuid4().hex
 
-        data = json.loads(res_data.decode("utf-8"))
+        traces = self._order_traces('CREATE', valid_datas, start)
 
-        return data
+        # Before sending the new order, request user must first be subscribed to desired pair, otherwise order will be rejected.
 
-    def get_exchange_names(self):
-        print("Start to get exchange names...")
+        subscribe_message = self._template('SUBSCRIBE', CH_PRV_TRADE_PRIVATE).render(
+            channelArgs=[
+                {
+                    "name": "instrument",
+                    "value": f"[{', '.join(self._order_instruments(valid_datas))}]"
+                }
+            ]
+        )
+
+        message = {
+            "command": "CREATE",
+            "signature": self._auth_token,
+            "channel": CH_PRV_TRADE_PRIVATE,
+            "data": valid_datas
+        }
 
-        conn_url = BASE_DOMAIN_TEST if self._is_test else BASE_DOMAIN_PROD
-        context = ssl._create_unverified_context()
-        conn = http.client.HTTPSConnection(conn_url, context=context)
+        return subscribe_message, message, traces
 
-        provider_url = "/gateway/hermes-eag-private/exchanges"
+    def _cancel_order_messages(self, order_datas):
+        start = time.perf_counter_ns()
 
-        headers = {
-            'Accept': '*/*',
-            'Authorization': self._auth_token,
+        valid_datas = CANCEL_ORDER_SCHEMA.validate_any(order_datas)
+        traces = self._order_traces('CANCEL', valid_datas, start)
+
+        subscribe_message = self._template('SUBSCRIBE', CH_PRV_TRADE_PRIVATE).render(
+            channelArgs=[
+                {
+                    "name": "instrument",
+                    "value": f"[{', '.join(self._order_instruments(valid_datas))}]"
+                }
+            ]
+        )
+
+        message = {
+            "command": "CANCEL",
+            "signature": self._auth_token,
+            "channel": CH_PRV_TRADE_PRIVATE,
+            "data": valid_datas
         }
 
-        conn.request("GET", provider_url, headers=headers)
-        res = conn.getresponse()
-        res_data = res.read()
+        return subscribe_message, message, traces
 
-        if res.status != 200 or not res_data:
-            raise Exception(
-                f"Could not connect to Exchange API: {res.reason}")
+    def _order_traces(self, command, valid_datas, start):
+        # The batch is validated in one pass, every order is given its share of it
+        per_order = (time.perf_counter_ns() - start) // max(len(valid_datas), 1)
 
-        conn.close()
+        traces = []
+        for valid_data in valid_datas:
+            trace = self.metrics.trace(command, valid_data['globalInstrumentCd'],
+                                       valid_data.get('clientOrderId'), start)
+            trace.mark(STAGE_VALIDATE, time.perf_counter_ns() - per_order)
+            traces.append(trace)
 
-        data = json.loads(res_data.decode("utf-8"))
+        return traces
 
-        return data
+    async def _subscribe_and_pipeline_messages(self, subscriber, message, max_in_flight, traces=None):
+        tasks = await self._pipeline_messages(subscriber, message, max_in_flight, traces)
+        if isinstance(tasks, dict):
+            return tasks
 
-    def get_instruments_by_type(self, exchange, instrument_type):
-        print("Start to get instruments by type...")
+        try:
+            return list(await asyncio.gather(*tasks))
+        finally:
+            for task in tasks:
+                task.cancel()
 
-        conn_url = BASE_DOMAIN_TEST if self._is_test else BASE_DOMAIN_PROD
-        context = ssl._create_unverified_context()
-        conn = http.client.HTTPSConnection(conn_url, context=context)
+    async def _iter_pipelined_messages(self, subscriber, message, max_in_flight, traces=None):
+        tasks = await self._pipeline_messages(subscriber, message, max_in_flight, traces)
+        if isinstance(tasks, dict):
+            yield tasks
+            return
 
-        provider_url = f"/gateway/hermes-exchange-api-gateway/exchanges/{
-            exchange}/instruments/{instrument_type}"
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _pipeline_messages(self, subscriber, message, max_in_flight, traces=None):
+        """ Subscribes, then sends one message per data item without waiting for
+        the previous responses. Returns the response tasks, or the subscribe error.
+        """
 
-        headers = {
-            'Accept': '*/*',
-            'Authorization': self._auth_token,
-        }
+        validated_subscribe_response = await self._session.ensure_subscribed(
+            subscriber, self._validate_response)
 
-        conn.request("GET", provider_url, headers=headers)
-        res = conn.getresponse()
-        res_data = res.read()
+        if validated_subscribe_response and validated_subscribe_response.get('event') == 'ERROR':
+            return validated_subscribe_response
 
-        if res.status != 200 or not res_data:
-            raise Exception(
-                f"Could not connect to Exchange API: {res.reason}")
+        client_order_ids = [str(data.get('clientOrderId'))
+                            for data in message.get('data')]
+        if len(set(client_order_ids)) != len(client_order_ids):
+            raise FlexfillsParamsException(
+                "clientOrderId should be unique in pipelined order_datas.")
 
-        conn.close()
+        semaphore = asyncio.Semaphore(max_in_flight)
 
-        data = json.loads(res_data.decode("utf-8"))
+        template = self._template(message.get('command'), message.get('channel'))
 
-        return data
+        traces = traces or [None] * len(client_order_ids)
 
-    # Protected Methods
+        def render(data):
+            return template.render(data=[data])
 
-    async def _subscribe_and_send_message(self, subscriber, message, callback=None, is_onetime=False):
-        try:
-            async with websockets.connect(self._socket_url, extra_headers=self._auth_header, ssl=self.ssl_context) as websocket:
-                await websocket.send(json.dumps(subscriber))
+        async def send(data, client_order_id, trace):
+            async with semaphore:
+                return await self._order_request(
+                    message.get('command'), render, data, self._validate_subscribe_response,
+                    max_frames=None, client_order_id=client_order_id, trace=trace)
 
-                subscribe_response = await websocket.recv()
-                is_valid_subscribe, validated_subscribe_response = self._validate_response(
-                    subscribe_response, subscriber)
+        return [asyncio.ensure_future(send(data, client_order_id, trace))
+                for data, client_order_id, trace in zip(message.get('data'), client_order_ids, traces)]
 
-                if validated_subscribe_response['event'] == 'ERROR':
-                    return validated_subscribe_response
+    async def _subscribe_and_send_message(self, subscriber, message, callback=None, is_onetime=False,
+                                          traces=None):
+        # Only subscribe the pairs without an active subscription
+        validated_subscribe_response = await self._session.ensure_subscribed(
+            subscriber, self._validate_response)
 
-                datas = message.get('data')
-                validated_resps = []
-                _message = message
+        if validated_subscribe_response and validated_subscribe_response.get('event') == 'ERROR':
+            return validated_subscribe_response
 
-                for data in datas:
-                    validated_resp = ''
-                    _message['data'] = [data]
+        if callback:
+            self._session.add_listener(
+                subscriber.get('channel'), callback, message_instruments(subscriber))
 
-                    await websocket.send(json.dumps(_message))
+        datas = message.get('data')
+        validated_resps = []
 
-                    while True:
-                        response = await websocket.recv()
+        template = self._template(message.get('command'), message.get('channel'))
 
-                        is_valid, validated_resp = self._validate_subscribe_response(
-                            response, message)
+        traces = traces or [None] * len(datas)
 
-                        if callback:
-                            callback(validated_resp)
-                        else:
-                            if is_onetime is True:
-                                break
+        def render(data):
+            return template.render(data=[data])
 
-                            if is_valid is True:
-                                break
+        for data, trace in zip(datas, traces):
+            client_order_id = data.get('clientOrderId')
 
-                    validated_resps.append(validated_resp)
+            validated_resp = await self._order_request(
+                message.get('command'), render, data, self._validate_subscribe_response,
+                is_onetime=is_onetime,
+                client_order_id=str(client_order_id) if client_order_id is not None else None,
+                trace=trace)
 
-                return validated_resps
+            validated_resps.append(validated_resp)
 
-        except (InvalidStatusCode, ConnectionClosedError) as e:
-            print(f"Error while connecting FlexfillsApi: {str(e)}")
-            raise FlexfillsConnectException
+        return validated_resps
+
+    async def _order_request(self, command, render, data, validator, trace=None, **kwargs):
+        """ Sends one order message, in its turn when a scheduler is set. render builds the
+        message of the order data, the scheduler may have merged coalesced modifies into it.
+        """
+
+        if self.scheduler is not None:
+            data, resp = await self.scheduler.schedule(command, data, trace)
+            if resp is not None:
+                return resp
+
+        return await self._session.request(render(data), validator, trace=trace, **kwargs)
+
+    async def _stream(self, message):
+        queue = asyncio.Queue()
+
+        # A coroutine callback always runs on the event loop, even with a dispatcher executor
+        async def put(frame):
+            queue.put_nowait(frame)
+
+        resp = await self._send_message(message, put)
+        if resp.get('event') == 'ERROR':
+            raise FlexfillsParamsException(str(resp))
 
-    async def _send_message(self, message, callback=None, is_onetime=False):
         try:
-            async with websockets.connect(self._socket_url, extra_headers=self._auth_header, ssl=self.ssl_context) as websocket:
-                await websocket.send(json.dumps(message))
+            while True:
+                yield await queue.get()
+        finally:
+            unsubscribe_message = dict(message)
+            unsubscribe_message['command'] = 'UNSUBSCRIBE'
+            try:
+                await self._send_message(unsubscribe_message)
+            except FlexfillsConnectException:
+                pass
+
+    async def _cached(self, key, loader):
+        if self.reference_cache is None:
+            return await loader()
 
-                count = 0
-                validated_resp = ''
+        return await self.reference_cache.get(key, loader)
 
-                while True:
-                    response = await websocket.recv()
+    async def _run_blocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(func, *args))
+
+    def _gateway_get(self, provider_url, error_message):
+        conn_url = self._gateway_host
+
+        headers = {
+            'Accept': '*/*',
+            'Authorization': self._auth_token,
+        }
 
-                    is_valid, validated_resp = self._validate_response(
-                        response, message)
+        # Keep-alive connections are shared by all clients of the process
+        res = get_pool(conn_url).request("GET", provider_url, headers=headers)
+        res_data = res.data
 
-                    if callback:
-                        callback(validated_resp)
-                    else:
-                        if is_onetime is True:
-                            break
+        if res.status != 200 or not res_data:
+            raise Exception(f"{error_message}: {res.reason}")
 
-                        if is_valid is True:
-                            break
+        data = self.codec.loads(res_data)
 
-                        if count >= 10:
-                            break
+        return data
 
-                        count += 1
+    async def _send_message(self, message, callback=None, is_onetime=False):
+        command = message.get('command')
 
-                return validated_resp
+        if command == 'SUBSCRIBE':
+            return await self._session.subscribe(
+                message, self._validate_response, callback, is_onetime)
 
-        except (InvalidStatusCode, ConnectionClosedError) as e:
-            print(f"Error while connecting FlexfillsApi: {str(e)}")
-            raise FlexfillsConnectException
+        if command == 'UNSUBSCRIBE':
+            return await self._session.unsubscribe(message, self._validate_response)
 
-    def _validate_response(self, response, message):
-        json_resp = json.loads(response)
+        return await self._session.request(message, self._validate_response, is_onetime)
 
+    def _validate_response(self, json_resp, message):
         if not message or 'command' not in message:
             return True, json_resp
 
@@ -890,9 +1800,7 @@ class FlexfillsApiClient:
 
         return True, json_resp
 
-    def _validate_subscribe_response(self, response, message):
-        json_resp = json.loads(response)
-
+    def _validate_subscribe_response(self, json_resp, message):
         if not message or 'command' not in message:
             return True, json_resp
 
@@ -906,43 +1814,182 @@ class FlexfillsApiClient:
 
         return False, json_resp
 
-    def _validate_payload(self, payload, required_keys, optional_keys, data_type=''):
-        valid_data = {}
-
-        if required_keys:
-            for k in required_keys:
-                if k in payload:
-                    valid_data[k] = str(payload.get(k))
-                else:
-                    raise FlexfillsParamsException(f"{k} field should be in the {
-                        data_type if data_type else 'payload data'}")
-
-        if optional_keys:
-            for k in optional_keys:
-                if k in payload:
-                    valid_data[k] = str(payload.get(k))
-
-        if 'direction' in payload:
-            if str(payload['direction']).upper() in ORDER_DIRECTIONS:
-                valid_data['direction'] = str(payload['direction']).upper()
-            else:
-                raise FlexfillsParamsException(
-                    f"the direction field is not valid in {data_type if data_type else 'payload data'}")
-
-        if 'orderType' in payload:
-            if str(payload['orderType']).upper() in ORDER_TYPES:
-                valid_data['orderType'] = str(payload['orderType']).upper()
-            else:
-                raise FlexfillsParamsException(
-                    f"the orderType field is not valid in {data_type if data_type else 'payload data'}")
-
-        if 'timeInForce' in payload:
-            if payload.get('timeInForce') is None:
-                valid_data['timeInForce'] = 'GTC'
-            elif str(payload['timeInForce']).upper() in TIME_IN_FORCES:
-                valid_data['timeInForce'] = str(payload['timeInForce']).upper()
-            else:
-                raise FlexfillsParamsException(
-                    f"the timeInForce field is not valid in {data_type if data_type else 'payload data'}")
-
-        return valid_data
+
+class FlexfillsApiClient:
+    """
+    Blocking Flex Fills client, a thin shim running AsyncFlexfillsApiClient on a
+    background event loop that keeps the shared connection and its subscriptions alive.
+    """
+
+    WS_URL_TEST = WS_URL_TEST
+
+    WS_URL_PROD = WS_URL_PROD
+
+    def __init__(self, auth_token, is_test=False, warm_instruments=None, reference_cache=None,
+                 codec=None, token_manager=None, dispatcher=None, metrics=None, socket_url=None,
+                 gateway_host=None, recorder=None, loop_thread=None, scheduler=None):
+        # A loop thread given by the caller, shared_loop_thread() for instance, is not
+        # stopped by close()
+        self._owns_loop_thread = loop_thread is None
+        self._loop_thread = loop_thread or EventLoopThread()
+
+        self._client = AsyncFlexfillsApiClient(
+            auth_token, is_test, socket_url or (self.WS_URL_TEST if is_test else self.WS_URL_PROD),
+            warm_instruments, reference_cache, codec, token_manager, dispatcher, metrics,
+            gateway_host, recorder, scheduler)
+
+        self._is_test = is_test
+        self._session = self._client._session
+        self.hub = SubscriptionHub(self)
+        self.state = PrivateState(self)
+        self.metrics = self._client.metrics
+
+    @property
+    def _auth_token(self):
+        return self._client._auth_token
+
+    def close(self):
+        """ Closes the shared WebSocket connection and stops its event loop, unless the
+        loop thread was given to the client.
+        """
+
+        try:
+            self._loop_thread.run(self._client.close())
+        finally:
+            if self._owns_loop_thread:
+                self._loop_thread.stop()
+
+    def reauthenticate(self, auth_token):
+        return self._loop_thread.run(self._client.reauthenticate(auth_token))
+
+    def use_token_manager(self, token_manager):
+        self._client.use_token_manager(token_manager)
+
+    def fail_auth(self, error):
+        self._client.fail_auth(error)
+
+    def connect(self):
+        return self._loop_thread.run(self._client.connect())
+
+    def warm_up(self, instruments=None):
+        return self._loop_thread.run(self._client.warm_up(instruments))
+
+    def active_subscriptions(self, channel=None):
+        return self._client.active_subscriptions(channel)
+
+    @property
+    def order_book_store(self):
+        return self._client.order_book_store
+
+    @property
+    def scheduler(self):
+        return self._client.scheduler
+
+    @scheduler.setter
+    def scheduler(self, scheduler):
+        self._client.scheduler = scheduler
+
+    def order_book(self, instrument):
+        return self._client.order_book(instrument)
+
+    def dispatch_stats(self):
+        return self._client.dispatch_stats()
+
+    def add_listener(self, channel, callback, instruments=None):
+        return self._client.add_listener(channel, callback, instruments)
+
+    def remove_listener(self, listener):
+        self._client.remove_listener(listener)
+
+    def replay(self, path, speed=None):
+        return self._loop_thread.run(self._client.replay(path, speed))
+
+    def get_active_subscriptions(self):
+        return self._loop_thread.run(self._client.get_active_subscriptions())
+
+    def get_asset_list(self):
+        return self._loop_thread.run(self._client.get_asset_list())
+
+    def get_instrument_list(self):
+        return self._loop_thread.run(self._client.get_instrument_list())
+
+    def subscribe_order_books(self, instruments, callback=None):
+        return self._loop_thread.run(
+            self._client.subscribe_order_books(instruments, callback))
+
+    def unsubscribe_order_books(self, instruments):
+        return self._loop_thread.run(
+            self._client.unsubscribe_order_books(instruments))
+
+    def trade_book_public(self, instruments, callback=None):
+        return self._loop_thread.run(
+            self._client.trade_book_public(instruments, callback))
+
+    def get_balance(self, currencies):
+        return self._loop_thread.run(self._client.get_balance(currencies))
+
+    def get_private_trades(self, instruments, callback=None):
+        return self._loop_thread.run(
+            self._client.get_private_trades(instruments, callback))
+
+    def get_open_orders_list(self, instruments=None):
+        return self._loop_thread.run(
+            self._client.get_open_orders_list(instruments))
+
+    def create_order(self, order_datas, pipelined=False, max_in_flight=max_orders_in_flight):
+        return self._loop_thread.run(
+            self._client.create_order(order_datas, pipelined, max_in_flight))
+
+    def cancel_order(self, order_datas, pipelined=False, max_in_flight=max_orders_in_flight):
+        return self._loop_thread.run(
+            self._client.cancel_order(order_datas, pipelined, max_in_flight))
+
+    def iter_create_order(self, order_datas, max_in_flight=max_orders_in_flight):
+        return self._loop_thread.iterate(
+            self._client.iter_create_order(order_datas, max_in_flight))
+
+    def iter_cancel_order(self, order_datas, max_in_flight=max_orders_in_flight):
+        return self._loop_thread.iterate(
+            self._client.iter_cancel_order(order_datas, max_in_flight))
+
+    def modify_order(self, order_data):
+        return self._loop_thread.run(self._client.modify_order(order_data))
+
+    def get_trade_history(self, date_from, date_to, instruments):
+        return self._loop_thread.run(
+            self._client.get_trade_history(date_from, date_to, instruments))
+
+    def get_order_history(self, date_from, date_to, instruments, statues):
+        return self._loop_thread.run(self._client.get_order_history(
+            date_from, date_to, instruments, statues))
+
+    def iter_trade_history(self, date_from, date_to, instruments, chunk=default_history_chunk,
+                           instruments_per_chunk=default_instruments_per_chunk,
+                           parallelism=default_history_parallelism):
+        return self._loop_thread.iterate(self._client.iter_trade_history(
+            date_from, date_to, instruments, chunk, instruments_per_chunk, parallelism))
+
+    def iter_order_history(self, date_from, date_to, instruments, statues, chunk=default_history_chunk,
+                           instruments_per_chunk=default_instruments_per_chunk,
+                           parallelism=default_history_parallelism):
+        return self._loop_thread.iterate(self._client.iter_order_history(
+            date_from, date_to, instruments, statues, chunk, instruments_per_chunk, parallelism))
+
+    def get_trade_positions(self):
+        return self._loop_thread.run(self._client.get_trade_positions())
+
+    def trades_data_provider(self, exchange, instrument, period, timestamp, candle_count):
+        return self._loop_thread.run(self._client.trades_data_provider(
+            exchange, instrument, period, timestamp, candle_count))
+
+    def iter_candles(self, targets, count, end=None, parallelism=default_backfill_parallelism,
+                     rate=default_backfill_rate, page_size=default_backfill_page_size):
+        return self._loop_thread.iterate(self._client.iter_candles(
+            targets, count, end, parallelism, rate, page_size))
+
+    def get_exchange_names(self):
+        return self._loop_thread.run(self._client.get_exchange_names())
+
+    def get_instruments_by_type(self, exchange, instrument_type):
+        return self._loop_thread.run(
+            self._client.get_instruments_by_type(exchange, instrument_type))
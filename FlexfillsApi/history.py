@@ -0,0 +1,98 @@
+import datetime
+import json
+
+HISTORY_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+default_history_chunk = datetime.timedelta(days=1)
+default_history_parallelism = 4
+default_instruments_per_chunk = 10
+
+# Ids of one record. Order ids are shared by the fills of an order, so they are not used:
+# records without an id are compared by their whole content
+_RECORD_ID_KEYS = ('id', 'tradeId', 'transactionId', 'executionId', 'fillId')
+
+
+def parse_date(value):
+    if isinstance(value, datetime.datetime):
+        return value
+
+    return datetime.datetime.fromisoformat(str(value).replace('Z', ''))
+
+
+def date_chunks(date_from, date_to, chunk=default_history_chunk):
+    """ Splits [date_from, date_to] into consecutive (date-from, date-to) string pairs
+    of at most `chunk` each. When date_to is missing it is now, and date_from 24 hours
+    before date_to, as the server defaults them.
+    """
+
+    end = parse_date(date_to) if date_to else datetime.datetime.utcnow().replace(microsecond=0)
+    start = parse_date(date_from) if date_from else end - datetime.timedelta(hours=24)
+
+    chunks = []
+    while start < end:
+        chunk_end = min(start + chunk, end)
+        chunks.append((start.strftime(HISTORY_DATE_FORMAT),
+                       chunk_end.strftime(HISTORY_DATE_FORMAT)))
+        start = chunk_end
+
+    return chunks
+
+
+def history_records(resp):
+    data = resp.get('data') if isinstance(resp, dict) else resp
+
+    if isinstance(data, dict):
+        return [data]
+
+    return list(data or [])
+
+
+def record_key(record):
+    if isinstance(record, dict):
+        for key in _RECORD_ID_KEYS:
+            if record.get(key) is not None:
+                return (key, str(record[key]))
+
+    return json.dumps(record, sort_keys=True, default=str)
+
+
+class BoundaryDeduplicator:
+    """
+    Drops the records repeated by adjacent date chunks of the same instrument group.
+    Records are only compared with those of the neighbouring chunks, repeated records
+    inside a chunk are kept. The keys of a chunk are only kept until both of its
+    neighbours are done, so memory does not grow with the length of the range.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._done = set()
+
+    def filter(self, group, index, last_index, records):
+        neighbours = [self._keys.get((group, index - 1)),
+                      self._keys.get((group, index + 1))]
+        neighbours = [keys for keys in neighbours if keys]
+
+        keys = set()
+        unique_records = []
+        for record in records:
+            key = record_key(record)
+            keys.add(key)
+
+            if any(key in neighbour for neighbour in neighbours):
+                continue
+
+            unique_records.append(record)
+
+        self._keys[(group, index)] = keys
+        self._done.add((group, index))
+
+        for i in (index - 1, index, index + 1):
+            if (group, i) in self._keys and self._is_settled(group, i, last_index):
+                del self._keys[(group, i)]
+
+        return unique_records
+
+    def _is_settled(self, group, index, last_index):
+        return ((index == 0 or (group, index - 1) in self._done) and
+                (index == last_index or (group, index + 1) in self._done))
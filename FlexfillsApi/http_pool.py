@@ -0,0 +1,180 @@
+import collections
+import gzip
+import http.client
+import ssl
+import threading
+import zlib
+
+from .constants import max_pool_connections
+
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                            BrokenPipeError, ConnectionResetError)
+
+
+class PooledResponse:
+    """
+    Fully read response of a pooled request.
+    """
+
+    __slots__ = ('status', 'reason', 'headers', 'data')
+
+    def __init__(self, status, reason, headers, data):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.data = data
+
+    def getheader(self, name, default=None):
+        values = self.headers.get_all(name)
+
+        return ', '.join(values) if values else default
+
+
+class _HTTPSConnection(http.client.HTTPSConnection):
+    """
+    HTTPS connection resuming the TLS session of its pool, so only the first
+    connection to a host pays for a full handshake.
+    """
+
+    def __init__(self, host, pool, **kwargs):
+        super().__init__(host, **kwargs)
+        self._pool = pool
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+
+        self.sock = self._context.wrap_socket(
+            self.sock, server_hostname=self.host, session=self._pool.tls_session)
+
+
+class HTTPSConnectionPool:
+    """
+    Thread-safe pool of keep-alive HTTPS connections to one host. At most
+    max_connections requests run at once, the others wait for a free connection.
+    Responses are requested gzip encoded and decoded transparently. With secure
+    False the connections are plain HTTP, for local servers.
+    """
+
+    def __init__(self, host, ssl_context=None, max_connections=max_pool_connections, timeout=30,
+                 secure=True):
+        self.host = host
+        self.timeout = timeout
+        self.secure = secure
+        self.tls_session = None
+
+        # context = ssl.create_default_context()
+        self._ssl_context = ssl_context or ssl._create_unverified_context()
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def request(self, method, url, body=None, headers=None):
+        """ Sends a request on a pooled connection and reads the whole response.
+
+        Parameters:
+        ----------
+        method: HTTP method.
+        url: Path and query of the request.
+        body: Optional request body.
+        headers: Optional dict of request headers.
+
+        Returns:
+        -------
+        Return a PooledResponse with the decoded body in data.
+
+        """
+
+        _headers = {'Accept-Encoding': 'gzip'}
+        _headers.update(headers or {})
+
+        with self._slots:
+            conn, reused = self._get_connection()
+
+            while True:
+                try:
+                    res = self._send(conn, method, url, body, _headers)
+                    break
+                except (OSError, http.client.HTTPException) as e:
+                    conn.close()
+
+                    # The server dropped an idle connection, retry once on a new one
+                    if not reused or not isinstance(e, _STALE_CONNECTION_ERRORS):
+                        raise
+
+                    conn, reused = self._new_connection(), False
+
+            try:
+                data = res.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                raise
+
+            if self.secure and conn.sock is not None:
+                self.tls_session = conn.sock.session
+
+            if res.will_close:
+                conn.close()
+            else:
+                with self._lock:
+                    self._idle.append(conn)
+
+        encoding = (res.getheader('Content-Encoding') or '').lower()
+        if encoding == 'gzip':
+            data = gzip.decompress(data)
+        elif encoding == 'deflate':
+            data = zlib.decompress(data)
+
+        return PooledResponse(res.status, res.reason, res.msg, data)
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.popleft().close()
+
+    def _send(self, conn, method, url, body, headers):
+        conn.request(method, url, body, headers)
+
+        return conn.getresponse()
+
+    def _get_connection(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+
+        return self._new_connection(), False
+
+    def _new_connection(self):
+        if not self.secure:
+            return http.client.HTTPConnection(self.host, timeout=self.timeout)
+
+        return _HTTPSConnection(self.host, self, context=self._ssl_context, timeout=self.timeout)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host, max_connections=None):
+    """ Returns the process wide connection pool of a host, creating it on first use.
+    A host given as http://host:port is reached over plain HTTP. A max_connections
+    given for an existing pool does not resize it.
+    """
+
+    with _pools_lock:
+        pool = _pools.get(host)
+
+        if pool is None:
+            secure = not host.startswith('http://')
+            pool = _pools[host] = HTTPSConnectionPool(
+                host if secure else host[len('http://'):],
+                max_connections=max_connections or max_pool_connections, secure=secure)
+
+        return pool
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+
+        _pools.clear()
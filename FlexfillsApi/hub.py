@@ -0,0 +1,248 @@
+import asyncio
+import collections
+import types
+
+from .constants import CH_ORDER_BOOK_PUBLIC, CH_TRADE_PUBLIC
+from .exceptions import FlexfillsParamsException
+from .session import frame_instruments
+
+HUB_CHANNELS = [CH_ORDER_BOOK_PUBLIC, CH_TRADE_PUBLIC]
+
+
+def freeze(value):
+    """ Returns a read-only copy of a decoded frame: dicts become mapping proxies and
+    lists become tuples, so one object can be shared by every consumer.
+    """
+
+    if isinstance(value, dict):
+        return types.MappingProxyType({k: freeze(v) for k, v in value.items()})
+
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+
+    return value
+
+
+class HubSubscription:
+    """
+    Handle of one consumer of the hub, pass it to unsubscribe() to leave.
+    """
+
+    __slots__ = ('channel', 'instruments', 'listener')
+
+    def __init__(self, channel, instruments, callback):
+        self.channel = channel
+        self.instruments = frozenset(instruments)
+
+        # Same layout as the session listeners, so the dispatcher can deliver to it
+        self.listener = [set(instruments), callback, channel, False]
+
+    @property
+    def closed(self):
+        return self.listener[1] is None
+
+    def __repr__(self):
+        return f"HubSubscription({self.channel!r}, {sorted(self.instruments)!r})"
+
+
+class AsyncSubscriptionHub:
+    """
+    Shares market data subscriptions between the consumers of one client. The server
+    subscription of a channel and instrument is sent for its first consumer and
+    removed when the last one leaves. Every frame is frozen once and the same
+    read-only object is handed to all the consumers of its instruments.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+        self._counts = collections.Counter()
+        self._pending = {}
+        self._consumers = collections.defaultdict(list)
+        self._listening = {}
+
+    def refcount(self, channel, instrument):
+        return self._counts[(channel, instrument)]
+
+    def consumers(self, channel=None):
+        if channel is not None:
+            return list(self._consumers.get(channel, []))
+
+        return [subscription for subscriptions in self._consumers.values()
+                for subscription in subscriptions]
+
+    async def subscribe(self, channel, instruments, callback):
+        """ Adds a consumer of the channel for the instruments.
+
+        Parameters:
+        ----------
+        channel: ORDER_BOOK_PUBLIC or TRADE_PUBLIC.
+        instruments: list of pair of currencies.
+        callback: Called with every frame of the instruments, as a read-only mapping.
+
+        Returns:
+        -------
+        Return a HubSubscription to pass to unsubscribe().
+
+        """
+
+        if channel not in HUB_CHANNELS:
+            raise FlexfillsParamsException(
+                f"channel should be one of {', '.join(HUB_CHANNELS)}")
+
+        instruments = list(dict.fromkeys(instruments))
+        subscription = HubSubscription(channel, instruments, callback)
+
+        self._listen(channel)
+
+        new = [i for i in instruments if self._counts[(channel, i)] == 0]
+        waiting = {self._pending[(channel, i)] for i in instruments
+                   if (channel, i) in self._pending and i not in new}
+
+        for instrument in instruments:
+            self._counts[(channel, instrument)] += 1
+
+        # Registered first, so the snapshot sent after the subscribe reaches it
+        self._consumers[channel].append(subscription)
+
+        try:
+            if new:
+                future = asyncio.get_running_loop().create_future()
+                for instrument in new:
+                    self._pending[(channel, instrument)] = future
+
+                try:
+                    resp = await self._subscribe(channel, new)
+                    if isinstance(resp, dict) and resp.get('event') == 'ERROR':
+                        raise FlexfillsParamsException(str(resp))
+
+                    future.set_result(resp)
+                except Exception as e:
+                    future.set_exception(e)
+                    future.exception()
+                    raise
+                finally:
+                    for instrument in new:
+                        self._pending.pop((channel, instrument), None)
+
+            # Other consumers of the same instruments wait for the subscribe in flight
+            for future in waiting:
+                await asyncio.shield(future)
+
+        except BaseException:
+            self._release(subscription)
+            raise
+
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        """ Removes a consumer, unsubscribing the instruments nobody else consumes.
+        """
+
+        if subscription.closed:
+            return None
+
+        unused = self._release(subscription)
+
+        # The hub drops its own listener only, those of other callers are kept
+        if not self._consumers.get(subscription.channel):
+            self._client._session.remove_listener(
+                self._listening.pop(subscription.channel, None))
+
+        if not unused:
+            return None
+
+        return await self._unsubscribe(subscription.channel, unused)
+
+    # Protected Methods
+
+    def _listen(self, channel):
+        if channel in self._listening:
+            return
+
+        async def fan_out(frame):
+            await self._fan_out(channel, frame)
+
+        self._listening[channel] = self._client._session.add_listener(channel, fan_out)
+
+    async def _fan_out(self, channel, frame):
+        subscriptions = self._consumers.get(channel)
+        if not subscriptions:
+            return
+
+        instruments = frame_instruments(frame)
+
+        listeners = [subscription.listener for subscription in subscriptions
+                     if not instruments or subscription.instruments & instruments]
+        if not listeners:
+            return
+
+        await self._client.dispatcher.deliver(freeze(frame), listeners)
+
+    def _release(self, subscription):
+        """ Drops the consumer and returns its instruments left without consumers.
+        """
+
+        subscriptions = self._consumers.get(subscription.channel, [])
+        if subscription in subscriptions:
+            subscriptions.remove(subscription)
+
+        subscription.listener[1] = None
+
+        unused = []
+        for instrument in subscription.instruments:
+            key = (subscription.channel, instrument)
+
+            self._counts[key] -= 1
+            if self._counts[key] <= 0:
+                del self._counts[key]
+                unused.append(instrument)
+
+        return sorted(unused)
+
+    async def _subscribe(self, channel, instruments):
+        if channel == CH_ORDER_BOOK_PUBLIC:
+            return await self._client.subscribe_order_books(instruments)
+
+        return await self._client.trade_book_public(instruments)
+
+    async def _unsubscribe(self, channel, instruments):
+        message = {
+            "command": "UNSUBSCRIBE",
+            "channel": channel,
+            "channelArgs": [{"name": "instrument",
+                             "value": f"[{', '.join(instruments)}]"}]
+        }
+
+        # Only the server subscription goes, the listeners of other callers are kept
+        resp = await self._client._session.unsubscribe(
+            message, self._client._validate_response, drop_listeners=False)
+
+        if channel == CH_ORDER_BOOK_PUBLIC:
+            for instrument in instruments:
+                self._client.order_book_store.discard(instrument)
+
+        return resp
+
+
+class SubscriptionHub:
+    """
+    Blocking twin of AsyncSubscriptionHub for FlexfillsApiClient, sharing the
+    consumers and refcounts of the client hub.
+    """
+
+    def __init__(self, client):
+        self._loop_thread = client._loop_thread
+        self._hub = client._client.hub
+
+    def refcount(self, channel, instrument):
+        return self._hub.refcount(channel, instrument)
+
+    def consumers(self, channel=None):
+        return self._hub.consumers(channel)
+
+    def subscribe(self, channel, instruments, callback):
+        return self._loop_thread.run(self._hub.subscribe(channel, instruments, callback))
+
+    def unsubscribe(self, subscription):
+        return self._loop_thread.run(self._hub.unsubscribe(subscription))
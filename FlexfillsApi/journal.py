@@ -0,0 +1,268 @@
+import asyncio
+import glob
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+from .constants import journal_max_bytes, journal_buffer_size, journal_flush_interval
+
+# File header, followed by records of a (length, receive time in ns) header and the frame
+MAGIC = b'FFJRNL\x01\x00'
+
+_RECORD = struct.Struct('<IQ')
+
+
+def journal_files(path):
+    """ Returns the files of a journal in order: the rotated files of the base path
+    (feed.ffj -> feed-000000.ffj, feed-000001.ffj, ...), or the path itself.
+    """
+
+    stem, suffix = os.path.splitext(path)
+    files = sorted(glob.glob(f"{glob.escape(stem)}-[0-9][0-9][0-9][0-9][0-9][0-9]{suffix}"))
+
+    if not files and os.path.isfile(path):
+        return [path]
+
+    return files
+
+
+def read_journal(path):
+    """ Yields (receive time in ns, frame bytes) of every record of one journal file.
+    A record cut short by a crash ends the file.
+    """
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < len(MAGIC):
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a FlexfillsApi journal")
+
+            unpack_from = _RECORD.unpack_from
+            header_size = _RECORD.size
+
+            offset = len(MAGIC)
+            while offset + header_size <= size:
+                length, timestamp = unpack_from(data, offset)
+
+                start = offset + header_size
+                offset = start + length
+                if offset > size:
+                    return
+
+                yield timestamp, data[start:offset]
+
+
+class JournalWriter:
+    """
+    Appends raw frames with their receive time (time.time_ns) to a length-prefixed
+    binary journal. Records are packed into an in-memory buffer and written by a
+    background thread, so recording costs the reader a struct pack and a copy.
+    The buffer is written once it holds buffer_size bytes or every flush_interval
+    seconds, so a quiet feed is on disk too. The journal is rotated to a new file
+    once a file would exceed max_bytes. Pass it as recorder to the client, and close
+    it when done. flush() can be called from any thread.
+    """
+
+    def __init__(self, path, max_bytes=journal_max_bytes, buffer_size=journal_buffer_size,
+                 flush_interval=journal_flush_interval):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.buffer_size = min(buffer_size, max(max_bytes // 4, 1))
+        self.flush_interval = flush_interval
+
+        self.frames = 0
+        self.bytes = 0
+        self.files = []
+
+        # Guards the buffer, appended by the recording thread and swapped by the others
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._queue = queue.Queue()
+        self._error = None
+
+        # Appends to an existing journal after its last file
+        self._stem, self._suffix = os.path.splitext(path)
+        self._index = sum(1 for file in journal_files(path) if file != path)
+        self._file = None
+        self._file_size = 0
+
+        self._thread = threading.Thread(
+            target=self._write_loop, name='FlexfillsApiJournal', daemon=True)
+        self._thread.start()
+
+    def record(self, frame, timestamp=None):
+        """ Appends a frame (str or bytes), received now unless timestamp (ns) is given.
+        """
+
+        if frame.__class__ is str:
+            frame = frame.encode('utf-8')
+
+        header = _RECORD.pack(len(frame), timestamp or time.time_ns())
+
+        with self._lock:
+            buffer = self._buffer
+            buffer += header
+            buffer += frame
+            size = len(buffer)
+
+        self.frames += 1
+
+        if size >= self.buffer_size:
+            self._hand_over()
+
+    __call__ = record
+
+    def flush(self):
+        """ Writes the buffered records and waits until they are on disk.
+        """
+
+        self._hand_over()
+        self._queue.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        self.flush()
+
+        self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Protected Methods
+
+    def _hand_over(self):
+        # Queued under the lock too, so chunks handed over by two threads stay in order
+        with self._lock:
+            if self._buffer:
+                self._queue.put(self._buffer)
+                self._buffer = bytearray()
+
+    def _write_loop(self):
+        while True:
+            try:
+                chunk = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._hand_over()
+                continue
+
+            try:
+                if chunk is None:
+                    if self._file is not None:
+                        self._file.close()
+                        self._file = None
+                    return
+
+                self._write(chunk)
+            except OSError as e:
+                self._error = e
+                print(f"Could not write FlexfillsApi journal: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, chunk):
+        # Chunks hold whole records, so rotating between them keeps records in one file
+        if self._file is None or (self._file_size > len(MAGIC)
+                                  and self._file_size + len(chunk) > self.max_bytes):
+            self._rotate()
+
+        self._file.write(chunk)
+        self._file.flush()
+
+        self._file_size += len(chunk)
+        self.bytes += len(chunk)
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+
+        path = f"{self._stem}-{self._index:06d}{self._suffix}"
+        self._index += 1
+
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._file_size = len(MAGIC)
+
+        self.files.append(path)
+
+
+class JournalReplayer:
+    """
+    Pushes the frames of a journal through the receive path of a session (decoding,
+    order books, listeners and dispatch queues), as if they came from the socket.
+    Recorded responses are not matched with the requests pending on the session.
+    With speed None frames are replayed as fast as possible, otherwise at speed
+    times the recorded pace (1 is real time).
+    """
+
+    def __init__(self, path, speed=None):
+        self.path = path
+        self.speed = speed
+
+        self.frames = 0
+
+    def __iter__(self):
+        for path in journal_files(self.path):
+            yield from read_journal(path)
+
+    async def replay(self, session, speed=None):
+        """ Replays the journal into the session and waits for the callbacks.
+
+        Returns:
+        -------
+        Return the number of frames replayed.
+
+        """
+
+        speed = speed if speed is not None else self.speed
+        loads = session.codec.loads
+        notify = session._notify
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first = None
+
+        frames = 0
+        for timestamp, frame in self:
+            if speed:
+                if first is None:
+                    first = timestamp
+
+                delay = (timestamp - first) / 1e9 / speed - (loop.time() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            try:
+                message = loads(frame)
+            except ValueError:
+                print(f"Invalid frame in FlexfillsApi journal: {bytes(frame)!r}")
+                continue
+
+            # Listeners only, a recorded response must not complete a live request
+            if isinstance(message, dict):
+                waiter = notify(message)
+                if waiter is not None:
+                    await waiter
+
+            frames += 1
+
+            # Lets the callback queues run between bursts
+            if not frames & 1023:
+                await asyncio.sleep(0)
+
+        await session.dispatcher.drain()
+
+        self.frames += frames
+
+        return frames
@@ -0,0 +1,234 @@
+import threading
+
+# Served by the client before the login completes, they do not sign any message
+_LOCAL_ATTRIBUTES = frozenset(['order_book', 'dispatch_stats', 'metrics'])
+
+
+def initialize(username, password, is_test=False, warm_instruments=None, reference_cache=None,
+               lazy=False):
+    """ Logs in and returns the FlexfillsApi of the account.
+
+    Parameters:
+    ----------
+    lazy: when True, returns a LazyFlexfillsApi at once. The imports, the login and the
+    first connection run in the background and the first call waits for them.
+
+    """
+
+    if lazy:
+        return LazyFlexfillsApi(username, password, is_test, warm_instruments, reference_cache)
+
+    from .flexfillsapi import FlexfillsApi
+
+    return FlexfillsApi(username, password, is_test, warm_instruments, reference_cache)
+
+
+async def initialize_async(username, password, is_test=False, warm_instruments=None,
+                           reference_cache=None, lazy=False):
+    """ Logs in and returns the AsyncFlexfillsApi of the account.
+
+    Parameters:
+    ----------
+    lazy: when True, returns once the login started, the first call waits for it.
+
+    """
+
+    from .flexfillsapi import AsyncFlexfillsApi
+
+    flexfills = AsyncFlexfillsApi(username, password, is_test, warm_instruments, reference_cache)
+    await flexfills.login_flexfills(background=lazy)
+
+    return flexfills
+
+
+class _Background:
+    """ Runs a function in a daemon thread, result() waits for it and returns its value
+    or raises its exception, in every thread that asks.
+    """
+
+    def __init__(self, name, func, *args):
+        self._done = threading.Event()
+        self._value = None
+        self._error = None
+
+        threading.Thread(target=self._run, args=(func,) + args, name=name, daemon=True).start()
+
+    def _run(self, func, *args):
+        try:
+            self._value = func(*args)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def failed(self):
+        return self._done.is_set() and self._error is not None
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError('FlexfillsApi is still initializing')
+
+        if self._error is not None:
+            raise self._error
+
+        return self._value
+
+
+class LazyFlexfillsApi:
+    """
+    FlexfillsApi initialized in the background, returned at once by initialize(lazy=True).
+
+    The client modules are imported and the client is created while the login requests
+    run, and the WebSocket connection is opened as soon as the token arrives. Every
+    FlexfillsApi method is available and the first call only waits for what it needs:
+    order_book, dispatch_stats and metrics wait for the client, the other methods for
+    the token too. A login or connection error is raised by the calls waiting for it,
+    and the next call logs in again.
+
+    token_manager replaces the TokenManager of the account and client_options are given
+    to FlexfillsApiClient (socket_url, gateway_host, codec...), gateway_host is also used
+    for the login.
+    """
+
+    def __init__(self, username, password, is_test=False, warm_instruments=None,
+                 reference_cache=None, token_manager=None, **client_options):
+        self.flexfills_username = username
+        self.is_test = is_test
+        self.warm_instruments = list(warm_instruments or [])
+        self.reference_cache = reference_cache
+
+        self._password = password
+        self._client_options = client_options
+        self._token_manager = token_manager
+
+        print("Initializing FlexfillsApi with provided credentials in the background...")
+
+        self._client = _Background('FlexfillsApiClient', self._create_client)
+
+        self._lock = threading.Lock()
+        self._start()
+
+    def __getattr__(self, name):
+        # Only called for the names not set on the instance
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        if name in _LOCAL_ATTRIBUTES:
+            return getattr(self._client.result(), name)
+
+        value = getattr(self._startup()[0].result(), name)
+
+        # Later calls go straight to the FlexfillsApi method
+        if callable(value):
+            self.__dict__[name] = value
+
+        return value
+
+    @property
+    def ready(self):
+        """ True once the login, the connection and the warm up completed.
+        """
+
+        return self._ready.done()
+
+    def wait(self, timeout=None):
+        """ Waits for the login, the first connection and the warm up.
+
+        Returns:
+        -------
+        Return this object, so initialize(..., lazy=True).wait() blocks like initialize().
+
+        """
+
+        self._startup()[1].result(timeout)
+
+        return self
+
+    def close(self):
+        """ Closes the client once its startup is over.
+        """
+
+        try:
+            self._ready.result()
+        except Exception:
+            pass
+
+        self._client.result().close()
+
+    # Protected Methods
+
+    def _start(self):
+        self._api = _Background('FlexfillsApiLogin', self._login, self._token_manager)
+        self._ready = _Background('FlexfillsApiConnect', self._connect, self._api)
+
+    def _startup(self):
+        """ Returns the login and connection backgrounds, started again when the last
+        attempt failed, so a transient error does not stick to the object.
+        """
+
+        with self._lock:
+            if self._api.failed() or self._ready.failed():
+                print("Retrying the FlexfillsApi initialization...")
+                self._start()
+
+            return self._api, self._ready
+
+    def _create_client(self):
+        from .flexfillsapi import FlexfillsApiClient
+        from .metrics import OrderMetrics
+        from .session import shared_loop_thread
+
+        # Same client as FlexfillsApi.login_flexfills creates
+        options = dict(metrics=OrderMetrics(account=self.flexfills_username),
+                       loop_thread=shared_loop_thread())
+        options.update(self._client_options)
+
+        # No token yet, the connection waits for the login
+        return FlexfillsApiClient(
+            None, self.is_test, warm_instruments=self.warm_instruments,
+            reference_cache=self.reference_cache, **options)
+
+    def _login(self, token_manager):
+        from .auth import get_token_manager
+
+        if token_manager is None:
+            token_manager = get_token_manager(self.flexfills_username, self._password, self.is_test,
+                                              self._client_options.get('gateway_host'))
+
+        try:
+            token_manager.get_token()
+        except Exception as e:
+            self._fail(e)
+            raise
+
+        client = self._client.result()
+        client.use_token_manager(token_manager)
+
+        from .flexfillsapi import FlexfillsApi
+
+        return FlexfillsApi(self.flexfills_username, self._password, self.is_test,
+                            self.warm_instruments, self.reference_cache, flexfills_api=client)
+
+    def _connect(self, api):
+        client = self._client.result()
+        api.result()
+
+        try:
+            client.connect()
+            client.warm_up()
+        except Exception as e:
+            print(f"Failed to initialize FlexfillsApi: {str(e)}")
+            raise
+
+        print("FlexfillsApi initialized successfully!")
+
+    def _fail(self, error):
+        print(f"Failed to initialize FlexfillsApi: {str(error)}")
+
+        try:
+            self._client.result().fail_auth(error)
+        except Exception:
+            pass
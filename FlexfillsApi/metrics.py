@@ -0,0 +1,351 @@
+import collections
+import socket
+import threading
+import time
+from array import array
+
+from .constants import CH_PRV_TRADE_PRIVATE
+from .records import frame_items
+
+# Order stages. validate, queue, serialize and send are the durations of those steps
+# in the client, ack, response and first_fill the time from the end of the send.
+# queue is only recorded with an OrderScheduler.
+STAGE_VALIDATE = 'validate'
+STAGE_QUEUE = 'queue'
+STAGE_SERIALIZE = 'serialize'
+STAGE_SEND = 'send'
+STAGE_ACK = 'ack'
+STAGE_RESPONSE = 'response'
+STAGE_FIRST_FILL = 'first_fill'
+
+STAGES = [STAGE_VALIDATE, STAGE_QUEUE, STAGE_SERIALIZE, STAGE_SEND, STAGE_ACK, STAGE_RESPONSE, STAGE_FIRST_FILL]
+
+FILL_STATUSES = ('FILLED', 'PARTIALLY_FILLED')
+
+DEFAULT_QUANTILES = (0.5, 0.99, 0.999)
+
+max_watched_fills = 10000  # Orders waiting for their first fill, the oldest are forgotten
+
+
+def quantile_name(quantile):
+    """ Returns the pNN name of a quantile: 0.5 -> p50, 0.999 -> p999.
+    """
+
+    return 'p' + f"{quantile * 100:g}".replace('.', '')
+
+
+class LatencyHistogram:
+    """
+    HDR style histogram of integer values (microseconds). Values are counted in
+    log-linear buckets: every power of two range is split in 2 ** (sub_bucket_bits - 1)
+    linear sub-buckets, which keeps the relative error of the reported quantiles
+    under 2 ** (1 - sub_bucket_bits) (0.8% by default) with a few KB of counters.
+    Recording is a handful of integer operations and never allocates once the
+    largest value has been seen.
+    """
+
+    __slots__ = ('sub_bucket_bits', 'count', 'total', 'min', 'max', '_half', '_counts')
+
+    def __init__(self, sub_bucket_bits=8):
+        self.sub_bucket_bits = sub_bucket_bits
+        self._half = 1 << (sub_bucket_bits - 1)
+        self._counts = array('Q')
+
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value, count=1):
+        value = max(int(value), 0)
+
+        magnitude = value.bit_length() - self.sub_bucket_bits
+        if magnitude <= 0:
+            index = value
+        else:
+            index = magnitude * self._half + (value >> magnitude)
+
+        counts = self._counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+
+        counts[index] += count
+        self.count += count
+        self.total += value * count
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def value_at_quantile(self, quantile):
+        """ Returns the highest value of the bucket holding the quantile (0 <= quantile <= 1).
+        """
+
+        if not self.count:
+            return None
+
+        rank = max(1, int(quantile * self.count + 0.5))
+
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return min(self._highest_value(index), self.max)
+
+        return self.max
+
+    def _highest_value(self, index):
+        if index < 2 * self._half:
+            return index
+
+        magnitude = index // self._half - 1
+        sub_bucket = index - magnitude * self._half
+
+        return ((sub_bucket + 1) << magnitude) - 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def merge(self, other):
+        for index, count in enumerate(other._counts):
+            if count:
+                if index >= len(self._counts):
+                    self._counts.extend([0] * (index + 1 - len(self._counts)))
+                self._counts[index] += count
+
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def reset(self):
+        self._counts = array('Q')
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def summary(self, quantiles=DEFAULT_QUANTILES):
+        summary = {'count': self.count, 'min': self.min, 'max': self.max, 'mean': self.mean}
+        for quantile in quantiles:
+            summary[quantile_name(quantile)] = self.value_at_quantile(quantile)
+
+        return summary
+
+
+class OrderTrace:
+    """
+    Timestamps of one order message through the client, recording every stage in
+    the histograms of its command and instrument as it is reached.
+    """
+
+    __slots__ = ('metrics', 'command', 'instrument', 'client_order_id', 'start', 'marks')
+
+    def __init__(self, metrics, command, instrument, client_order_id=None, start=None):
+        self.metrics = metrics
+        self.command = command
+        self.instrument = instrument
+        self.client_order_id = client_order_id
+        self.start = start or time.perf_counter_ns()
+        self.marks = {}
+
+    def mark(self, stage, since=None):
+        """ Records the stage once, measured from since (perf_counter_ns), or from the
+        end of the send for the stages after it.
+        """
+
+        if stage in self.marks:
+            return
+
+        now = time.perf_counter_ns()
+        self.marks[stage] = now
+
+        if since is None:
+            since = self.marks.get(STAGE_SEND, self.start)
+
+        self.metrics.record(stage, self.command, self.instrument, (now - since) // 1000)
+
+        if stage == STAGE_RESPONSE:
+            self.metrics.watch_fill(self)
+
+
+class OrderMetrics:
+    """
+    Latency histograms of the order stages, per stage, command and instrument, in
+    microseconds. Orders with a clientOrderId are watched on TRADE_PRIVATE until
+    their first fill. Histograms are recorded from the event loop thread only.
+    The account, when given, labels the exported metrics.
+    """
+
+    def __init__(self, sub_bucket_bits=8, account=None):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.account = account
+        self.histograms = {}
+
+        self._watching = collections.OrderedDict()
+
+    def trace(self, command, instrument, client_order_id=None, start=None):
+        return OrderTrace(self, command, instrument,
+                          str(client_order_id) if client_order_id is not None else None, start)
+
+    def record(self, stage, command, instrument, value):
+        key = (stage, command, instrument)
+
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram(self.sub_bucket_bits)
+
+        histogram.record(value)
+
+    def histogram(self, stage, command=None, instrument=None):
+        """ Returns the histogram of a stage, merged over the commands and instruments not given.
+        """
+
+        merged = LatencyHistogram(self.sub_bucket_bits)
+        for (_stage, _command, _instrument), histogram in list(self.histograms.items()):
+            if _stage == stage and command in (None, _command) and instrument in (None, _instrument):
+                merged.merge(histogram)
+
+        return merged
+
+    def snapshot(self, quantiles=DEFAULT_QUANTILES):
+        """ Returns the summary (count, min, max, mean and quantiles) of every histogram.
+        """
+
+        return [dict(stage=stage, command=command, instrument=instrument,
+                     **histogram.summary(quantiles))
+                for (stage, command, instrument), histogram in sorted(list(self.histograms.items()))]
+
+    def reset(self):
+        self.histograms = {}
+
+    def watch_fill(self, trace):
+        if trace.command != 'CREATE' or trace.client_order_id is None:
+            return
+
+        self._watching[trace.client_order_id] = trace
+        while len(self._watching) > max_watched_fills:
+            self._watching.popitem(last=False)
+
+    def on_frame(self, frame):
+        """ Records the first fill of the watched orders, registered as a TRADE_PRIVATE listener.
+        """
+
+        if not self._watching or frame.get('channel') != CH_PRV_TRADE_PRIVATE:
+            return
+
+        for item in frame_items(frame):
+            client_order_id = item.get('clientOrderId')
+            if client_order_id is None or str(item.get('status')).upper() not in FILL_STATUSES:
+                continue
+
+            trace = self._watching.pop(str(client_order_id), None)
+            if trace is not None:
+                trace.mark(STAGE_FIRST_FILL)
+
+    __call__ = on_frame
+
+    def to_prometheus(self, name='flexfills_order_latency_microseconds', quantiles=DEFAULT_QUANTILES):
+        """ Returns the histograms as Prometheus text exposition summaries.
+        """
+
+        return to_prometheus([self], name, quantiles)
+
+    def _prometheus_samples(self, name, quantiles):
+        account = f'account="{self.account}",' if self.account is not None else ''
+
+        lines = []
+        for (stage, command, instrument), histogram in sorted(list(self.histograms.items())):
+            labels = f'{account}stage="{stage}",command="{command}",instrument="{instrument}"'
+
+            for quantile in quantiles:
+                lines.append(f'{name}{{{labels},quantile="{quantile}"}} '
+                             f'{histogram.value_at_quantile(quantile)}')
+
+            lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        return lines
+
+
+def to_prometheus(metrics, name='flexfills_order_latency_microseconds', quantiles=DEFAULT_QUANTILES):
+    """ Returns the histograms of several OrderMetrics, one per account, as one Prometheus
+    text exposition.
+    """
+
+    lines = [f"# HELP {name} Flexfills order stage latency in microseconds",
+             f"# TYPE {name} summary"]
+
+    for order_metrics in metrics:
+        lines += order_metrics._prometheus_samples(name, quantiles)
+
+    return '\n'.join(lines) + '\n'
+
+
+class StatsDExporter:
+    """
+    Sends the quantiles and counts of the order histograms to StatsD as gauges, once
+    with send() or every interval seconds from a background thread with start().
+    """
+
+    def __init__(self, metrics, host='127.0.0.1', port=8125, prefix='flexfills.order',
+                 quantiles=DEFAULT_QUANTILES):
+        self.metrics = metrics
+        self.address = (host, port)
+        self.prefix = prefix
+        self.quantiles = quantiles
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def lines(self):
+        lines = []
+
+        prefix = self.prefix
+        if self.metrics.account is not None:
+            prefix = f"{prefix}.{self.metrics.account}"
+
+        # Called from the exporter thread while the loop adds histograms, so iterate a copy
+        for (stage, command, instrument), histogram in sorted(list(self.metrics.histograms.items())):
+            key = f"{prefix}.{stage}.{command}.{str(instrument).replace('/', '_')}"
+
+            for quantile in self.quantiles:
+                lines.append(f"{key}.{quantile_name(quantile)}:{histogram.value_at_quantile(quantile)}|g")
+
+            lines.append(f"{key}.count:{histogram.count}|g")
+
+        return lines
+
+    def send(self):
+        # Several metrics per datagram, kept under a safe UDP payload size
+        packet = ''
+        for line in self.lines():
+            if packet and len(packet) + len(line) + 1 > 1400:
+                self._socket.sendto(packet.encode('utf-8'), self.address)
+                packet = ''
+
+            packet = f"{packet}\n{line}" if packet else line
+
+        if packet:
+            self._socket.sendto(packet.encode('utf-8'), self.address)
+
+    def start(self, interval=10):
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name='FlexfillsApiStatsD', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                self.send()
+            except OSError as e:
+                print(f"Could not send FlexfillsApi metrics to StatsD: {str(e)}")
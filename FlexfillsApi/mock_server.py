@@ -0,0 +1,737 @@
+import argparse
+import asyncio
+import base64
+import collections
+import gzip
+import http
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import websockets
+
+from .constants import (CH_ASSET_LIST, CH_INSTRUMENT_LIST, CH_ORDER_BOOK_PUBLIC, CH_TRADE_PUBLIC,
+                        CH_ACTIVE_SUBSCRIPTIONS, CH_PRV_BALANCE, CH_PRV_TRADE_PRIVATE,
+                        CH_PRV_TRADE_POSITIONS, PERIOD_SECONDS)
+from .scheduler import TokenBucket
+from .session import message_instruments
+
+DEFAULT_INSTRUMENTS = ['BTC/USD', 'ETH/USD', 'ETH/BTC', 'SOL/USD']
+
+ORDER_REQUIRED_KEYS = ['globalInstrumentCd', 'exchange', 'direction', 'orderType', 'amount']
+
+ORDER_COMMANDS = ('CREATE', 'CANCEL', 'MODIFY')
+
+_BOOK_VARIANTS = 64  # Pre-encoded snapshots cycled per instrument, so streaming costs no encoding
+
+
+def make_token(ttl=3600, subject='mock'):
+    """ Returns an unsigned JWT expiring in ttl seconds, as issued by the mock login.
+    """
+
+    def encode(part):
+        return base64.urlsafe_b64encode(json.dumps(part).encode('utf-8')).rstrip(b'=').decode('ascii')
+
+    return f"{encode({'alg': 'none'})}.{encode({'sub': subject, 'exp': int(time.time() + ttl)})}.mock"
+
+
+def _base_price(instrument):
+    return 10 + random.Random(instrument).random() * 50000
+
+
+def _channel_arg(message, name):
+    for channel_arg in message.get('channelArgs') or []:
+        if channel_arg.get('name') == name:
+            return channel_arg.get('value')
+
+    return None
+
+
+class MockFlexfillsServer:
+    """
+    Local stand-in of FlexFills, for tests and benchmarks without network access.
+
+    The WebSocket endpoint answers SUBSCRIBE, UNSUBSCRIBE, GET, CREATE, CANCEL and
+    MODIFY with an ACK followed by the response, or an ERROR. It streams order book
+    snapshots of the subscribed instruments at book_rate updates per second per
+    instrument (and public trades at trade_rate), fills MARKET orders at once and
+    keeps the other orders open until cancelled, rejecting the order messages over
+    order_rate per second when set, in bursts of up to order_burst (order_rate by
+    default). The REST endpoint serves the login
+    and the candle, exchange and instrument gateway paths over plain HTTP. Candle
+    requests take candle_delay seconds, and candle_error_rate of them fail with 503.
+
+    Both endpoints run in background threads, start() returns once they listen.
+    Pass url as socket_url and gateway_host as gateway_host to the clients.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, rest_port=0, book_rate=10, book_depth=20,
+                 trade_rate=0, instruments=None, auth_token=None, response_delay=0, token_ttl=3600,
+                 login_delay=0, order_rate=0, candle_delay=0, candle_error_rate=0,
+                 order_burst=None):
+        self.host = host
+        self.port = port
+        self.rest_port = rest_port
+        self.book_rate = book_rate
+        self.book_depth = book_depth
+        self.trade_rate = trade_rate
+        self.instruments = list(instruments or DEFAULT_INSTRUMENTS)
+        self.auth_token = auth_token
+        self.response_delay = response_delay
+        self.token_ttl = token_ttl
+        self.login_delay = login_delay
+        self.order_rate = order_rate
+        self.order_burst = order_burst
+        self.candle_delay = candle_delay
+        self.candle_error_rate = candle_error_rate
+
+        # Frames, messages and orders handled since start
+        self.stats = collections.Counter()
+
+        self.open_orders = collections.OrderedDict()
+        self.orders = []
+        self.trades = []
+        self.positions = collections.defaultdict(float)
+        self.balances = collections.defaultdict(lambda: 1000000.0)
+
+        self._ids = itertools.count(1)
+        self._books = {}
+        self._connections = set()
+
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._http = None
+        self._error = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}/exchange/ws"
+
+    @property
+    def gateway_host(self):
+        return f"http://{self.host}:{self.rest_port}"
+
+    def start(self):
+        ready = threading.Event()
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_loop, args=(ready,), name='FlexfillsMockServer', daemon=True)
+        self._thread.start()
+
+        ready.wait()
+        if self._error is not None:
+            raise self._error
+
+        self._http = ThreadingHTTPServer(
+            (self.host, self.rest_port), type('RestHandler', (_RestHandler,), {'mock': self}))
+        self._http.daemon_threads = True
+        self.rest_port = self._http.server_address[1]
+
+        threading.Thread(target=self._http.serve_forever,
+                         name='FlexfillsMockRest', daemon=True).start()
+
+        return self
+
+    def stop(self):
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+            self._http = None
+
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def drop_connections(self):
+        """ Closes every client connection, to exercise the reconnects.
+        """
+
+        for connection in list(self._connections):
+            self._loop.call_soon_threadsafe(
+                lambda websocket=connection.websocket: asyncio.ensure_future(websocket.close()))
+
+    def push(self, frame):
+        """ Sends an unsolicited frame, a fill made elsewhere for instance, to every client.
+        """
+
+        async def send():
+            for connection in list(self._connections):
+                await connection.send(frame)
+
+        asyncio.run_coroutine_threadsafe(send(), self._loop).result()
+
+    def issue_token(self):
+        return self.auth_token or make_token(self.token_ttl)
+
+    def book_frame(self, instrument, timestamp=None):
+        """ Returns the encoded ORDER_BOOK_PUBLIC snapshot of the next book of the instrument.
+        """
+
+        bodies = self._books.get(instrument)
+        if bodies is None:
+            bodies = self._books[instrument] = itertools.cycle(self._book_bodies(instrument))
+
+        timestamp = timestamp or int(time.time() * 1000)
+
+        return (f'{{"channel":"{CH_ORDER_BOOK_PUBLIC}","data":{{"timestamp":{timestamp},'
+                f'{next(bodies)}}}}}')
+
+    def trade_frame(self, instrument):
+        price = _base_price(instrument) * (1 + random.uniform(-0.001, 0.001))
+
+        return json.dumps({
+            "channel": CH_TRADE_PUBLIC,
+            "data": [{
+                "globalInstrumentCd": instrument,
+                "tradeId": next(self._ids),
+                "price": f"{price:.2f}",
+                "amount": f"{random.uniform(0.001, 2):.4f}",
+                "direction": random.choice(['BUY', 'SELL']),
+                "timestamp": int(time.time() * 1000),
+            }]
+        })
+
+    def candles(self, instrument, period, end, count):
+        """ Returns count candles of the period ending at end (epoch ms), the same on every call.
+        """
+
+        step = PERIOD_SECONDS[period] * 1000
+        last = end - end % step
+
+        candles = []
+        for k in range(count):
+            timestamp = last - (count - 1 - k) * step
+            rnd = random.Random(f"{instrument}:{timestamp}")
+
+            _open = _base_price(instrument) * (1 + rnd.uniform(-0.05, 0.05))
+            close = _open * (1 + rnd.uniform(-0.01, 0.01))
+
+            candles.append({
+                "timestamp": timestamp,
+                "open": round(_open, 2),
+                "high": round(max(_open, close) * (1 + rnd.uniform(0, 0.005)), 2),
+                "low": round(min(_open, close) * (1 - rnd.uniform(0, 0.005)), 2),
+                "close": round(close, 2),
+                "volume": round(rnd.uniform(0, 100), 4),
+            })
+
+        return candles
+
+    def balance_records(self, currencies):
+        return [{"currency": currency, "amount": f"{self.balances[currency]:.8f}",
+                 "available": f"{self.balances[currency]:.8f}"} for currency in currencies]
+
+    def fill(self, order):
+        """ Fills an order at its price, or the base price of its instrument, moving the
+        position and the balances. Returns the currencies of the balances changed.
+        """
+
+        instrument = order['globalInstrumentCd']
+        amount = float(order['amount'])
+        price = float(order.get('price') or round(_base_price(instrument), 2))
+        sign = -1 if str(order.get('direction')).upper() == 'SELL' else 1
+
+        order.update(status='FILLED', filledAmount=str(order['amount']), avgPrice=str(price))
+
+        self.trades.append(dict(order, tradeId=str(next(self._ids)), timestamp=int(time.time() * 1000)))
+        self.stats['fills'] += 1
+
+        self.positions[instrument] += sign * amount
+
+        base, quote = instrument.split('/')[0], instrument.split('/')[-1]
+        self.balances[base] += sign * amount
+        self.balances[quote] -= sign * amount * price
+
+        return [base, quote]
+
+    # Protected Methods
+
+    def _book_bodies(self, instrument):
+        rnd = random.Random(instrument)
+        mid = _base_price(instrument)
+        tick = mid * 0.0001
+
+        bodies = []
+        for _ in range(_BOOK_VARIANTS):
+            mid += rnd.uniform(-5, 5) * tick
+
+            data = {
+                "globalInstrumentCd": instrument,
+                "bids": [{"price": f"{mid - (i + 1) * tick:.2f}", "amount": f"{rnd.uniform(0.01, 5):.4f}"}
+                         for i in range(self.book_depth)],
+                "asks": [{"price": f"{mid + (i + 1) * tick:.2f}", "amount": f"{rnd.uniform(0.01, 5):.4f}"}
+                         for i in range(self.book_depth)],
+            }
+
+            bodies.append(json.dumps(data, separators=(',', ':'))[1:-1])
+
+        return bodies
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+
+        try:
+            self._loop.run_until_complete(self._serve())
+        except Exception as e:
+            self._error = e
+            ready.set()
+            return
+
+        ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _serve(self):
+        self._server = await websockets.serve(
+            self._handler, self.host, self.port, process_request=self._process_request,
+            max_size=None)
+
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _close(self):
+        for connection in list(self._connections):
+            connection.close()
+
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _process_request(self, path, request_headers):
+        if self.auth_token is not None and request_headers.get('Authorization') != self.auth_token:
+            return http.HTTPStatus.UNAUTHORIZED, [], b'Invalid auth token\n'
+
+        return None
+
+    async def _handler(self, websocket, path=None):
+        connection = _MockConnection(self, websocket)
+
+        self._connections.add(connection)
+        self.stats['connections'] += 1
+
+        try:
+            async for raw in websocket:
+                await connection.handle(raw)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            connection.close()
+            self._connections.discard(connection)
+
+
+class _MockConnection:
+    """
+    One client connection of the mock server: its subscriptions and market data publisher.
+    """
+
+    def __init__(self, server, websocket):
+        self.server = server
+        self.websocket = websocket
+        self.subscriptions = collections.defaultdict(set)
+
+        self._publisher = None
+
+        # Order messages per second allowed on the connection, the others are rejected
+        self._order_bucket = TokenBucket(server.order_rate, server.order_burst) if server.order_rate else None
+
+        self._handlers = {
+            'SUBSCRIBE': self._subscribe,
+            'UNSUBSCRIBE': self._unsubscribe,
+            'GET': self._get,
+            'CREATE': self._create,
+            'CANCEL': self._cancel,
+            'MODIFY': self._modify,
+        }
+
+    async def send(self, frame):
+        await self.websocket.send(frame if isinstance(frame, str) else json.dumps(frame))
+        self.server.stats['frames'] += 1
+
+    async def error(self, channel, text, item=None, command=None):
+        frame = {"event": "ERROR", "channel": channel, "message": text}
+
+        # Responses echo the command of their request, streamed frames have none
+        if command is not None:
+            frame["command"] = command
+
+        # Order errors name the order, so the client can match them
+        if item is not None and item.get('clientOrderId') is not None:
+            frame["data"] = [{"clientOrderId": item['clientOrderId'], "message": text}]
+
+        await self.send(frame)
+
+    async def handle(self, raw):
+        self.server.stats['messages'] += 1
+
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return await self.error(None, 'Invalid JSON message')
+
+        command = message.get('command')
+        channel = message.get('channel')
+
+        handler = self._handlers.get(command)
+        if handler is None:
+            return await self.error(channel, f"Unknown command {command}", command=command)
+
+        if command in ORDER_COMMANDS and self._order_bucket is not None:
+            if self._order_bucket.delay():
+                self.server.stats['rate_limited'] += 1
+                return await self.error(channel, 'Rate limit exceeded', (message.get('data') or [{}])[0],
+                                        command)
+
+            self._order_bucket.take()
+
+        await self.send({"event": "ACK", "channel": channel, "command": command})
+
+        if not self.server.response_delay:
+            return await handler(message)
+
+        asyncio.ensure_future(self._respond_later(handler, message))
+
+    def close(self):
+        if self._publisher is not None:
+            self._publisher.cancel()
+            self._publisher = None
+
+    async def _respond_later(self, handler, message):
+        await asyncio.sleep(self.server.response_delay)
+
+        try:
+            await handler(message)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _subscribe(self, message):
+        channel = message.get('channel')
+        instruments = message_instruments(message) or set()
+
+        if channel in (CH_ORDER_BOOK_PUBLIC, CH_TRADE_PUBLIC):
+            unknown = sorted(instruments.difference(self.server.instruments))
+            if unknown:
+                return await self.error(channel, f"Unknown instruments {', '.join(unknown)}",
+                                        command='SUBSCRIBE')
+
+        if channel == CH_PRV_BALANCE:
+            instruments = message_instruments(
+                {'channelArgs': [{'name': 'instrument', 'value': _channel_arg(message, 'currency') or ''}]}) or set()
+
+        self.subscriptions[channel].update(instruments)
+
+        if channel == CH_ORDER_BOOK_PUBLIC and instruments:
+            for instrument in sorted(instruments):
+                await self.send(self.server.book_frame(instrument))
+        elif channel == CH_PRV_BALANCE:
+            await self.send({"channel": channel, "data": self.server.balance_records(sorted(instruments)),
+                             "command": 'SUBSCRIBE'})
+        else:
+            await self.send({"channel": channel, "data": [], "command": 'SUBSCRIBE'})
+
+        if self._publisher is None and (self.server.book_rate or self.server.trade_rate):
+            self._publisher = asyncio.ensure_future(self._publish())
+
+    async def _unsubscribe(self, message):
+        channel = message.get('channel')
+        instruments = message_instruments(message)
+
+        if instruments is None:
+            self.subscriptions.pop(channel, None)
+        else:
+            self.subscriptions[channel].difference_update(instruments)
+
+        await self.send({"channel": channel, "data": [], "command": 'UNSUBSCRIBE'})
+
+    async def _get(self, message):
+        channel = message.get('channel')
+        server = self.server
+
+        if channel == CH_ASSET_LIST:
+            assets = sorted({asset for instrument in server.instruments for asset in instrument.split('/')})
+            data = [{"code": asset, "name": asset} for asset in assets]
+
+        elif channel == CH_INSTRUMENT_LIST:
+            data = [{"globalInstrumentCd": instrument,
+                     "baseCurrency": instrument.split('/')[0],
+                     "quoteCurrency": instrument.split('/')[-1]} for instrument in server.instruments]
+
+        elif channel == CH_ACTIVE_SUBSCRIPTIONS:
+            data = [{"channel": _channel,
+                     "channelArgs": [{"name": "instrument", "value": f"[{', '.join(sorted(instruments))}]"}]}
+                    for _channel, instruments in self.subscriptions.items() if instruments]
+
+        elif channel == CH_PRV_TRADE_POSITIONS:
+            data = [{"globalInstrumentCd": instrument, "amount": f"{amount:.8f}"}
+                    for instrument, amount in sorted(server.positions.items()) if amount]
+
+        elif channel == CH_PRV_TRADE_PRIVATE:
+            data = self._private_records(message)
+
+        else:
+            return await self.error(channel, f"Unknown channel {channel}", command='GET')
+
+        await self.send({"channel": channel, "data": data, "command": 'GET'})
+
+    def _private_records(self, message):
+        category = _channel_arg(message, 'category')
+        instruments = message_instruments(message)
+
+        if category == 'TRADES_HISTORY':
+            records = self.server.trades
+        elif category == 'ORDERS_HISTORY':
+            statuses = message_instruments({'channelArgs': [
+                {'name': 'instrument', 'value': _channel_arg(message, 'status') or ''}]})
+            records = [order for order in self.server.orders
+                       if not statuses or order['status'] in statuses]
+        else:
+            records = list(self.server.open_orders.values())
+
+        return [record for record in records
+                if not instruments or record['globalInstrumentCd'] in instruments]
+
+    async def _create(self, message):
+        channel = message.get('channel')
+        server = self.server
+
+        for item in message.get('data') or []:
+            missing = [key for key in ORDER_REQUIRED_KEYS if key not in item]
+            if missing:
+                await self.error(channel, f"Missing order fields {', '.join(missing)}", item, 'CREATE')
+                continue
+
+            order_id = next(server._ids)
+            order = dict(item, orderId=str(order_id), exchangeOrderId=f"MOCK-{order_id}", status='NEW')
+
+            server.orders.append(order)
+            server.stats['orders'] += 1
+
+            await self.send({"channel": channel, "data": [order], "command": 'CREATE'})
+
+            if str(order.get('orderType')).upper() != 'MARKET':
+                server.open_orders[str(order.get('clientOrderId') or order_id)] = order
+                continue
+
+            currencies = server.fill(order)
+
+            await self.send({"channel": channel, "data": [dict(order)], "command": 'CREATE'})
+
+            watched = [currency for currency in currencies
+                       if currency in self.subscriptions.get(CH_PRV_BALANCE, ())]
+            if watched:
+                await self.send({"channel": CH_PRV_BALANCE, "data": server.balance_records(watched)})
+
+    async def _cancel(self, message):
+        channel = message.get('channel')
+
+        for item in message.get('data') or []:
+            order = self.server.open_orders.pop(str(item.get('clientOrderId')), None)
+            if order is None:
+                await self.error(channel, 'Order not found', item, 'CANCEL')
+                continue
+
+            order['status'] = 'CANCELLED'
+            await self.send({"channel": channel, "data": [dict(order)], "command": 'CANCEL'})
+
+    async def _modify(self, message):
+        channel = message.get('channel')
+
+        for item in message.get('data') or []:
+            order = next((order for order in self.server.open_orders.values()
+                          if order['orderId'] == str(item.get('orderId'))), None)
+            if order is None:
+                await self.error(channel, 'Order not found', item, 'MODIFY')
+                continue
+
+            for key in ('price', 'amount'):
+                if key in item:
+                    order[key] = item[key]
+
+            await self.send({"channel": channel, "data": [dict(order)], "command": 'MODIFY'})
+
+    async def _publish(self):
+        """ Streams the subscribed books and trades at the server rates. Frames are sent
+        in bursts every millisecond or so, a client too slow to keep up loses the backlog
+        beyond one second.
+        """
+
+        server = self.server
+        loop = asyncio.get_running_loop()
+
+        started = loop.time()
+        books_sent = 0
+        trades_sent = 0
+
+        while True:
+            await asyncio.sleep(0.001)
+
+            elapsed = loop.time() - started
+
+            books_due = int(elapsed * server.book_rate) - books_sent
+            if books_due > server.book_rate:
+                books_sent += books_due - server.book_rate
+                books_due = server.book_rate
+
+            for _ in range(books_due):
+                for instrument in sorted(self.subscriptions.get(CH_ORDER_BOOK_PUBLIC, ())):
+                    await self.send(server.book_frame(instrument))
+                    server.stats['book_updates'] += 1
+
+                books_sent += 1
+
+            trades_due = int(elapsed * server.trade_rate) - trades_sent
+            if trades_due > server.trade_rate:
+                trades_sent += trades_due - server.trade_rate
+                trades_due = server.trade_rate
+
+            for _ in range(trades_due):
+                for instrument in sorted(self.subscriptions.get(CH_TRADE_PUBLIC, ())):
+                    await self.send(server.trade_frame(instrument))
+
+                trades_sent += 1
+
+
+class _RestHandler(BaseHTTPRequestHandler):
+    """
+    Gateway endpoints of the mock server: the two step login, candles, exchanges and
+    instruments. Responses are gzip encoded when the client accepts it.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    mock = None
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.mock.stats['rest_requests'] += 1
+
+        path = urllib.parse.urlsplit(self.path).path
+
+        if path == '/auth/login':
+            # Stands for the password check of the real gateway
+            if self.mock.login_delay:
+                time.sleep(self.mock.login_delay)
+
+            return self._reply(200, b'', {'Set-Cookie': 'SESSION=mock; Path=/'})
+
+        if path.startswith('/auth/auth/jwt/clients/') and path.endswith('/token'):
+            if 'SESSION' not in (self.headers.get('Cookie') or ''):
+                return self._reply(401, b'')
+
+            return self._reply(200, self.mock.issue_token().encode('utf-8'))
+
+        self._reply(404, b'')
+
+    def do_GET(self):
+        self.mock.stats['rest_requests'] += 1
+
+        url = urllib.parse.urlsplit(self.path)
+        query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        parts = url.path.strip('/').split('/')
+
+        data = None
+        if url.path.startswith('/gateway/hermes-data-provider/trades/agg/'):
+            period = query.get('period')
+            if period not in PERIOD_SECONDS:
+                return self._reply(400, b'the period param is not correct')
+
+            end = int(float(query.get('end') or time.time() * 1000))
+            if end < 1e11:
+                end *= 1000
+
+            # Stands for the latency of the data provider, and its transient failures
+            if self.mock.candle_delay:
+                time.sleep(self.mock.candle_delay)
+
+            if self.mock.candle_error_rate and random.random() < self.mock.candle_error_rate:
+                self.mock.stats['candle_errors'] += 1
+                return self._reply(503, b'')
+
+            data = self.mock.candles(query.get('instrument', ''), period, end,
+                                     int(query.get('count') or 1))
+
+        elif url.path == '/gateway/hermes-eag-private/exchanges':
+            data = ['FLEXFILLS', 'MOCK']
+
+        elif url.path.startswith('/gateway/hermes-exchange-api-gateway/exchanges/') and len(parts) == 6:
+            data = [{"globalInstrumentCd": instrument, "exchange": parts[3], "type": parts[5]}
+                    for instrument in self.mock.instruments]
+
+        if data is None:
+            return self._reply(404, b'')
+
+        self._reply(200, json.dumps(data).encode('utf-8'), {'Content-Type': 'application/json'})
+
+    def _reply(self, status, body, headers=None):
+        if body and 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            body = gzip.compress(body)
+            headers = dict(headers or {}, **{'Content-Encoding': 'gzip'})
+
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local mock FlexFills WebSocket and REST server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rest-port', type=int, default=8766)
+    parser.add_argument('--book-rate', type=int, default=10,
+                        help='order book updates per second per subscribed instrument')
+    parser.add_argument('--book-depth', type=int, default=20)
+    parser.add_argument('--trade-rate', type=int, default=0,
+                        help='public trades per second per subscribed instrument')
+    parser.add_argument('--response-delay', type=float, default=0,
+                        help='seconds between the ACK and the response of every message')
+    parser.add_argument('--auth-token', default=None,
+                        help='only accept connections with this Authorization header')
+    parser.add_argument('--login-delay', type=float, default=0,
+                        help='seconds taken by the first login request')
+    parser.add_argument('--order-rate', type=float, default=0,
+                        help='order messages per second allowed per connection, 0 for no limit')
+    parser.add_argument('--order-burst', type=float, default=None,
+                        help='order messages allowed at once, the order rate by default')
+    parser.add_argument('--candle-delay', type=float, default=0,
+                        help='seconds taken by every candle request')
+    parser.add_argument('--candle-error-rate', type=float, default=0,
+                        help='fraction of the candle requests failing with 503')
+    args = parser.parse_args()
+
+    server = MockFlexfillsServer(
+        args.host, args.port, args.rest_port, args.book_rate, args.book_depth, args.trade_rate,
+        auth_token=args.auth_token, response_delay=args.response_delay,
+        login_delay=args.login_delay, order_rate=args.order_rate, candle_delay=args.candle_delay,
+        candle_error_rate=args.candle_error_rate, order_burst=args.order_burst).start()
+
+    # Parsed by the benchmarks to find the ports
+    print(f"Mock FlexFills server listening on {server.url} {server.gateway_host}", flush=True)
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+from array import array
+
+from .constants import CH_ORDER_BOOK_PUBLIC
+
+BID = 'BID'
+ASK = 'ASK'
+
+_SIZE_KEYS = ('amount', 'quantity', 'size', 'volume')
+
+
+def _level(level):
+    """ Returns (price, size) of a book level given as a dict or a [price, size] pair.
+    """
+
+    if isinstance(level, dict):
+        price = level.get('price')
+        for key in _SIZE_KEYS:
+            if key in level:
+                return float(price), float(level[key])
+
+        return float(price), 0.0
+
+    return float(level[0]), float(level[1])
+
+
+class OrderBook:
+    """
+    Order book of one instrument, held in preallocated price and size arrays that
+    are overwritten in place by every snapshot. As sent by FlexFills, bids are
+    sorted best (max) first and asks best (min) first, so the NBBO is index 0.
+    """
+
+    __slots__ = ('instrument', 'bid_prices', 'bid_sizes', 'ask_prices', 'ask_sizes',
+                 'bid_depth', 'ask_depth', 'timestamp', 'updates')
+
+    def __init__(self, instrument, max_levels=20):
+        self.instrument = instrument
+
+        self.bid_prices = array('d', bytes(8 * max_levels))
+        self.bid_sizes = array('d', bytes(8 * max_levels))
+        self.ask_prices = array('d', bytes(8 * max_levels))
+        self.ask_sizes = array('d', bytes(8 * max_levels))
+
+        self.bid_depth = 0
+        self.ask_depth = 0
+        self.timestamp = None
+        self.updates = 0
+
+    def update(self, bids, asks, timestamp=None):
+        """ Overwrites the book with a full snapshot of bid and ask levels.
+        """
+
+        self.bid_depth = self._fill(self.bid_prices, self.bid_sizes, bids)
+        self.ask_depth = self._fill(self.ask_prices, self.ask_sizes, asks)
+        self.timestamp = timestamp
+        self.updates += 1
+
+    def load(self, bid_prices, bid_sizes, ask_prices, ask_sizes, timestamp=None):
+        """ Overwrites the book with a full snapshot given as arrays ('d') of prices and sizes.
+        """
+
+        self.bid_depth = self._copy(self.bid_prices, bid_prices)
+        self._copy(self.bid_sizes, bid_sizes)
+        self.ask_depth = self._copy(self.ask_prices, ask_prices)
+        self._copy(self.ask_sizes, ask_sizes)
+        self.timestamp = timestamp
+        self.updates += 1
+
+    @staticmethod
+    def _copy(target, values):
+        depth = len(values)
+
+        # Grows the target only when the snapshot is deeper than it
+        target[:min(depth, len(target))] = values
+
+        return depth
+
+    @staticmethod
+    def _fill(prices, sizes, levels):
+        depth = 0
+        capacity = len(prices)
+
+        for level in levels or ():
+            price, size = _level(level)
+
+            if depth == capacity:
+                prices.append(price)
+                sizes.append(size)
+                capacity += 1
+            else:
+                prices[depth] = price
+                sizes[depth] = size
+
+            depth += 1
+
+        return depth
+
+    @property
+    def best_bid(self):
+        return self.bid_prices[0] if self.bid_depth else None
+
+    @property
+    def best_ask(self):
+        return self.ask_prices[0] if self.ask_depth else None
+
+    @property
+    def best_bid_size(self):
+        return self.bid_sizes[0] if self.bid_depth else None
+
+    @property
+    def best_ask_size(self):
+        return self.ask_sizes[0] if self.ask_depth else None
+
+    @property
+    def mid(self):
+        if not self.bid_depth or not self.ask_depth:
+            return None
+
+        return (self.bid_prices[0] + self.ask_prices[0]) / 2
+
+    @property
+    def spread(self):
+        if not self.bid_depth or not self.ask_depth:
+            return None
+
+        return self.ask_prices[0] - self.bid_prices[0]
+
+    def size_at(self, side, price):
+        """ Returns the size resting at exactly the price on the side, 0 if there is no such level.
+        """
+
+        prices, sizes, depth = self._side(side)
+
+        for i in range(depth):
+            if prices[i] == price:
+                return sizes[i]
+
+        return 0.0
+
+    def cumulative_size(self, side, levels=None, price=None):
+        """ Returns the total size of the best levels of the side, either the first
+        `levels` levels or all levels at or better than `price`.
+        """
+
+        prices, sizes, depth = self._side(side)
+
+        if levels is not None:
+            depth = min(depth, levels)
+
+        total = 0.0
+        for i in range(depth):
+            if price is not None and (prices[i] < price if side == BID else prices[i] > price):
+                break
+
+            total += sizes[i]
+
+        return total
+
+    def bids(self):
+        return list(zip(self.bid_prices[:self.bid_depth], self.bid_sizes[:self.bid_depth]))
+
+    def asks(self):
+        return list(zip(self.ask_prices[:self.ask_depth], self.ask_sizes[:self.ask_depth]))
+
+    def _side(self, side):
+        if side == BID:
+            return self.bid_prices, self.bid_sizes, self.bid_depth
+
+        if side == ASK:
+            return self.ask_prices, self.ask_sizes, self.ask_depth
+
+        raise ValueError(f"side should be {BID} or {ASK}")
+
+    def __repr__(self):
+        return (f"OrderBook({self.instrument!r}, bid={self.best_bid}, ask={self.best_ask}, "
+                f"depth={self.bid_depth}/{self.ask_depth})")
+
+
+class OrderBookStore:
+    """
+    Order books keyed by instrument, kept up to date from ORDER_BOOK_PUBLIC frames.
+    The store is callable, so it can be passed directly as a subscription callback.
+    """
+
+    def __init__(self, max_levels=20):
+        self._max_levels = max_levels
+        self._books = {}
+
+    def apply(self, frame):
+        """ Updates the books from an ORDER_BOOK_PUBLIC frame and returns the updated books.
+        """
+
+        if frame.get('channel', CH_ORDER_BOOK_PUBLIC) != CH_ORDER_BOOK_PUBLIC:
+            return []
+
+        data = frame.get('data')
+        items = [data] if isinstance(data, dict) else data or []
+
+        updated = []
+        for item in items:
+            if not isinstance(item, dict) or ('bids' not in item and 'asks' not in item):
+                continue
+
+            instrument = item.get('globalInstrumentCd') or item.get('instrument')
+            if not instrument:
+                continue
+
+            book = self._books.get(instrument)
+            if book is None:
+                book = self._books[instrument] = OrderBook(
+                    instrument, self._max_levels)
+
+            book.update(item.get('bids'), item.get('asks'),
+                        item.get('timestamp') or item.get('ts'))
+            updated.append(book)
+
+        return updated
+
+    __call__ = apply
+
+    def get(self, instrument):
+        return self._books.get(instrument)
+
+    def instruments(self):
+        return list(self._books)
+
+    def discard(self, instrument):
+        self._books.pop(instrument, None)
+
+    def __getitem__(self, instrument):
+        return self._books[instrument]
+
+    def __contains__(self, instrument):
+        return instrument in self._books
+
+    def __len__(self):
+        return len(self._books)
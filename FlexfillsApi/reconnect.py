@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+
+from .constants import (retry_delay, retry_backoff_base, circuit_failure_threshold,
+                        circuit_reset_timeout)
+from .exceptions import FlexfillsConnectException, FlexfillsCircuitOpenException, FlexfillsParamsException
+
+# Client methods whose request changes state on the server, so sending it twice
+# may act twice. They are only retried when the request never left the client.
+NON_IDEMPOTENT_METHODS = frozenset(['create_order', 'modify_order'])
+
+
+def is_idempotent(name):
+    return name not in NON_IDEMPOTENT_METHODS
+
+
+def should_retry(exception, idempotent):
+    """ Returns whether a call failing with the exception may be sent again.
+    """
+
+    if isinstance(exception, (FlexfillsParamsException, FlexfillsCircuitOpenException)):
+        return False
+
+    if idempotent:
+        return True
+
+    # Without a response the outcome of a sent order is unknown, resending it
+    # could fill twice. The caller has to check the open orders instead.
+    return isinstance(exception, FlexfillsConnectException) and not exception.sent
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter: the delay before attempt n is drawn
+    uniformly from [0, min(max_delay, base * 2 ** (n - 1))], so clients dropped
+    together do not reconnect together.
+    """
+
+    def __init__(self, base=retry_backoff_base, max_delay=retry_delay, factor=2):
+        self.base = base
+        self.max_delay = max_delay
+        self.factor = factor
+
+    def delay(self, attempt):
+        ceiling = min(self.max_delay, self.base * self.factor ** max(attempt - 1, 0))
+
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """
+    Stops connection attempts after failure_threshold consecutive failures. While
+    open, attempts fail at once with FlexfillsCircuitOpenException. After
+    reset_timeout seconds one attempt is let through (half open): its success
+    closes the breaker, its failure opens it again.
+    """
+
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+
+    def __init__(self, failure_threshold=circuit_failure_threshold, reset_timeout=circuit_reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+
+        if self.retry_after() > 0:
+            return self.OPEN
+
+        return self.HALF_OPEN
+
+    def retry_after(self):
+        """ Returns the seconds left before the open breaker lets an attempt through.
+        """
+
+        if self._opened_at is None:
+            return 0
+
+        return max(0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def check(self):
+        """ Raises FlexfillsCircuitOpenException while the breaker is open.
+        """
+
+        if self.state == self.OPEN:
+            raise FlexfillsCircuitOpenException(
+                f"Flexfills API connection circuit is open after {self.failures} failures, "
+                f"retry in {self.retry_after():.1f} seconds")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+            if self._opened_at is not None or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
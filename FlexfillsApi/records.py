@@ -0,0 +1,68 @@
+import datetime
+
+
+def frame_items(frame):
+    """ Returns the dict items of the data of a frame, a single dict being one item.
+    """
+
+    data = frame.get('data')
+
+    if isinstance(data, dict):
+        return [data]
+
+    if isinstance(data, list):
+        return [item for item in data if isinstance(item, dict)]
+
+    return []
+
+
+def items(value, strings=False):
+    """ Returns the dict items of a response, of its data when it has some, and also its
+    string items with strings.
+    """
+
+    if isinstance(value, dict):
+        value = value.get('data', value)
+
+    if isinstance(value, dict):
+        return [value]
+
+    if isinstance(value, list):
+        kinds = (dict, str) if strings else dict
+        return [item for item in value if isinstance(item, kinds)]
+
+    return []
+
+
+def first(item, keys):
+    """ Returns the value of the first of the keys set in the item, or None.
+    """
+
+    for key in keys:
+        if item.get(key) not in (None, ''):
+            return item[key]
+
+    return None
+
+
+def to_ms(value):
+    """ Converts epoch seconds or milliseconds, a numeric string, an ISO 8601 string
+    or a datetime to epoch milliseconds. Naive datetimes are taken as UTC.
+    """
+
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+
+        return int(value.timestamp() * 1000)
+
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return to_ms(datetime.datetime.fromisoformat(value.replace('Z', '+00:00')))
+
+    value = float(value)
+
+    # Values below 1e11 are epoch seconds (until year 5138)
+    return int(value * 1000) if value < 1e11 else int(value)
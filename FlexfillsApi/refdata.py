@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import time
+
+from .records import items, first
+
+DS_ASSETS = 'ASSETS'
+DS_INSTRUMENTS = 'INSTRUMENTS'
+DS_EXCHANGES = 'EXCHANGES'
+DS_INSTRUMENTS_BY_TYPE = 'INSTRUMENTS_BY_TYPE'
+
+DEFAULT_TTLS = {
+    DS_ASSETS: 3600,
+    DS_INSTRUMENTS: 3600,
+    DS_EXCHANGES: 3600,
+    DS_INSTRUMENTS_BY_TYPE: 3600,
+}
+
+_INSTRUMENT_KEYS = ('globalInstrumentCd', 'instrument', 'code', 'symbol', 'name')
+_ASSET_KEYS = ('code', 'asset', 'currency', 'symbol', 'name')
+_EXCHANGE_KEYS = ('exchange', 'exchangeName')
+_TICK_SIZE_KEYS = ('tickSize', 'priceIncrement', 'priceTick', 'minPriceIncrement')
+
+
+class ReferenceDataCache:
+    """
+    Cache of reference data (assets, instruments, exchanges) with a TTL per dataset.
+    With a snapshot_path the cache is saved to disk on every refresh and loaded at
+    start, so a cold start serves the last snapshot at once while it is refreshed
+    in the background. On the event loop the snapshot is written in the executor, one
+    write at a time. Lookups such as instrument -> tick size and exchange ->
+    instruments are served from indexes rebuilt on every refresh, so delisted
+    instruments disappear.
+    """
+
+    def __init__(self, ttls=None, snapshot_path=None):
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.snapshot_path = snapshot_path
+
+        self._entries = {}
+        self._loading = {}
+        self._refreshing = {}
+
+        # Snapshot write running in the executor, and whether another one is due after it
+        self._saving = None
+        self._save_again = False
+
+        self._assets = {}
+        self._instruments = {}
+        self._tick_sizes = {}
+        self._exchange_instruments = {}
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load_snapshot()
+
+    async def get(self, key, loader):
+        """ Returns the cached value of the key, loading it with the loader coroutine
+        function when missing. An expired value is returned as is while it is
+        refreshed in the background.
+        """
+
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return await self.refresh(key, loader)
+
+        if time.time() - entry[0] > self._ttl(key) and key not in self._refreshing:
+            self._refreshing[key] = asyncio.ensure_future(
+                self._refresh_in_background(key, loader))
+
+        return entry[1]
+
+    async def refresh(self, key, loader):
+        """ Loads the key now and stores it, unless the response is an ERROR. Concurrent
+        refreshes of a key share one load.
+        """
+
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = self._loading[key] = asyncio.ensure_future(self._load(key, loader))
+            loading.add_done_callback(lambda future: self._loaded(key, future))
+
+        return await asyncio.shield(loading)
+
+    def set(self, key, value, timestamp=None):
+        self._entries[key] = (timestamp or time.time(), value)
+        self._reindex()
+
+        if self.snapshot_path:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.save_snapshot()
+            else:
+                self._save_later(loop)
+
+    def peek(self, key):
+        entry = self._entries.get(key)
+
+        return entry[1] if entry is not None else None
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    # Indexes
+
+    def asset(self, code):
+        return self._assets.get(code)
+
+    def instrument(self, instrument):
+        return self._instruments.get(instrument)
+
+    def tick_size(self, instrument):
+        return self._tick_sizes.get(instrument)
+
+    def exchange_instruments(self, exchange):
+        return self._exchange_instruments.get(exchange, set())
+
+    def exchanges(self):
+        return list(self._exchange_instruments)
+
+    # Snapshot
+
+    def save_snapshot(self):
+        self._write_snapshot(self._snapshot())
+
+    def load_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load reference data snapshot: {str(e)}")
+            return
+
+        for key, entry in snapshot.items():
+            self._entries[key] = (entry['timestamp'], entry['value'])
+
+        self._reindex()
+
+    # Protected Methods
+
+    def _ttl(self, key):
+        return self.ttls.get(key.split(':', 1)[0], DEFAULT_TTLS[DS_ASSETS])
+
+    async def _load(self, key, loader):
+        value = await loader()
+
+        if not (isinstance(value, dict) and value.get('event') == 'ERROR'):
+            self.set(key, value)
+
+        return value
+
+    def _loaded(self, key, future):
+        if self._loading.get(key) is future:
+            del self._loading[key]
+
+        # Retrieved, so a load whose callers were cancelled logs no warning
+        if not future.cancelled():
+            future.exception()
+
+    async def _refresh_in_background(self, key, loader):
+        try:
+            await self.refresh(key, loader)
+        except Exception as e:
+            print(f"Could not refresh reference data {key}: {str(e)}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    def _snapshot(self):
+        return {key: {"timestamp": entry[0], "value": entry[1]}
+                for key, entry in self._entries.items()}
+
+    def _save_later(self, loop):
+        if self._saving is not None:
+            self._save_again = True
+            return
+
+        self._saving = loop.run_in_executor(None, self._write_snapshot, self._snapshot())
+        self._saving.add_done_callback(self._saved)
+
+    def _saved(self, future):
+        self._saving = None
+
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Could not save reference data snapshot: {str(future.exception())}")
+
+        if self._save_again:
+            self._save_again = False
+            self._save_later(future.get_loop())
+
+    def _write_snapshot(self, snapshot):
+        # Write to a temporary file first so a crash never leaves a partial snapshot
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _reindex(self):
+        """ Rebuilds the indexes from every cached dataset.
+        """
+
+        self._assets = {}
+        self._instruments = {}
+        self._tick_sizes = {}
+        self._exchange_instruments = {}
+
+        for key, entry in self._entries.items():
+            self._index(key, entry[1])
+
+    def _index(self, key, value):
+        dataset = key.split(':', 1)[0]
+
+        if dataset == DS_ASSETS:
+            for item in items(value):
+                code = first(item, _ASSET_KEYS)
+                if code is not None:
+                    self._assets[str(code)] = item
+
+        elif dataset in (DS_INSTRUMENTS, DS_INSTRUMENTS_BY_TYPE):
+            default_exchange = key.split(':')[1] if dataset == DS_INSTRUMENTS_BY_TYPE else None
+
+            for item in items(value, strings=True):
+                if isinstance(item, str):
+                    item = {'instrument': item}
+
+                instrument = first(item, _INSTRUMENT_KEYS)
+                if instrument is None:
+                    continue
+
+                instrument = str(instrument)
+                self._instruments[instrument] = item
+
+                tick_size = first(item, _TICK_SIZE_KEYS)
+                if tick_size is not None:
+                    try:
+                        self._tick_sizes[instrument] = float(tick_size)
+                    except (TypeError, ValueError):
+                        pass
+
+                exchange = first(item, _EXCHANGE_KEYS) or default_exchange
+                if exchange is not None:
+                    self._exchange_instruments.setdefault(
+                        str(exchange), set()).add(instrument)
+
+        elif dataset == DS_EXCHANGES:
+            for item in items(value, strings=True):
+                exchange = item if isinstance(item, str) else first(item, ('name',) + _EXCHANGE_KEYS)
+                if exchange is not None:
+                    self._exchange_instruments.setdefault(str(exchange), set())
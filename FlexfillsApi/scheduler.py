@@ -0,0 +1,356 @@
+import asyncio
+import collections
+import itertools
+import time
+
+from .constants import CH_PRV_TRADE_PRIVATE
+from .metrics import STAGE_QUEUE
+
+# Priority lanes, drained in this order: cancels and modifies go before new orders
+LANE_CANCEL = 'cancel'
+LANE_MODIFY = 'modify'
+LANE_CREATE = 'create'
+
+LANES = (LANE_CANCEL, LANE_MODIFY, LANE_CREATE)
+
+COMMAND_LANES = {'CANCEL': LANE_CANCEL, 'MODIFY': LANE_MODIFY, 'CREATE': LANE_CREATE}
+
+
+def _local_response(data, status):
+    """ Response of an order resolved in the client, it never reached the server.
+    """
+
+    return {"channel": CH_PRV_TRADE_PRIVATE, "data": [dict(data, status=status)], "coalesced": True}
+
+
+class TokenBucket:
+    """
+    Allows rate events per second on average, in bursts of up to burst events.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def delay(self, now=None):
+        """ Returns the seconds until a token is available, 0 when there is one.
+        """
+
+        self._refill(time.monotonic() if now is None else now)
+
+        if self.tokens >= 1:
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now=None):
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= 1
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class _QueuedOrder:
+    __slots__ = ('command', 'lane', 'data', 'instrument', 'key', 'sequence', 'enqueued', 'future')
+
+    def __init__(self, command, lane, data, instrument, key, sequence, future):
+        self.command = command
+        self.lane = lane
+        self.data = data
+        self.instrument = instrument
+        self.key = key
+        self.sequence = sequence
+        self.enqueued = time.perf_counter_ns()
+        self.future = future
+
+
+class OrderScheduler:
+    """
+    Outbound scheduler of the order messages (CREATE, CANCEL, MODIFY) of one account.
+
+    Orders are released when the token buckets of the account and of their instrument
+    allow it, so bursts go out at the server limit instead of being rejected. Waiting
+    orders sit in priority lanes: cancels, then modifies, then new orders, and within
+    a lane the oldest order of an instrument with a token left goes first. The wait is
+    recorded as the queue stage of the order metrics, after validate.
+
+    With coalesce, a cancel of a new order still waiting removes both, and a modify of
+    an order with a modify still waiting replaces it, keeping its turn. The orders
+    resolved that way get a local response with a status (CANCELLED, REPLACED) and
+    coalesced set, instead of a server response.
+
+    rate and burst limit the account, instrument_rate and instrument_burst every
+    instrument, and instrument_rates maps instruments to their own rate. Set the rates a
+    little under the server limits, so network jitter does not push a burst over them.
+    """
+
+    def __init__(self, rate=None, burst=None, instrument_rate=None, instrument_burst=None,
+                 instrument_rates=None, coalesce=True):
+        self.account_bucket = TokenBucket(rate, burst) if rate else None
+        self.instrument_rate = instrument_rate
+        self.instrument_burst = instrument_burst
+        self.instrument_rates = dict(instrument_rates or {})
+        self.coalesce = coalesce
+
+        # Orders released, and resolved in the client, per lane
+        self.released = collections.Counter()
+        self.coalesced = collections.Counter()
+
+        self._buckets = {}
+
+        # Waiting orders, per lane and instrument in arrival order
+        self._lanes = {lane: collections.OrderedDict() for lane in LANES}
+        self._depth = 0
+
+        # Waiting orders a later message can coalesce with: new orders by clientOrderId,
+        # modifies by orderId
+        self._coalescable = {}
+
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._task = None
+
+    @property
+    def depth(self):
+        return self._depth
+
+    def stats(self):
+        """ Returns the waiting, released and coalesced orders per lane.
+        """
+
+        return {lane: {'waiting': sum(len(entries) for entries in self._lanes[lane].values()),
+                       'released': self.released[lane],
+                       'coalesced': self.coalesced[lane]}
+                for lane in LANES}
+
+    async def schedule(self, command, data, trace=None):
+        """ Waits for the turn of one order message.
+
+        Parameters:
+        ----------
+        command: CREATE, CANCEL or MODIFY, other commands are not scheduled.
+        data: The validated order payload.
+        trace: Optional metrics.OrderTrace, marked with the queue stage.
+
+        Returns:
+        -------
+        Return (data, None) when the order can be sent, data including the fields of the
+        modifies coalesced into it, or (None, response) when it was resolved in the client.
+
+        """
+
+        lane = COMMAND_LANES.get(command)
+        if lane is None:
+            return data, None
+
+        instrument = data.get('globalInstrumentCd')
+
+        entry = None
+        if self.coalesce:
+            coalesced = self._coalesce(command, data)
+            if isinstance(coalesced, dict):
+                return None, coalesced
+
+            entry = coalesced
+
+        if entry is None:
+            now = time.monotonic()
+
+            # Nothing waiting and a token left: no queueing
+            if not self._depth and self._delay(instrument, now) == 0:
+                self._take(instrument, now)
+                self.released[lane] += 1
+
+                if trace is not None:
+                    trace.mark(STAGE_QUEUE, time.perf_counter_ns())
+
+                return data, None
+
+            entry = self._enqueue(command, lane, data, instrument)
+
+        try:
+            response = await entry.future
+        except asyncio.CancelledError:
+            self._remove(entry)
+            raise
+
+        if response is not None:
+            return None, response
+
+        if trace is not None:
+            trace.mark(STAGE_QUEUE, entry.enqueued)
+
+        return entry.data, None
+
+    # Protected Methods
+
+    def _coalesce(self, command, data):
+        """ Returns the local response of a cancel coalesced with a waiting new order, the
+        waiting modify replaced by a modify, or None.
+        """
+
+        if command == 'CANCEL':
+            entry = self._coalescable.get(('CREATE', str(data.get('clientOrderId'))))
+            if entry is None:
+                return None
+
+            self._remove(entry)
+            entry.future.set_result(_local_response(entry.data, 'CANCELLED'))
+
+            self.coalesced[LANE_CREATE] += 1
+            self.coalesced[LANE_CANCEL] += 1
+
+            return _local_response(data, 'CANCELLED')
+
+        if command == 'MODIFY':
+            entry = self._coalescable.get(('MODIFY', str(data.get('orderId'))))
+            if entry is None:
+                return None
+
+            # The replaced modify never reaches the server, the new one takes its place and
+            # turn as an entry of its own, so cancelling either caller leaves the other
+            replacement = _QueuedOrder(entry.command, entry.lane, dict(entry.data, **data),
+                                       entry.instrument, entry.key, entry.sequence,
+                                       asyncio.get_running_loop().create_future())
+            replacement.enqueued = entry.enqueued
+
+            entries = self._lanes[entry.lane][entry.instrument]
+            entries[entries.index(entry)] = replacement
+            self._coalescable[entry.key] = replacement
+
+            entry.future.set_result(_local_response(entry.data, 'REPLACED'))
+
+            self.coalesced[LANE_MODIFY] += 1
+
+            return replacement
+
+        return None
+
+    def _enqueue(self, command, lane, data, instrument):
+        key = None
+        if command == 'CREATE' and data.get('clientOrderId') is not None:
+            key = ('CREATE', str(data['clientOrderId']))
+        elif command == 'MODIFY' and data.get('orderId') is not None:
+            key = ('MODIFY', str(data['orderId']))
+
+        entry = _QueuedOrder(command, lane, data, instrument, key, next(self._sequence),
+                             asyncio.get_running_loop().create_future())
+
+        entries = self._lanes[lane].get(instrument)
+        if entries is None:
+            entries = self._lanes[lane][instrument] = collections.deque()
+        entries.append(entry)
+
+        if key is not None:
+            self._coalescable[key] = entry
+
+        self._depth += 1
+        self._wake()
+
+        return entry
+
+    def _remove(self, entry):
+        entries = self._lanes[entry.lane].get(entry.instrument)
+        if entries is None or entry not in entries:
+            return
+
+        entries.remove(entry)
+        self._forget(entry, entries)
+
+    def _forget(self, entry, entries):
+        if not entries:
+            del self._lanes[entry.lane][entry.instrument]
+
+        if entry.key is not None and self._coalescable.get(entry.key) is entry:
+            del self._coalescable[entry.key]
+
+        self._depth -= 1
+
+    def _wake(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+
+        self._wakeup.set()
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while self._depth:
+            now = time.monotonic()
+            entry, wait = self._next(now)
+
+            if entry is not None:
+                self._release(entry, now)
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _next(self, now):
+        """ Returns the next order to release, or None and the seconds to wait for a token.
+        """
+
+        if self.account_bucket is not None:
+            delay = self.account_bucket.delay(now)
+            if delay:
+                return None, delay
+
+        wait = None
+        for lane in LANES:
+            best = None
+
+            for instrument, entries in self._lanes[lane].items():
+                delay = self._instrument_delay(instrument, now)
+                if delay:
+                    wait = delay if wait is None else min(wait, delay)
+                elif best is None or entries[0].sequence < best.sequence:
+                    best = entries[0]
+
+            if best is not None:
+                return best, 0
+
+        return None, wait
+
+    def _release(self, entry, now):
+        entries = self._lanes[entry.lane][entry.instrument]
+        entries.popleft()
+        self._forget(entry, entries)
+
+        self._take(entry.instrument, now)
+        self.released[entry.lane] += 1
+
+        if not entry.future.done():
+            entry.future.set_result(None)
+
+    def _bucket(self, instrument):
+        if instrument not in self._buckets:
+            rate = self.instrument_rates.get(instrument, self.instrument_rate)
+            self._buckets[instrument] = TokenBucket(rate, self.instrument_burst) if rate else None
+
+        return self._buckets[instrument]
+
+    def _instrument_delay(self, instrument, now):
+        bucket = self._bucket(instrument)
+
+        return bucket.delay(now) if bucket is not None else 0
+
+    def _delay(self, instrument, now):
+        delay = self.account_bucket.delay(now) if self.account_bucket is not None else 0
+
+        return max(delay, self._instrument_delay(instrument, now))
+
+    def _take(self, instrument, now):
+        if self.account_bucket is not None:
+            self.account_bucket.take(now)
+
+        bucket = self._bucket(instrument)
+        if bucket is not None:
+            bucket.take(now)
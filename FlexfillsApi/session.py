@@ -0,0 +1,823 @@
+import asyncio
+import collections
+import threading
+import time
+
+import websockets
+from websockets.exceptions import ConnectionClosed, InvalidStatusCode
+
+from .codec import get_codec, encode_message
+from .constants import max_tries, retry_delay
+from .exceptions import FlexfillsConnectException, FlexfillsAuthException
+from .reconnect import Backoff, CircuitBreaker
+from .dispatch import Dispatcher
+from .metrics import STAGE_SERIALIZE, STAGE_SEND, STAGE_ACK, STAGE_RESPONSE
+from .records import frame_items
+
+
+def _order_ids(frame):
+    return ({('orderId', str(item['orderId'])) for item in frame_items(frame)
+             if item.get('orderId') is not None} |
+            {('clientOrderId', str(item['clientOrderId'])) for item in frame_items(frame)
+             if item.get('clientOrderId') is not None})
+
+
+def frame_instruments(frame):
+    """ Returns the set of instruments a frame refers to, or None if the frame does not name any.
+    """
+
+    instruments = set()
+    for item in frame_items(frame):
+        instrument = item.get('globalInstrumentCd') or item.get('instrument')
+        if instrument:
+            instruments.add(str(instrument))
+
+    return instruments or None
+
+
+def frame_client_order_ids(frame):
+    """ Returns the clientOrderIds carried by a frame.
+    """
+
+    return [str(item['clientOrderId']) for item in frame_items(frame)
+            if item.get('clientOrderId') is not None]
+
+
+def message_instruments(message):
+    """ Returns the instruments of the `instrument` channel argument of a message, or None.
+    """
+
+    for channel_arg in message.get('channelArgs') or []:
+        if channel_arg.get('name') == 'instrument':
+            value = str(channel_arg.get('value', '')).strip('[]')
+            return {i.strip() for i in value.split(',') if i.strip()}
+
+    return None
+
+
+def with_instruments(message, instruments):
+    """ Returns a copy of the message with its `instrument` channel argument replaced.
+    """
+
+    channel_args = [dict(channel_arg) for channel_arg in message.get('channelArgs') or []
+                    if channel_arg.get('name') != 'instrument']
+    channel_args.append({"name": "instrument",
+                         "value": f"[{', '.join(sorted(instruments))}]"})
+
+    _message = dict(message)
+    _message['channelArgs'] = channel_args
+
+    return _message
+
+
+def subscription_key(message):
+    """ Identifies a subscription by its channel and channel arguments.
+    """
+
+    channel_args = tuple((str(channel_arg.get('name')), str(channel_arg.get('value')))
+                         for channel_arg in message.get('channelArgs') or [])
+
+    return (message.get('channel'), tuple(sorted(channel_args)))
+
+
+class SubscriptionRegistry:
+    """
+    Instruments with an active subscription, per channel.
+    """
+
+    def __init__(self):
+        self._active = collections.defaultdict(set)
+
+    def add(self, channel, instruments):
+        self._active[channel].update(instruments)
+
+    def discard(self, channel, instruments=None):
+        if instruments is None:
+            self._active.pop(channel, None)
+        else:
+            self._active[channel].difference_update(instruments)
+
+    def clear(self):
+        self._active.clear()
+
+    def is_subscribed(self, channel, instrument):
+        return instrument in self._active.get(channel, ())
+
+    def missing(self, channel, instruments):
+        active = self._active.get(channel, ())
+        return [instrument for instrument in instruments if instrument not in active]
+
+    def active(self, channel=None):
+        if channel is not None:
+            return set(self._active.get(channel, ()))
+
+        return {channel: set(instruments) for channel, instruments in self._active.items() if instruments}
+
+    def seed(self, frame):
+        """ Adds the subscriptions listed by an ACTIVE_SUBSCRIPTIONS response.
+        """
+
+        for item in frame_items(frame):
+            channel = item.get('channel')
+            if not channel:
+                continue
+
+            instruments = message_instruments(item) or set()
+            instrument = item.get('globalInstrumentCd') or item.get('instrument')
+            if instrument:
+                instruments.add(str(instrument))
+
+            self.add(channel, instruments)
+
+
+class _PendingRequest:
+    __slots__ = ('message', 'validator', 'future', 'is_onetime',
+                 'max_frames', 'frames', 'client_order_id', 'trace')
+
+    def __init__(self, message, validator, future, is_onetime, max_frames, client_order_id=None,
+                 trace=None):
+        self.message = message
+        self.validator = validator
+        self.future = future
+        self.is_onetime = is_onetime
+        self.max_frames = max_frames
+        self.frames = 0
+        self.client_order_id = client_order_id
+        self.trace = trace
+
+
+class FlexfillsSession:
+    """
+    One long-lived, authenticated WebSocket connection shared by every request and
+    subscription of a client. Responses are routed back to the waiting request by
+    clientOrderId when the frame carries one, otherwise by channel and echoed command
+    in send order. On a channel with a live subscription, frames echoing no command
+    are streamed data and never resolve a GET or an order request.
+    Streaming frames are fanned out to the listeners registered for their channel
+    and instruments. When the connection drops, in-flight requests fail with
+    FlexfillsConnectException and live subscriptions are restored in the background,
+    reconnecting with jittered exponential backoff behind a circuit breaker.
+    """
+
+    def __init__(self, socket_url, auth_header, ssl_context=None, max_retries=max_tries,
+                 delay=retry_delay, request_timeout=30, codec=None, breaker=None, dispatcher=None,
+                 recorder=None):
+        self._socket_url = socket_url
+        self._auth_header = auth_header
+        self._ssl_context = ssl_context
+        self._max_retries = max_retries
+        self._request_timeout = request_timeout
+        self.codec = get_codec(codec)
+
+        self.backoff = Backoff(max_delay=delay)
+        self.breaker = breaker or CircuitBreaker()
+
+        # Queues streamed frames for the callbacks, so they never run inside the reader
+        self.dispatcher = dispatcher or Dispatcher()
+
+        # Optional JournalWriter, or any callable, given every raw frame received
+        self.recorder = recorder
+
+        # Set once the auth token is known: a session created before the login
+        # completes waits for it before connecting
+        self._auth_ready = threading.Event()
+        self._auth_error = None
+        if auth_header.get('Authorization'):
+            self._auth_ready.set()
+
+        self.loop = None
+
+        self._websocket = None
+        self._reader_task = None
+        self._reconnect_task = None
+        self._connect_lock = None
+        self._closed = False
+
+        self._pending = collections.defaultdict(collections.deque)
+        self._pending_orders = {}
+        self._subscriptions = collections.OrderedDict()
+        self._subscribing = {}
+        self._listeners = collections.defaultdict(list)
+
+        self.registry = SubscriptionRegistry()
+
+    @property
+    def connected(self):
+        return self._websocket is not None and self._websocket.open
+
+    @property
+    def subscriptions(self):
+        return list(self._subscriptions.values())
+
+    async def connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            if self.connected:
+                return self._websocket
+
+            # Set first, so a token arriving from another thread is handed over on the loop
+            self.loop = asyncio.get_running_loop()
+            await self.wait_auth()
+
+            self._closed = False
+            websocket = await self._open()
+
+            self._websocket = websocket
+            self._reader_task = asyncio.ensure_future(
+                self._read_loop(websocket))
+
+            # Restore live subscriptions, their responses go to the listeners
+            self.registry.clear()
+            for message in list(self._subscriptions.values()):
+                await websocket.send(encode_message(message, self.codec))
+                self._register(message)
+
+            return websocket
+
+    def update_auth(self, auth_token):
+        """ Uses the auth token for the next connections and for the subscriptions
+        restored on them. The open connection is kept.
+        """
+
+        self._auth_header = dict(self._auth_header, Authorization=auth_token)
+
+        for key, message in list(self._subscriptions.items()):
+            if 'signature' in message:
+                self._subscriptions[key] = dict(message, signature=auth_token)
+
+        self._auth_error = None
+        self._auth_ready.set()
+
+    def fail_auth(self, error):
+        """ Fails the connections waiting for an auth token that could not be obtained.
+        """
+
+        self._auth_error = error
+        self._auth_ready.set()
+
+    async def wait_auth(self):
+        if not self._auth_ready.is_set():
+            await asyncio.get_running_loop().run_in_executor(None, self._auth_ready.wait)
+
+        if self._auth_error is not None:
+            raise FlexfillsAuthException(f"Could not authenticate: {str(self._auth_error)}")
+
+    async def close(self):
+        self._closed = True
+
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+
+        websocket, self._websocket = self._websocket, None
+        if websocket is not None:
+            await websocket.close()
+
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+
+        self.dispatcher.close()
+
+        self._fail_pending(FlexfillsConnectException(
+            'Flexfills API session was closed'))
+
+    async def request(self, message, validator, is_onetime=False, max_frames=10,
+                      client_order_id=None, trace=None):
+        """ Sends a message and waits for the response the validator accepts as final.
+
+        Parameters:
+        ----------
+        message: The message dict to send.
+        validator: Callable(frame, message) returning (is_final, frame).
+        is_onetime: Resolve with the first matching frame.
+        max_frames: Resolve with the last frame after this many non-final frames, None for no limit.
+        client_order_id: Match responses by this clientOrderId before the channel.
+        trace: Optional metrics.OrderTrace marked at every stage of the request.
+
+        Returns:
+        -------
+        Return the final response frame.
+
+        """
+
+        websocket = await self.connect()
+
+        future = asyncio.get_running_loop().create_future()
+        pending = _PendingRequest(message, validator, future, is_onetime,
+                                  max_frames, client_order_id, trace)
+
+        self._pending[message.get('channel')].append(pending)
+        if client_order_id is not None:
+            self._pending_orders[client_order_id] = pending
+
+        sent = False
+        try:
+            if trace is None:
+                await websocket.send(encode_message(message, self.codec))
+            else:
+                started = time.perf_counter_ns()
+                encoded = encode_message(message, self.codec)
+                trace.mark(STAGE_SERIALIZE, started)
+
+                serialized = time.perf_counter_ns()
+                await websocket.send(encoded)
+                trace.mark(STAGE_SEND, serialized)
+
+            sent = True
+
+            return await asyncio.wait_for(future, self._request_timeout)
+
+        except ConnectionClosed as e:
+            raise FlexfillsConnectException(str(e), sent=sent)
+
+        except FlexfillsConnectException as e:
+            # The connection dropped while waiting for the response
+            raise FlexfillsConnectException(str(e), sent=sent) from e
+
+        except asyncio.TimeoutError:
+            raise FlexfillsConnectException(
+                f"No response for {message.get('command')} {message.get('channel')} "
+                f"within {self._request_timeout} seconds", sent=True)
+
+        finally:
+            self._discard(pending)
+
+    async def subscribe(self, message, validator, callback=None, is_onetime=False):
+        """ Subscribes on the shared connection, registering the callback for streamed frames.
+        """
+
+        # Connect first, a new connection re-sends the recorded subscriptions
+        await self.connect()
+
+        key = subscription_key(message)
+        listener = None
+
+        if callback:
+            listener = self.add_listener(
+                message.get('channel'), callback, message_instruments(message))
+
+        self._subscriptions[key] = message
+
+        try:
+            resp = await self.request(message, validator, is_onetime)
+        except Exception:
+            self._subscriptions.pop(key, None)
+            self.remove_listener(listener)
+            raise
+
+        if isinstance(resp, dict) and resp.get('event') == 'ERROR':
+            self._subscriptions.pop(key, None)
+            self.remove_listener(listener)
+        else:
+            self._register(message)
+
+        return resp
+
+    async def ensure_subscribed(self, message, validator):
+        """ Subscribes only the instruments of the message that have no active or pending
+        subscription yet.
+
+        Returns:
+        -------
+        Return the subscribe response, an ERROR response, or None when nothing had to be sent.
+
+        """
+
+        channel = message.get('channel')
+        instruments = sorted(message_instruments(message) or [])
+
+        waiting = {self._subscribing[(channel, i)] for i in instruments
+                   if (channel, i) in self._subscribing}
+        missing = [i for i in self.registry.missing(channel, instruments)
+                   if (channel, i) not in self._subscribing]
+
+        resp = None
+        if missing:
+            future = asyncio.get_running_loop().create_future()
+            for instrument in missing:
+                self._subscribing[(channel, instrument)] = future
+
+            try:
+                resp = await self.subscribe(with_instruments(message, missing), validator, is_onetime=True)
+                future.set_result(resp)
+            except Exception as e:
+                future.set_exception(e)
+                future.exception()
+                raise
+            finally:
+                for instrument in missing:
+                    self._subscribing.pop((channel, instrument), None)
+
+            if resp.get('event') == 'ERROR':
+                return resp
+
+        for waited_resp in await asyncio.gather(*waiting):
+            if waited_resp.get('event') == 'ERROR':
+                return waited_resp
+
+        return resp
+
+    async def unsubscribe(self, message, validator, drop_listeners=True):
+        """ Unsubscribes the instruments of the message and, with drop_listeners, drops
+        their listeners.
+        """
+
+        channel = message.get('channel')
+        instruments = message_instruments(message)
+
+        self.registry.discard(channel, instruments)
+
+        for key, subscribed in list(self._subscriptions.items()):
+            if key[0] != channel:
+                continue
+
+            subscribed_instruments = message_instruments(subscribed)
+            if instruments is None or subscribed_instruments is None:
+                del self._subscriptions[key]
+                continue
+
+            remaining = subscribed_instruments - instruments
+            if remaining != subscribed_instruments:
+                del self._subscriptions[key]
+                if remaining:
+                    remaining_message = with_instruments(subscribed, remaining)
+                    self._subscriptions[subscription_key(
+                        remaining_message)] = remaining_message
+
+        # Channel wide listeners (no instruments) stay until removed explicitly
+        for listener in list(self._listeners.get(channel, [])):
+            if listener[0] is None or not drop_listeners:
+                continue
+
+            if instruments is None:
+                self.remove_listener(listener)
+                continue
+
+            listener[0] = listener[0] - instruments
+            if not listener[0]:
+                self.remove_listener(listener)
+
+        return await self.request(message, validator)
+
+    def add_listener(self, channel, callback, instruments=None, inline=False):
+        """ Registers a callback for the frames of the channel (and instruments). Inline
+        callbacks run in the reader and must be cheap, the others go through the dispatcher.
+        """
+
+        listener = [set(instruments) if instruments else None, callback, channel, inline]
+        self._listeners[channel].append(listener)
+
+        return listener
+
+    def remove_listener(self, listener):
+        if listener is None:
+            return
+
+        listeners = self._listeners.get(listener[2], [])
+        if listener in listeners:
+            listeners.remove(listener)
+
+        # Frames already queued for the listener are skipped
+        listener[1] = None
+
+    # Protected Methods
+
+    def _register(self, message):
+        instruments = message_instruments(message)
+        if instruments:
+            self.registry.add(message.get('channel'), instruments)
+
+    async def _open(self):
+        kwargs = {'extra_headers': self._auth_header}
+        if self._socket_url.startswith('wss'):
+            kwargs['ssl'] = self._ssl_context
+
+        attempts = 0
+        while True:
+            self.breaker.check()
+
+            try:
+                websocket = await websockets.connect(self._socket_url, **kwargs)
+                self.breaker.record_success()
+
+                return websocket
+
+            except InvalidStatusCode as e:
+                print(f"Error while connecting FlexfillsApi: {str(e)}")
+
+                # A rejected token fails the same way on every attempt until it is renewed
+                if e.status_code in (401, 403):
+                    raise FlexfillsAuthException(str(e))
+
+                self.breaker.record_failure()
+                raise FlexfillsConnectException(str(e))
+
+            except (OSError, asyncio.TimeoutError) as e:
+                attempts += 1
+                self.breaker.record_failure()
+                print(f"Error while connecting FlexfillsApi: {str(e)}")
+
+                if attempts >= self._max_retries:
+                    raise FlexfillsConnectException(str(e))
+
+                await asyncio.sleep(self.backoff.delay(attempts))
+
+    async def _read_loop(self, websocket):
+        reason = ''
+        try:
+            async for response in websocket:
+                if self.recorder is not None:
+                    self.recorder(response)
+
+                waiter = self._on_frame(response)
+
+                # The queue of a BLOCK channel is full, stop reading until it drains
+                if waiter is not None:
+                    await waiter
+        except ConnectionClosed as e:
+            reason = str(e)
+        except Exception as e:
+            # The recorder, a frame handler or the dispatcher failed, the reader stops here
+            reason = f"{type(e).__name__}: {str(e)}"
+            print(f"FlexfillsApi reader failed: {reason}")
+
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+
+        if websocket is not self._websocket:
+            return
+
+        self._websocket = None
+        self.registry.clear()
+        self._fail_pending(FlexfillsConnectException(
+            f"Flexfills API connection was closed: {reason}"))
+
+        if self._closed or not self._subscriptions:
+            return
+
+        print("Flexfills API connection was closed, reconnecting...")
+
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        """ Restores the connection and its subscriptions in the background, backing
+        off between attempts, until it succeeds or the session is closed.
+        """
+
+        attempts = 0
+        while not self._closed and self._subscriptions and not self.connected:
+            try:
+                await self.connect()
+                print("FlexfillsApi reconnected, subscriptions restored")
+                return
+
+            except FlexfillsAuthException as e:
+                # Left to the next call, which logs in again
+                print(f"Could not reconnect FlexfillsApi: {str(e)}")
+                return
+
+            except FlexfillsConnectException as e:
+                attempts += 1
+                delay = max(self.backoff.delay(attempts), self.breaker.retry_after())
+                print(f"Could not reconnect FlexfillsApi, retrying in {delay:.1f} seconds: {str(e)}")
+
+                await asyncio.sleep(delay)
+
+    def _on_frame(self, response):
+        try:
+            frame = self.codec.loads(response)
+        except ValueError:
+            print(f"Invalid frame received from FlexfillsApi: {response!r}")
+            return
+
+        if not isinstance(frame, dict):
+            return
+
+        self._resolve(frame)
+
+        return self._notify(frame)
+
+    def _resolve(self, frame):
+        client_order_ids = frame_client_order_ids(frame)
+
+        matched = False
+        for client_order_id in client_order_ids:
+            pending = self._pending_orders.get(client_order_id)
+            if pending is not None:
+                self._feed(pending, frame)
+                matched = True
+
+        if matched:
+            return
+
+        channel = frame.get('channel')
+        if channel is None:
+            queues = [queue for queue in self._pending.values() if queue]
+        else:
+            queues = [self._pending.get(channel)]
+
+        for queue in queues:
+            if not queue:
+                continue
+
+            streaming = self._is_streaming(queue[0].message.get('channel'), queue)
+
+            for pending in queue:
+                if pending.future.done():
+                    continue
+
+                # Order requests only take ACK/ERROR frames that name no order,
+                # data about other orders must not resolve them
+                if pending.client_order_id is not None and (
+                        client_order_ids or frame.get('event') not in ('ACK', 'ERROR')):
+                    continue
+
+                if not self._answers(pending, frame, streaming):
+                    continue
+
+                self._feed(pending, frame)
+                return
+
+    def _answers(self, pending, frame, streaming):
+        """ Returns whether the frame can be the response of the pending request.
+        """
+
+        command = frame.get('command')
+        if command is not None:
+            return command == pending.message.get('command')
+
+        # ACK and ERROR events are never streamed, and without a live subscription
+        # on the channel every frame answers a request
+        if frame.get('event') is not None or not streaming:
+            return True
+
+        # Streamed frames carry no command, on a live channel a request only takes a
+        # frame about its own orders, or a subscription change about its instruments
+        if pending.message.get('command') not in ('SUBSCRIBE', 'UNSUBSCRIBE'):
+            return bool(_order_ids(pending.message) & _order_ids(frame))
+
+        instruments = frame_instruments(frame)
+        wanted = message_instruments(pending.message)
+
+        return instruments is None or (wanted is not None and instruments <= wanted)
+
+    def _is_streaming(self, channel, queue):
+        """ Returns whether the channel has a subscription whose response is not pending.
+        """
+
+        pending_messages = [pending.message for pending in queue]
+
+        return any(key[0] == channel and not any(message is pending for pending in pending_messages)
+                   for key, message in self._subscriptions.items())
+
+    def _feed(self, pending, frame):
+        if pending.future.done():
+            return
+
+        is_final, validated_resp = pending.validator(frame, pending.message)
+        pending.frames += 1
+
+        if pending.trace is not None:
+            if frame.get('event') == 'ACK':
+                pending.trace.mark(STAGE_ACK)
+            if is_final:
+                pending.trace.mark(STAGE_RESPONSE)
+
+        if is_final or pending.is_onetime or (
+                pending.max_frames is not None and pending.frames > pending.max_frames):
+            pending.future.set_result(validated_resp)
+            self._discard(pending)
+
+    def _discard(self, pending):
+        queue = self._pending.get(pending.message.get('channel'))
+        if queue and pending in queue:
+            queue.remove(pending)
+
+        if self._pending_orders.get(pending.client_order_id) is pending:
+            del self._pending_orders[pending.client_order_id]
+
+    def _fail_pending(self, exception):
+        for queue in list(self._pending.values()):
+            for pending in list(queue):
+                if not pending.future.done():
+                    pending.future.set_exception(exception)
+
+        self._pending.clear()
+        self._pending_orders.clear()
+
+    def _notify(self, frame):
+        listeners = self._listeners.get(frame.get('channel'))
+        if not listeners:
+            return
+
+        instruments = frame_instruments(frame)
+
+        queued = []
+        for listener in list(listeners):
+            wanted, callback = listener[0], listener[1]
+            if wanted and instruments and not (wanted & instruments):
+                continue
+
+            if not listener[3]:
+                queued.append(listener)
+                continue
+
+            try:
+                callback(frame)
+            except Exception as e:
+                print(f"Error in FlexfillsApi callback: {str(e)}")
+
+        if queued:
+            return self.dispatcher.dispatch(
+                frame, queued, frozenset(instruments) if instruments else None)
+
+        return None
+
+
+class EventLoopThread:
+    """
+    Runs an asyncio event loop in a daemon thread so the blocking API can keep a
+    session and its subscriptions alive between calls.
+    """
+
+    def __init__(self, name='FlexfillsApiLoop'):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_loop, name=name, daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def is_alive(self):
+        return self._thread.is_alive() and not self.loop.is_closed()
+
+    def run(self, coro):
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError(
+                'Blocking FlexfillsApi calls cannot be made from a subscription callback')
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def iterate(self, agen):
+        """ Iterates an async generator on the loop from a blocking generator. Items are
+        pulled one at a time, so the generator only runs ahead of the consumer as far as
+        its own queues allow.
+        """
+
+        done = object()
+
+        async def next_item():
+            try:
+                return await agen.__anext__()
+            except StopAsyncIteration:
+                return done
+
+        async def close():
+            await agen.aclose()
+
+        future = None
+        try:
+            while True:
+                future = asyncio.run_coroutine_threadsafe(next_item(), self.loop)
+                item = future.result()
+                if item is done:
+                    return
+
+                yield item
+        finally:
+            # Interrupted while an item was fetched, cancelling it closes the generator
+            if future is not None and not future.done():
+                future.cancel()
+            elif self.loop.is_running():
+                asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+
+    def stop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_shared_loop_thread = None
+_shared_loop_lock = threading.Lock()
+
+
+def shared_loop_thread():
+    """ Returns the process wide EventLoopThread of the FlexfillsApi accounts, started
+    on first use. One loop thread serves the connections of every account.
+    """
+
+    global _shared_loop_thread
+
+    with _shared_loop_lock:
+        if _shared_loop_thread is None or not _shared_loop_thread.is_alive():
+            _shared_loop_thread = EventLoopThread('FlexfillsApiSharedLoop')
+
+        return _shared_loop_thread
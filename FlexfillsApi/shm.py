@@ -0,0 +1,588 @@
+import argparse
+import collections
+import os
+import struct
+import threading
+import time
+from array import array
+from multiprocessing import shared_memory
+
+from .constants import (CH_ORDER_BOOK_PUBLIC, CH_TRADE_PUBLIC, shm_ring_name, shm_ring_slots,
+                        shm_book_depth)
+from .exceptions import FlexfillsParamsException
+from .orderbook import OrderBook
+from .records import frame_items, first
+
+# Ring layout: a header, the head sequence on its own cache line, then fixed-size slots.
+# A slot starts with its seqlock word: 2 * sequence - 1 while written, 2 * sequence once done.
+MAGIC = b'FFSHMMD\x01'
+
+_HEADER = struct.Struct('<8sIIIxxxxQ')  # magic, slot size, slot count, book depth, epoch
+_EPOCH_OFFSET = 24  # Set to 0 when the gateway closes the ring
+_HEAD_OFFSET = 64
+_SLOTS_OFFSET = 128
+
+_U64 = struct.Struct('<Q')
+_RECORD = struct.Struct('<BBHHxxqq32s')  # kind, side, bid depth, ask depth, timestamp, received, instrument
+_TRADE = struct.Struct('<dd32s')  # price, amount, trade id
+
+_RECORD_OFFSET = 8
+_PAYLOAD_OFFSET = 64
+
+KIND_BOOK = 1
+KIND_TRADE = 2
+
+_SIDES = {'BUY': 1, 'SELL': 2}
+_SIDE_NAMES = {1: 'BUY', 2: 'SELL'}
+
+_INSTRUMENT_KEYS = ('globalInstrumentCd', 'instrument')
+_PRICE_KEYS = ('price', 'px')
+_AMOUNT_KEYS = ('amount', 'quantity', 'size', 'volume')
+_SIDE_KEYS = ('direction', 'side')
+_TIMESTAMP_KEYS = ('timestamp', 'ts', 'time')
+_TRADE_ID_KEYS = ('tradeId', 'id')
+
+# Prices and sizes of a book record are arrays ('d'), best level first
+BookRecord = collections.namedtuple(
+    'BookRecord', ['sequence', 'instrument', 'timestamp', 'received', 'bid_prices', 'bid_sizes',
+                   'ask_prices', 'ask_sizes'])
+
+TradeRecord = collections.namedtuple(
+    'TradeRecord', ['sequence', 'instrument', 'timestamp', 'received', 'price', 'amount',
+                    'direction', 'trade_id'])
+
+
+def slot_size(depth):
+    # The payload holds the bid prices, bid sizes, ask prices and ask sizes of a book
+    return _PAYLOAD_OFFSET + 4 * 8 * depth
+
+
+def _number(value, cast=float):
+    try:
+        return cast(float(value))
+    except (TypeError, ValueError):
+        return cast(0)
+
+
+# Rings created by the publishers of this process
+_created = set()
+
+
+def _doubles(data, offset, count):
+    values = array('d')
+    values.frombytes(data[offset:offset + 8 * count])
+
+    return values
+
+
+def _attach(name):
+    """ Opens an existing segment without handing it to the resource tracker of this
+    process, which would remove it from under the gateway when the reader exits.
+    """
+
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        pass
+
+    memory = shared_memory.SharedMemory(name)
+
+    # The tracker of this process already holds the rings it created
+    if name in _created:
+        return memory
+
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(memory._name, 'shared_memory')
+    except (ImportError, AttributeError, KeyError):
+        pass
+
+    return memory
+
+
+class MarketDataPublisher:
+    """
+    Single writer of a shared memory ring of fixed-size book and trade records.
+    Every record is published under the seqlock of its slot, then the head sequence
+    is advanced; readers never block the writer, which overwrites the oldest slot
+    when the ring is full. Use from one thread only.
+    """
+
+    def __init__(self, name=shm_ring_name, slots=shm_ring_slots, depth=shm_book_depth):
+        self.name = name
+        self.slots = slots
+        self.depth = depth
+        self.slot_size = slot_size(depth)
+
+        self.published = 0
+
+        size = _SLOTS_OFFSET + slots * self.slot_size
+        try:
+            self._memory = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left over by a gateway that did not stop cleanly
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self._memory = shared_memory.SharedMemory(name, create=True, size=size)
+
+        self._buffer = self._memory.buf
+        self._doubles = self._buffer.cast('d')  # Slots are 8 byte aligned
+        self._head = 0
+        self._instruments = {}
+
+        _created.add(name)
+
+        _HEADER.pack_into(self._buffer, 0, MAGIC, self.slot_size, slots, depth, time.time_ns())
+        _U64.pack_into(self._buffer, _HEAD_OFFSET, 0)
+
+    def publish_book(self, book):
+        """ Publishes the best depth levels of an OrderBook.
+        """
+
+        depth = self.depth
+        bid_depth = min(book.bid_depth, depth)
+        ask_depth = min(book.ask_depth, depth)
+
+        offset = self._begin()
+        buffer = self._buffer
+
+        _RECORD.pack_into(buffer, offset + _RECORD_OFFSET, KIND_BOOK, 0, bid_depth, ask_depth,
+                          _number(book.timestamp, int), time.time_ns(),
+                          self._instrument(book.instrument))
+
+        # Copied straight from the arrays of the book, without a Python loop over the levels
+        doubles = self._doubles
+        position = (offset + _PAYLOAD_OFFSET) // 8
+        for values, count in ((book.bid_prices, bid_depth), (book.bid_sizes, bid_depth),
+                              (book.ask_prices, ask_depth), (book.ask_sizes, ask_depth)):
+            doubles[position:position + count] = values if len(values) == count else \
+                memoryview(values)[:count]
+            position += depth
+
+        self._commit(offset)
+
+    def publish_trade(self, instrument, price, amount, direction=None, timestamp=None,
+                      trade_id=None):
+        offset = self._begin()
+        buffer = self._buffer
+
+        _RECORD.pack_into(buffer, offset + _RECORD_OFFSET, KIND_TRADE,
+                          _SIDES.get(str(direction).upper(), 0), 0, 0, _number(timestamp, int),
+                          time.time_ns(), self._instrument(instrument))
+        _TRADE.pack_into(buffer, offset + _PAYLOAD_OFFSET, float(price), float(amount),
+                         str(trade_id if trade_id is not None else '').encode('utf-8')[:32])
+
+        self._commit(offset)
+
+    def close(self, unlink=True):
+        if self._memory is None:
+            return
+
+        # Tells the readers to attach to the ring of the next gateway
+        _U64.pack_into(self._buffer, _EPOCH_OFFSET, 0)
+
+        self._doubles.release()
+        self._doubles = None
+        self._buffer = None
+        self._memory.close()
+
+        if unlink:
+            self._memory.unlink()
+            _created.discard(self.name)
+
+        self._memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Protected Methods
+
+    def _instrument(self, instrument):
+        encoded = self._instruments.get(instrument)
+        if encoded is None:
+            encoded = self._instruments[instrument] = str(instrument).encode('utf-8')[:32]
+
+        return encoded
+
+    def _begin(self):
+        sequence = self._head + 1
+        offset = _SLOTS_OFFSET + (sequence - 1) % self.slots * self.slot_size
+
+        _U64.pack_into(self._buffer, offset, 2 * sequence - 1)
+
+        return offset
+
+    def _commit(self, offset):
+        self._head += 1
+
+        _U64.pack_into(self._buffer, offset, 2 * self._head)
+        _U64.pack_into(self._buffer, _HEAD_OFFSET, self._head)
+
+        self.published += 1
+
+
+class MarketDataReader:
+    """
+    Attaches to the ring of a market data gateway, in any process of the host. Reads
+    are lock-free: a record is copied out of its slot and kept only if the seqlock
+    was unchanged around the copy. Records overwritten before they were read are
+    counted in missed, every jump over them in gaps. The latest book of every
+    instrument read is kept in books.
+    """
+
+    def __init__(self, name=shm_ring_name, start='oldest'):
+        self.name = name
+
+        self._memory = _attach(name)
+        self._buffer = self._memory.buf
+
+        magic, self.slot_size, self.slots, self.depth, self._epoch = _HEADER.unpack_from(
+            self._buffer, 0)
+        if magic != MAGIC:
+            self.close()
+            raise FlexfillsParamsException(f"{name} is not a FlexfillsApi market data ring")
+
+        self.gaps = 0
+        self.missed = 0
+        self.books = {}
+
+        head = self._read_head()
+        if start == 'latest':
+            self._next = head + 1
+        else:
+            self._next = max(1, head - self.slots + 2)
+
+    def read(self, limit=None):
+        """ Returns the records published since the last read, oldest first.
+
+        Parameters:
+        ----------
+        limit: Maximum number of records returned, the rest are left for the next read.
+
+        Returns:
+        -------
+        Return a list of BookRecord and TradeRecord.
+
+        """
+
+        buffer = self._buffer
+        slots = self.slots
+        size = self.slot_size
+        unpack_from = _U64.unpack_from
+
+        # The gateway closed the ring, follow it to the ring of its restart
+        if unpack_from(buffer, _EPOCH_OFFSET)[0] != self._epoch:
+            if not self._reattach():
+                return []
+
+            buffer = self._buffer
+            slots = self.slots
+            size = self.slot_size
+
+        head = self._read_head()
+
+        records = []
+        sequence = self._next
+
+        while sequence <= head and (limit is None or len(records) < limit):
+            # Lapped by the writer, the oldest records are gone
+            if head - sequence >= slots - 1:
+                self._skip(sequence, head - slots + 2)
+                sequence = head - slots + 2
+                continue
+
+            offset = _SLOTS_OFFSET + (sequence - 1) % slots * size
+
+            before = unpack_from(buffer, offset)[0]
+            if before != 2 * sequence:
+                if before < 2 * sequence:
+                    break
+
+                # Overwritten since the head was read
+                head = self._read_head()
+                continue
+
+            data = bytes(buffer[offset:offset + size])
+
+            if unpack_from(buffer, offset)[0] != before:
+                head = self._read_head()
+                continue
+
+            records.append(self._decode(sequence, data))
+            sequence += 1
+
+        self._next = sequence
+
+        return records
+
+    def poll(self, timeout=None, interval=0.0005):
+        """ Waits until records are published (or timeout seconds passed) and returns them.
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            records = self.read()
+            if records:
+                return records
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return records
+
+            time.sleep(interval)
+
+    def __iter__(self):
+        while True:
+            yield from self.poll()
+
+    def order_book(self, instrument):
+        return self.books.get(instrument)
+
+    @property
+    def head(self):
+        return self._read_head()
+
+    @property
+    def lag(self):
+        """ Records published and not read yet.
+        """
+
+        return max(self._read_head() - self._next + 1, 0)
+
+    def close(self):
+        if self._memory is None:
+            return
+
+        self._buffer = None
+        self._memory.close()
+        self._memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Protected Methods
+
+    def _read_head(self):
+        return _U64.unpack_from(self._buffer, _HEAD_OFFSET)[0]
+
+    def _skip(self, sequence, to):
+        self.gaps += 1
+        self.missed += to - sequence
+
+    def _reattach(self):
+        try:
+            memory = _attach(self.name)
+        except FileNotFoundError:
+            return False
+
+        magic, slot_size, slots, depth, epoch = _HEADER.unpack_from(memory.buf, 0)
+        if magic != MAGIC or epoch in (0, self._epoch):
+            memory.close()
+            return False
+
+        self._buffer = None
+        self._memory.close()
+
+        self._memory = memory
+        self._buffer = memory.buf
+        self.slot_size, self.slots, self.depth, self._epoch = slot_size, slots, depth, epoch
+
+        # Records published before the reader caught up with the new ring are lost
+        self.gaps += 1
+        self._next = 1
+
+        return True
+
+    def _decode(self, sequence, data):
+        kind, side, bid_depth, ask_depth, timestamp, received, instrument = _RECORD.unpack_from(
+            data, _RECORD_OFFSET)
+        instrument = instrument.rstrip(b'\x00').decode('utf-8')
+
+        if kind == KIND_TRADE:
+            price, amount, trade_id = _TRADE.unpack_from(data, _PAYLOAD_OFFSET)
+
+            return TradeRecord(sequence, instrument, timestamp, received, price, amount,
+                               _SIDE_NAMES.get(side), trade_id.rstrip(b'\x00').decode('utf-8'))
+
+        step = 8 * self.depth
+        bid_prices = _doubles(data, _PAYLOAD_OFFSET, bid_depth)
+        bid_sizes = _doubles(data, _PAYLOAD_OFFSET + step, bid_depth)
+        ask_prices = _doubles(data, _PAYLOAD_OFFSET + 2 * step, ask_depth)
+        ask_sizes = _doubles(data, _PAYLOAD_OFFSET + 3 * step, ask_depth)
+
+        book = self.books.get(instrument)
+        if book is None:
+            book = self.books[instrument] = OrderBook(instrument, self.depth)
+
+        book.load(bid_prices, bid_sizes, ask_prices, ask_sizes, timestamp)
+
+        return BookRecord(sequence, instrument, timestamp, received,
+                          bid_prices, bid_sizes, ask_prices, ask_sizes)
+
+
+class AsyncMarketDataGateway:
+    """
+    Publishes the order books and public trades received by a client into a shared
+    memory ring, so the other processes of the host read them with a MarketDataReader
+    instead of holding their own connection. Books are published from the local
+    order book store after every ORDER_BOOK_PUBLIC frame, trades as they arrive.
+    """
+
+    def __init__(self, client, name=shm_ring_name, slots=shm_ring_slots, depth=shm_book_depth):
+        self._client = client
+
+        self.name = name
+        self.slots = slots
+        self.depth = depth
+
+        self.publisher = None
+        self.instruments = []
+        self._listeners = []
+
+    async def start(self, instruments, trades=True):
+        """ Creates the ring and subscribes the order books (and public trades) of the instruments.
+
+        Parameters:
+        ----------
+        instruments: list of pair of currencies.
+        trades: Also publish the public trades of the instruments.
+
+        """
+
+        if self.publisher is None:
+            self.publisher = MarketDataPublisher(self.name, self.slots, self.depth)
+
+        instruments = [i for i in dict.fromkeys(instruments) if i not in self.instruments]
+        if not instruments:
+            return self
+
+        session = self._client._session
+
+        # After the order book store listener, so the books are already updated
+        self._listeners.append(session.add_listener(
+            CH_ORDER_BOOK_PUBLIC, self._on_book, instruments, inline=True))
+        await self._client.subscribe_order_books(instruments)
+
+        if trades:
+            self._listeners.append(session.add_listener(
+                CH_TRADE_PUBLIC, self._on_trade, instruments, inline=True))
+            await self._client.trade_book_public(instruments)
+
+        self.instruments += instruments
+
+        return self
+
+    async def stop(self):
+        for listener in self._listeners:
+            self._client._session.remove_listener(listener)
+
+        self._listeners = []
+        self.instruments = []
+
+        if self.publisher is not None:
+            self.publisher.close()
+            self.publisher = None
+
+    # Protected Methods
+
+    def _on_book(self, frame):
+        store = self._client.order_book_store
+
+        for item in frame_items(frame):
+            book = store.get(first(item, _INSTRUMENT_KEYS))
+            if book is not None:
+                self.publisher.publish_book(book)
+
+    def _on_trade(self, frame):
+        for item in frame_items(frame):
+            instrument = first(item, _INSTRUMENT_KEYS)
+            price = first(item, _PRICE_KEYS)
+            if instrument is None or price is None:
+                continue
+
+            self.publisher.publish_trade(
+                instrument, _number(price), _number(first(item, _AMOUNT_KEYS)),
+                first(item, _SIDE_KEYS), first(item, _TIMESTAMP_KEYS),
+                first(item, _TRADE_ID_KEYS))
+
+
+class MarketDataGateway:
+    """
+    Blocking twin of AsyncMarketDataGateway for FlexfillsApiClient and FlexfillsApi.
+    """
+
+    def __init__(self, client, name=shm_ring_name, slots=shm_ring_slots, depth=shm_book_depth):
+        client = getattr(client, 'flexfills_api', client)
+
+        self._loop_thread = client._loop_thread
+        self._gateway = AsyncMarketDataGateway(client._client, name, slots, depth)
+
+    @property
+    def publisher(self):
+        return self._gateway.publisher
+
+    @property
+    def instruments(self):
+        return self._gateway.instruments
+
+    def start(self, instruments, trades=True):
+        self._loop_thread.run(self._gateway.start(instruments, trades))
+
+        return self
+
+    def stop(self):
+        return self._loop_thread.run(self._gateway.stop())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    from .auth import get_auth_token
+    from .flexfillsapi import FlexfillsApiClient
+
+    parser = argparse.ArgumentParser(
+        description='Publish FlexFills market data into a shared memory ring for local readers.')
+    parser.add_argument('instruments', nargs='+')
+    parser.add_argument('--name', default=shm_ring_name)
+    parser.add_argument('--slots', type=int, default=shm_ring_slots)
+    parser.add_argument('--depth', type=int, default=shm_book_depth)
+    parser.add_argument('--no-trades', action='store_true')
+    parser.add_argument('--username', default=os.environ.get('FLEXFILLS_USERNAME'))
+    parser.add_argument('--password', default=os.environ.get('FLEXFILLS_PASSWORD'))
+    parser.add_argument('--test', action='store_true', help='use the FlexFills test environment')
+    parser.add_argument('--socket-url', default=None)
+    parser.add_argument('--gateway-host', default=None)
+    args = parser.parse_args()
+
+    auth_token = get_auth_token(args.username, args.password, args.test, args.gateway_host)
+    client = FlexfillsApiClient(auth_token, args.test, socket_url=args.socket_url,
+                                gateway_host=args.gateway_host)
+
+    gateway = MarketDataGateway(client, args.name, args.slots, args.depth)
+    gateway.start(args.instruments, not args.no_trades)
+
+    print(f"FlexfillsApi market data gateway publishing {', '.join(args.instruments)} "
+          f"to {args.name}", flush=True)
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.stop()
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,458 @@
+import asyncio
+import collections
+import time
+
+from .constants import CH_PRV_BALANCE, CH_PRV_TRADE_PRIVATE, state_reconcile_interval
+from .exceptions import FlexfillsParamsException
+from .records import items, first
+
+# Order statuses after which an order is no longer open
+FINAL_STATUSES = frozenset(['FILLED', 'CANCELLED', 'CANCELED', 'REJECTED', 'EXPIRED',
+                            'COMPLETED', 'CLOSED'])
+
+_INSTRUMENT_KEYS = ('globalInstrumentCd', 'instrument')
+_CURRENCY_KEYS = ('currency', 'asset', 'code')
+_FILLED_KEYS = ('filledAmount', 'filledQuantity', 'executedAmount', 'cumQty')
+_AVAILABLE_KEYS = ('available', 'availableAmount', 'free', 'amount', 'balance', 'total')
+_TOTAL_KEYS = ('total', 'balance', 'amount')
+_POSITION_KEYS = ('amount', 'quantity', 'position', 'size', 'netAmount')
+
+
+def _float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def order_key(order):
+    """ Returns the key of an order in the mirror: its clientOrderId, else its orderId.
+    """
+
+    key = order.get('clientOrderId')
+    if key is None:
+        key = order.get('orderId')
+
+    return str(key) if key is not None else None
+
+
+class PrivateStateMirror:
+    """
+    Local copy of the private state of the account: open orders, positions and
+    balances. It is loaded from snapshots and kept current by the TRADE_PRIVATE
+    and BALANCE frames, so queries are dict lookups. Fills move the position of
+    their instrument by the newly filled amount of orders seen open, which keeps
+    repeated or historical records from counting twice.
+
+    Snapshots reconcile the mirror: anything not updated by the stream since the
+    snapshot was requested (started, a time.monotonic() value) is replaced by it.
+    """
+
+    def __init__(self):
+        self._orders = {}
+        self._by_instrument = collections.defaultdict(dict)
+        self._by_order_id = {}
+        self._filled = {}
+        self._touched = {}
+
+        self._positions = {}
+        self._position_records = {}
+        self._positions_touched = {}
+
+        self._balances = {}
+
+        self.updates = 0
+        self.corrections = 0
+        self.reconciled_at = None
+
+    # Queries
+
+    def open_orders(self, instrument=None):
+        if instrument is not None:
+            return list(self._by_instrument.get(instrument, {}).values())
+
+        return list(self._orders.values())
+
+    def order(self, client_order_id):
+        """ Returns the open order of a clientOrderId, or None.
+        """
+
+        return self._orders.get(str(client_order_id))
+
+    def order_by_id(self, order_id):
+        key = self._by_order_id.get(str(order_id))
+
+        return self._orders.get(key) if key is not None else None
+
+    def position(self, instrument):
+        """ Returns the net position amount of the instrument, 0 when flat or unknown.
+        """
+
+        return self._positions.get(instrument, 0.0)
+
+    def positions(self):
+        return dict(self._positions)
+
+    def balance(self, currency):
+        """ Returns the last balance record of the currency, or None.
+        """
+
+        return self._balances.get(currency)
+
+    def available(self, currency):
+        """ Returns the available amount of the currency, 0 when unknown.
+        """
+
+        record = self._balances.get(currency)
+        if record is None:
+            return 0.0
+
+        return _float(first(record, _AVAILABLE_KEYS))
+
+    def balances(self):
+        return {currency: _float(first(record, _TOTAL_KEYS))
+                for currency, record in self._balances.items()}
+
+    # Stream updates
+
+    def apply(self, frame):
+        """ Applies a TRADE_PRIVATE or BALANCE frame.
+        """
+
+        channel = frame.get('channel')
+        if frame.get('event') == 'ERROR':
+            return
+
+        if channel == CH_PRV_TRADE_PRIVATE:
+            for item in items(frame):
+                self.apply_order(item)
+
+        elif channel == CH_PRV_BALANCE:
+            for item in items(frame):
+                self.apply_balance(item)
+
+    __call__ = apply
+
+    def apply_order(self, order, touched=None):
+        key = order_key(order)
+        if key is None:
+            return
+
+        touched = touched or time.monotonic()
+        status = str(order.get('status') or '').upper()
+        previous = self._orders.get(key)
+
+        if previous is None and key not in self._filled:
+            # Historical records of orders never seen open are not part of the live state
+            if status in FINAL_STATUSES:
+                return
+
+            # Fills made before the order was seen are already in the positions
+            self._filled[key] = self._filled_amount(order, status)
+
+        self.updates += 1
+        self._touched[key] = touched
+
+        merged = dict(previous, **order) if previous is not None else dict(order)
+        self._apply_fill(key, merged, status, touched)
+
+        if status in FINAL_STATUSES:
+            self._remove(key)
+            self._filled.pop(key, None)
+        else:
+            self._store(key, merged)
+
+    def apply_balance(self, record):
+        currency = first(record, _CURRENCY_KEYS)
+        if currency is None:
+            return
+
+        self.updates += 1
+
+        currency = str(currency)
+        previous = self._balances.get(currency)
+        self._balances[currency] = dict(previous, **record) if previous is not None else dict(record)
+
+    # Snapshots
+
+    def load_orders(self, resp, started=None):
+        """ Reconciles the open orders with a snapshot of the open orders.
+        Returns the number of orders corrected.
+        """
+
+        started = started or time.monotonic()
+        snapshot = {order_key(order): order for order in items(resp) if order_key(order) is not None}
+
+        corrections = 0
+
+        # Open locally, gone on the server
+        for key in list(self._orders):
+            if key not in snapshot and self._touched.get(key, 0) < started:
+                self._remove(key)
+                self._filled.pop(key, None)
+                corrections += 1
+
+        for key, order in snapshot.items():
+            if self._touched.get(key, 0) >= started:
+                continue
+
+            if self._orders.get(key) != order:
+                corrections += 1
+
+            self._store(key, dict(order))
+            self._filled[key] = self._filled_amount(order, str(order.get('status') or '').upper())
+
+        # Closed orders are remembered until then, so an older snapshot cannot reopen them
+        for key, touched in list(self._touched.items()):
+            if touched < started and key not in self._orders:
+                del self._touched[key]
+
+        return self._reconciled(corrections)
+
+    def load_positions(self, resp, started=None):
+        """ Reconciles the positions with a TRADE_POSITIONS snapshot. Returns the number
+        of positions corrected.
+        """
+
+        started = started or time.monotonic()
+
+        corrections = 0
+        seen = set()
+        for record in items(resp):
+            instrument = first(record, _INSTRUMENT_KEYS)
+            if instrument is None:
+                continue
+
+            instrument = str(instrument)
+            seen.add(instrument)
+
+            if self._positions_touched.get(instrument, 0) >= started:
+                continue
+
+            amount = _float(first(record, _POSITION_KEYS))
+            if self._positions.get(instrument) != amount:
+                corrections += 1
+
+            self._positions[instrument] = amount
+            self._position_records[instrument] = record
+
+        for instrument in list(self._positions):
+            if instrument not in seen and self._positions_touched.get(instrument, 0) < started:
+                if self._positions.pop(instrument):
+                    corrections += 1
+                self._position_records.pop(instrument, None)
+
+        return self._reconciled(corrections)
+
+    def load_balances(self, resp):
+        """ Replaces the balances of the currencies in a BALANCE snapshot.
+        """
+
+        for record in items(resp):
+            self.apply_balance(record)
+
+    def clear(self):
+        self.__init__()
+
+    # Protected Methods
+
+    def _store(self, key, order):
+        previous = self._orders.get(key)
+        if previous is not None:
+            self._unindex(key, previous)
+
+        self._orders[key] = order
+
+        instrument = first(order, _INSTRUMENT_KEYS)
+        if instrument is not None:
+            self._by_instrument[str(instrument)][key] = order
+
+        if order.get('orderId') is not None:
+            self._by_order_id[str(order['orderId'])] = key
+
+    def _remove(self, key):
+        order = self._orders.pop(key, None)
+        if order is not None:
+            self._unindex(key, order)
+
+    def _unindex(self, key, order):
+        instrument = first(order, _INSTRUMENT_KEYS)
+        if instrument is not None:
+            orders = self._by_instrument.get(str(instrument))
+            if orders is not None:
+                orders.pop(key, None)
+                if not orders:
+                    del self._by_instrument[str(instrument)]
+
+        if order.get('orderId') is not None and self._by_order_id.get(str(order['orderId'])) == key:
+            del self._by_order_id[str(order['orderId'])]
+
+    @staticmethod
+    def _filled_amount(order, status):
+        filled = first(order, _FILLED_KEYS)
+        if filled is None and status == 'FILLED':
+            filled = order.get('amount')
+
+        return _float(filled)
+
+    def _apply_fill(self, key, order, status, touched):
+        filled = self._filled_amount(order, status)
+        delta = filled - self._filled.get(key, 0.0)
+        if delta <= 0:
+            return
+
+        self._filled[key] = filled
+
+        instrument = first(order, _INSTRUMENT_KEYS)
+        if instrument is None:
+            return
+
+        instrument = str(instrument)
+        sign = -1.0 if str(order.get('direction')).upper() == 'SELL' else 1.0
+
+        self._positions[instrument] = self._positions.get(instrument, 0.0) + sign * delta
+        self._positions_touched[instrument] = touched
+
+    def _reconciled(self, corrections):
+        self.corrections += corrections
+        self.reconciled_at = time.time()
+
+        return corrections
+
+
+class AsyncPrivateState:
+    """
+    Keeps a PrivateStateMirror of a client current: start() subscribes TRADE_PRIVATE
+    and BALANCE, loads the open orders, positions and balances once and then
+    reconciles the open orders and positions with the server every
+    reconcile_interval seconds. Balances follow the BALANCE stream.
+    """
+
+    def __init__(self, client, mirror=None):
+        self._client = client
+        self.mirror = mirror or PrivateStateMirror()
+
+        self.instruments = []
+        self.currencies = []
+        self.reconcile_interval = state_reconcile_interval
+
+        self._listeners = []
+        self._task = None
+
+    @property
+    def started(self):
+        return bool(self._listeners)
+
+    async def start(self, instruments, currencies=None, reconcile_interval=state_reconcile_interval):
+        """ Subscribes the private channels and loads the snapshots.
+
+        Parameters:
+        ----------
+        instruments: list of pair of currencies traded.
+        currencies: list of currencies of the balances, none by default.
+        reconcile_interval: Seconds between reconciliations, None to never reconcile.
+
+        Returns:
+        -------
+        Return the PrivateStateMirror.
+
+        """
+
+        if not instruments:
+            raise FlexfillsParamsException("instruments should not be empty")
+
+        self.instruments = list(instruments)
+        self.currencies = list(currencies or [])
+        self.reconcile_interval = reconcile_interval
+
+        if not self._listeners:
+            session = self._client._session
+            self._listeners = [
+                session.add_listener(CH_PRV_TRADE_PRIVATE, self.mirror.apply, inline=True),
+                session.add_listener(CH_PRV_BALANCE, self.mirror.apply, inline=True),
+            ]
+
+        resp = await self._client.get_private_trades(self.instruments)
+        if isinstance(resp, dict) and resp.get('event') == 'ERROR':
+            raise FlexfillsParamsException(str(resp))
+
+        if self.currencies:
+            resp = await self._client.get_balance(self.currencies)
+            if isinstance(resp, dict) and resp.get('event') == 'ERROR':
+                raise FlexfillsParamsException(str(resp))
+
+            self.mirror.load_balances(resp)
+
+        await self.reconcile()
+
+        if self._task is None and reconcile_interval:
+            self._task = asyncio.ensure_future(self._reconcile_loop())
+
+        return self.mirror
+
+    async def reconcile(self):
+        """ Loads the open orders and positions from the server and corrects the mirror.
+        Returns the number of corrections.
+        """
+
+        started = time.monotonic()
+
+        orders = await self._client.get_open_orders_list(self.instruments)
+        positions = await self._client.get_trade_positions()
+
+        corrections = 0
+        if not (isinstance(orders, dict) and orders.get('event') == 'ERROR'):
+            corrections += self.mirror.load_orders(orders, started)
+
+        if not (isinstance(positions, dict) and positions.get('event') == 'ERROR'):
+            corrections += self.mirror.load_positions(positions, started)
+
+        return corrections
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        for listener in self._listeners:
+            self._client._session.remove_listener(listener)
+
+        self._listeners = []
+
+    # Protected Methods
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+
+            try:
+                corrections = await self.reconcile()
+                if corrections:
+                    print(f"FlexfillsApi private state reconciled, {corrections} corrections")
+            except Exception as e:
+                print(f"Could not reconcile FlexfillsApi private state: {str(e)}")
+
+
+class PrivateState:
+    """
+    Blocking twin of AsyncPrivateState for FlexfillsApiClient. Queries read the
+    mirror directly, without a round trip to the event loop.
+    """
+
+    def __init__(self, client):
+        self._loop_thread = client._loop_thread
+        self._state = client._client.state
+        self.mirror = self._state.mirror
+
+    @property
+    def started(self):
+        return self._state.started
+
+    def start(self, instruments, currencies=None, reconcile_interval=state_reconcile_interval):
+        return self._loop_thread.run(self._state.start(instruments, currencies, reconcile_interval))
+
+    def reconcile(self):
+        return self._loop_thread.run(self._state.reconcile())
+
+    def stop(self):
+        return self._loop_thread.run(self._state.stop())
@@ -0,0 +1,321 @@
+import sys
+
+from .constants import ORDER_DIRECTIONS, ORDER_TYPES, TIME_IN_FORCES
+from .exceptions import FlexfillsParamsException
+
+# Values of an optional column standing for a missing field in that row
+_ABSENT = frozenset(['', 'None', 'nan', 'NaN'])
+
+
+def _enum_values(allowed):
+    """ Maps every accepted spelling of the allowed values to the wire value, so most
+    inputs are normalized by one dict lookup.
+    """
+
+    values = {}
+    for value in allowed:
+        for spelling in (value, value.lower(), value.capitalize()):
+            values[spelling] = value
+
+    return values
+
+
+def _numpy():
+    """ Returns numpy when the application imported it. Arrays can only come from an
+    application using numpy, so it is never imported for lists of dicts.
+    """
+
+    return sys.modules.get('numpy')
+
+
+def is_columnar(order_datas):
+    """ True for the columnar form of a batch: a dict of columns or a NumPy record array.
+    """
+
+    if isinstance(order_datas, dict):
+        return True
+
+    np = _numpy()
+
+    return np is not None and isinstance(order_datas, np.ndarray) and order_datas.dtype.names is not None
+
+
+def _enum_value(value, values, default, invalid):
+    """ Normalizes an enum value not spelled as one of the prepared spellings.
+    """
+
+    if value is None and default is not None:
+        return default
+
+    normalized = values.get(str(value).upper())
+    if normalized is None:
+        raise FlexfillsParamsException(invalid)
+
+    return normalized
+
+
+def _convert(value, values, default, invalid):
+    """ Returns the wire string of a field value, normalized when values holds the
+    spellings of an enum.
+    """
+
+    if values is None:
+        return value if value.__class__ is str else str(value)
+
+    normalized = values.get(value) if value.__class__ is str else None
+    if normalized is None:
+        normalized = _enum_value(value, values, default, invalid)
+
+    return normalized
+
+
+def _require_price(valid_data):
+    if valid_data['orderType'] == 'LIMIT' and 'price' not in valid_data:
+        raise FlexfillsParamsException("Price should be included in order_data.")
+
+
+class OrderSchema:
+    """
+    Validation of the order payloads of one command, compiled once: the keys, the
+    accepted enum spellings and the error messages are prepared up front, and a
+    payload is checked with dict lookups. Valid payloads are returned as wire
+    dicts (string values, enums upper-cased, the constant fields added).
+    """
+
+    def __init__(self, command, required_keys, optional_keys=(), enums=None, defaults=None,
+                 constants=None, rules=(), data_type='order_data'):
+        self.command = command
+        self.required_keys = tuple(required_keys)
+        self.optional_keys = tuple(optional_keys)
+        self.data_type = data_type or 'payload data'
+
+        self.constants = dict(constants or {})
+        self.rules = tuple(rules)
+
+        # Enum checks only for the fields of the schema
+        keys = self.required_keys + self.optional_keys
+        self.enums = {key: _enum_values(allowed) for key, allowed in (enums or {}).items()
+                      if key in keys}
+        self.defaults = {key: value for key, value in (defaults or {}).items() if key in self.enums}
+
+        self._missing = {key: f"{key} field should be in the {self.data_type}"
+                         for key in self.required_keys}
+        self._invalid = {key: f"the {key} field is not valid in {self.data_type}"
+                         for key in self.enums}
+
+        # (key, enum spellings, default, invalid message) of every field, looked up once
+        self._required_fields = tuple(self._field(key) for key in self.required_keys)
+        self._optional_fields = tuple(self._field(key) for key in self.optional_keys)
+
+    def _field(self, key):
+        return key, self.enums.get(key), self.defaults.get(key), self._invalid.get(key)
+
+    def validate(self, payload):
+        """ Validates one payload.
+
+        Returns:
+        -------
+        Return the wire dict, the required fields first in the order of the schema.
+
+        """
+
+        valid_data = {}
+
+        for key, values, default, invalid in self._required_fields:
+            try:
+                value = payload[key]
+            except KeyError:
+                raise FlexfillsParamsException(self._missing[key]) from None
+
+            valid_data[key] = _convert(value, values, default, invalid)
+
+        for key, values, default, invalid in self._optional_fields:
+            if key in payload:
+                valid_data[key] = _convert(payload[key], values, default, invalid)
+
+        if self.constants:
+            valid_data.update(self.constants)
+
+        for rule in self.rules:
+            rule(valid_data)
+
+        return valid_data
+
+    def validate_batch(self, payloads):
+        """ Validates the payloads in one pass, naming the position of an invalid one.
+
+        Returns:
+        -------
+        Return the list of wire dicts.
+
+        """
+
+        validate = self.validate
+
+        try:
+            return [validate(payload) for payload in payloads]
+        except FlexfillsParamsException as e:
+            if len(payloads) < 2:
+                raise
+
+            index = self._failed_index(payloads)
+            raise FlexfillsParamsException(f"{str(e)} (item {index})") from None
+
+    def _failed_index(self, payloads):
+        for index, payload in enumerate(payloads):
+            try:
+                self.validate(payload)
+            except FlexfillsParamsException:
+                return index
+
+        return None
+
+    def validate_columns(self, columns):
+        """ Validates a columnar batch, a dict of equal length sequences (lists or NumPy
+        arrays) keyed by field, or a NumPy record array. Columns are checked and
+        converted to strings as a whole, vectorized for NumPy arrays. Empty, None or
+        NaN values of an optional column leave the field out of that order.
+
+        Returns:
+        -------
+        Return the list of wire dicts, one per row.
+
+        """
+
+        np = _numpy()
+
+        if np is not None and isinstance(columns, np.ndarray):
+            if columns.dtype.names is None:
+                raise FlexfillsParamsException(f"the {self.data_type} columns should be named")
+
+            columns = {name: columns[name] for name in columns.dtype.names}
+
+        for key in self.required_keys:
+            if key not in columns:
+                raise FlexfillsParamsException(self._missing[key])
+
+        keys = [key for key in self.required_keys + self.optional_keys if key in columns]
+
+        lengths = {len(columns[key]) for key in keys}
+        if len(lengths) > 1:
+            raise FlexfillsParamsException(
+                f"the {self.data_type} columns should have the same length")
+
+        converted = [self._column(key, columns[key]) for key in keys]
+
+        constants = self.constants
+        rows = [dict(zip(keys, values), **constants) for values in zip(*converted)]
+
+        # Missing values of the optional columns are dropped row by row
+        for key, values in zip(keys, converted):
+            if key in self.optional_keys and not _ABSENT.isdisjoint(values):
+                for row in rows:
+                    if row[key] in _ABSENT:
+                        del row[key]
+
+        for rule in self.rules:
+            for index, row in enumerate(rows):
+                try:
+                    rule(row)
+                except FlexfillsParamsException as e:
+                    raise FlexfillsParamsException(f"{str(e)} (item {index})") from None
+
+        return rows
+
+    def _column(self, key, column):
+        """ Returns the column as a list of wire strings. Enum columns are normalized
+        through their distinct values, which are few whatever the size of the batch.
+        """
+
+        np = _numpy()
+
+        if np is not None and isinstance(column, np.ndarray):
+            if column.dtype.kind == 'U':
+                strings = column.tolist()
+            elif column.dtype.kind == 'O':
+                # Mixed objects (None, NaN, str) cannot be sorted by np.unique
+                strings = [value if value.__class__ is str else str(value)
+                           for value in column.tolist()]
+            else:
+                if column.dtype.kind == 'S':
+                    column = column.astype(str)
+
+                # Prices and amounts repeat a lot, every distinct value is formatted once
+                distinct, inverse = np.unique(column, return_inverse=True)
+                formatted = [value if value.__class__ is str else str(value)
+                             for value in distinct.tolist()]
+                strings = [formatted[i] for i in inverse.ravel().tolist()]
+        else:
+            strings = [value if value.__class__ is str else str(value) for value in column]
+
+        if key in self.enums:
+            distinct = set(strings)
+            mapping = self._enum_mapping(key, distinct)
+            if len(mapping) < len(distinct):
+                index = next(i for i, value in enumerate(strings) if value not in mapping)
+                raise FlexfillsParamsException(f"{self._invalid[key]} (item {index})")
+
+            return [mapping[value] for value in strings]
+
+        if key in self.required_keys and not _ABSENT.isdisjoint(strings):
+            index = next(i for i, value in enumerate(strings) if value in _ABSENT)
+            raise FlexfillsParamsException(f"{self._missing[key]} (item {index})")
+
+        return strings
+
+    def _enum_mapping(self, key, distinct):
+        """ Maps the valid ones of the distinct values of an enum column to their wire value.
+        """
+
+        values = self.enums[key]
+        default = self.defaults.get(key)
+
+        mapping = {}
+        for value in distinct:
+            normalized = values.get(value) or values.get(value.upper())
+            if normalized is None and default is not None and value in ('', 'None'):
+                normalized = default
+
+            if normalized is not None:
+                mapping[value] = normalized
+
+        return mapping
+
+    def validate_any(self, order_datas):
+        """ Validates a batch given as a list of payloads or in columnar form.
+        """
+
+        if is_columnar(order_datas):
+            return self.validate_columns(order_datas)
+
+        return self.validate_batch(order_datas)
+
+
+ORDER_ENUMS = {
+    'direction': ORDER_DIRECTIONS,
+    'orderType': ORDER_TYPES,
+    'timeInForce': TIME_IN_FORCES,
+}
+
+ORDER_DEFAULTS = {'timeInForce': 'GTC'}
+
+CREATE_ORDER_SCHEMA = OrderSchema(
+    'CREATE',
+    ['globalInstrumentCd', 'exchange', 'direction', 'orderType', 'amount'],
+    ['exchangeName', 'orderSubType', 'price', 'clientOrderId', 'timeInForce', 'tradeSide'],
+    ORDER_ENUMS, ORDER_DEFAULTS, {'class': 'Order'}, [_require_price])
+
+CANCEL_ORDER_SCHEMA = OrderSchema(
+    'CANCEL',
+    ['globalInstrumentCd', 'clientOrderId', 'direction', 'orderType', 'timeInForce', 'price',
+     'amount', 'exchange'],
+    (), ORDER_ENUMS, ORDER_DEFAULTS, {'class': 'Order'})
+
+MODIFY_ORDER_SCHEMA = OrderSchema(
+    'MODIFY',
+    ['globalInstrumentCd', 'orderId', 'exchangeOrderId'],
+    ['price', 'amount'],
+    constants={'class': 'Order'})
+
+ORDER_SCHEMAS = {schema.command: schema
+                 for schema in (CREATE_ORDER_SCHEMA, CANCEL_ORDER_SCHEMA, MODIFY_ORDER_SCHEMA)}
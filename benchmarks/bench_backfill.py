@@ -0,0 +1,94 @@
+""" Bulk candle backfill: time to fetch the candles of many (instrument, period) targets
+one trades_data_provider call after another, and with iter_candles at several
+concurrency limits, against a mock data provider taking --delay seconds per request.
+Also the time with a tenth of the requests failing and retried.
+
+Run from the repository root:
+
+    python benchmarks/bench_backfill.py [--targets 40] [--pages 2] [--delay 0.1]
+"""
+
+import argparse
+import time
+
+from common import MockServerProcess, result, print_results
+
+from FlexfillsApi import FlexfillsApiClient  # noqa: E402
+from FlexfillsApi.backfill import candle_pages  # noqa: E402
+from FlexfillsApi.constants import PERIODS  # noqa: E402
+
+PAGE_SIZE = 100
+INSTRUMENTS = ['BTC/USD', 'ETH/USD', 'SOL/USD', 'XRP/USD', 'ADA/USD']
+
+
+def make_targets(count):
+    return [('FLEXFILLS', INSTRUMENTS[i % len(INSTRUMENTS)], PERIODS[i // len(INSTRUMENTS) % len(PERIODS)])
+            for i in range(count)]
+
+
+def sequential(client, targets, count, end):
+    for exchange, instrument, period in targets:
+        for page_end, page_count in candle_pages(period, count, end, PAGE_SIZE):
+            client.trades_data_provider(exchange, instrument, period, page_end, page_count)
+
+
+def concurrent(client, targets, count, end, parallelism):
+    results = list(client.iter_candles(targets, count, end, parallelism, None, PAGE_SIZE))
+
+    failed = [row for row in results if row.error is not None]
+    if failed:
+        raise RuntimeError(f"{len(failed)} targets failed: {failed[0].error}")
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+
+    return time.perf_counter() - start
+
+
+def run(targets=40, pages=2, delay=0.1):
+    target_list = make_targets(targets)
+    count = pages * PAGE_SIZE
+    end = int(time.time() * 1000)
+    results = []
+
+    with MockServerProcess('--book-rate', 0, '--candle-delay', delay) as server:
+        client = FlexfillsApiClient('bench', socket_url=server.url, gateway_host=server.gateway_host)
+
+        try:
+            results.append(result("backfill sequential",
+                                  timed(sequential, client, target_list, count, end) * 1000, 'ms'))
+
+            for parallelism in (1, 4, 8):
+                results.append(result(f"backfill parallelism {parallelism}", timed(
+                    concurrent, client, target_list, count, end, parallelism) * 1000, 'ms'))
+        finally:
+            client.close()
+
+    with MockServerProcess('--book-rate', 0, '--candle-delay', delay,
+                           '--candle-error-rate', 0.1) as server:
+        client = FlexfillsApiClient('bench', socket_url=server.url, gateway_host=server.gateway_host)
+
+        try:
+            results.append(result("backfill parallelism 8 with retries", timed(
+                concurrent, client, target_list, count, end, 8) * 1000, 'ms'))
+        finally:
+            client.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--targets', type=int, default=40)
+    parser.add_argument('--pages', type=int, default=2, help='candle pages per target')
+    parser.add_argument('--delay', type=float, default=0.1,
+                        help='seconds taken by the mock data provider per request')
+    args = parser.parse_args()
+
+    print_results(run(args.targets, args.pages, args.delay))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+""" Bar builder: cost of a public trade added to the bars of every period, and of a
+trade closing bars, with many instruments.
+
+Run from the repository root:
+
+    python benchmarks/bench_bars.py [--count 50000] [--instruments 20]
+"""
+
+import argparse
+import time
+
+from common import result, print_results, HIGHER
+
+from FlexfillsApi.bars import BarBuilder  # noqa: E402
+
+
+def run(count=50000, instruments=20):
+    names = [f"SYM{i}/USD" for i in range(instruments)]
+    start = 1700000000000
+    results = []
+
+    # A trade per millisecond and instrument, then one per minute, closing a ONE_MIN bar each
+    for name, interval in (('trade', 1), ('trade closing bars', 60000)):
+        builder = BarBuilder()
+        closed = []
+        builder.on_close = closed.append
+
+        started = time.perf_counter()
+        for i in range(count):
+            builder.add_trade(names[i % instruments], 30000 + i % 100, 0.01,
+                              start + (i // instruments) * interval)
+        elapsed = time.perf_counter() - started
+
+        results.append(result(f"bars {name}", elapsed / count * 1e6, 'us'))
+        if interval == 1:
+            results.append(result("bars trades", count / elapsed, 'trades/s', HIGHER))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=50000)
+    parser.add_argument('--instruments', type=int, default=20)
+    args = parser.parse_args()
+
+    print_results(run(args.count, args.instruments))
+
+
+if __name__ == '__main__':
+    main()
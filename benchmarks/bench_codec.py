@@ -0,0 +1,79 @@
+""" Per-frame cost of the JSON codecs and of the order message templates.
+
+Run from the repository root:
+
+    python benchmarks/bench_codec.py [--number 20000]
+"""
+
+import argparse
+import json
+import timeit
+
+from common import result, print_results
+
+from FlexfillsApi.codec import available_codecs, get_codec, encode_message, MessageTemplate  # noqa: E402
+
+ORDER_BOOK_FRAME = json.dumps({
+    "event": "UPDATE",
+    "channel": "ORDER_BOOK_PUBLIC",
+    "data": {
+        "globalInstrumentCd": "BTC/USD",
+        "timestamp": 1700000000000,
+        "bids": [{"price": str(30000 - i * 0.5), "amount": str(1 + i * 0.1)} for i in range(20)],
+        "asks": [{"price": str(30001 + i * 0.5), "amount": str(1 + i * 0.1)} for i in range(20)],
+    }
+})
+
+ORDER_DATA = {
+    "globalInstrumentCd": "BTC/USD",
+    "clientOrderId": "0f8e2a4c6b1d4e3f9a7b5c3d1e2f4a6b",
+    "exchange": "FLEXFILLS",
+    "direction": "BUY",
+    "orderType": "LIMIT",
+    "timeInForce": "GTC",
+    "amount": "0.25",
+    "price": "30000.5",
+    "class": "Order",
+}
+
+SIGNATURE = "eyJhbGciOiJIUzI1NiJ9." + "x" * 300
+
+
+def per_call_us(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def run(number=20000):
+    results = []
+
+    for name in available_codecs():
+        codec = get_codec(name)
+        template = MessageTemplate(codec, command="CREATE", signature=SIGNATURE,
+                                   channel="TRADE_PRIVATE")
+
+        # Both go through encode_message, as every message sent does
+        def build_and_encode():
+            return encode_message({"command": "CREATE", "signature": SIGNATURE,
+                                   "channel": "TRADE_PRIVATE", "data": [ORDER_DATA]}, codec)
+
+        results.append(result(f"{name} decode book",
+                              per_call_us(lambda: codec.loads(ORDER_BOOK_FRAME), number), 'us'))
+        results.append(result(f"{name} encode order",
+                              per_call_us(build_and_encode, number), 'us'))
+        results.append(result(f"{name} template order",
+                              per_call_us(lambda: encode_message(template.render(data=[ORDER_DATA]), codec),
+                                          number), 'us'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    print_results(run(args.number))
+
+
+if __name__ == '__main__':
+    main()
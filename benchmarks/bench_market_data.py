@@ -0,0 +1,77 @@
+""" Market data throughput against the local mock server: order book frames received
+per second and client CPU time per frame, through the local order books alone and
+with a subscription callback.
+
+Run from the repository root:
+
+    python benchmarks/bench_market_data.py [--rate 5000] [--instruments 4] [--seconds 5]
+"""
+
+import argparse
+import time
+
+from common import MockServerProcess, result, print_results, HIGHER
+
+from FlexfillsApi import FlexfillsApiClient  # noqa: E402
+from FlexfillsApi.mock_server import DEFAULT_INSTRUMENTS  # noqa: E402
+
+
+def measure(client, instruments, seconds):
+    """ Returns (frames, wall seconds, CPU seconds) of the client process over the period.
+    """
+
+    store = client._client.order_book_store
+    books = [store.get(instrument) for instrument in instruments]
+    before = sum(book.updates for book in books if book is not None)
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+
+    time.sleep(seconds)
+
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+
+    books = [store.get(instrument) for instrument in instruments]
+    frames = sum(book.updates for book in books if book is not None) - before
+
+    return frames, wall, cpu
+
+
+def run(rate=5000, instruments=4, seconds=5):
+    instruments = DEFAULT_INSTRUMENTS[:instruments]
+    results = []
+
+    for label, callback in (('order books', None), ('order books + callback', lambda frame: None)):
+        with MockServerProcess('--book-rate', rate) as server:
+            client = FlexfillsApiClient('bench', socket_url=server.url, gateway_host=server.gateway_host)
+
+            try:
+                client.subscribe_order_books(instruments, callback)
+
+                # Let the stream reach its rate before measuring
+                time.sleep(0.5)
+
+                frames, wall, cpu = measure(client, instruments, seconds)
+            finally:
+                client.close()
+
+        results.append(result(f"{label} frames/s", frames / wall, 'frames/s', HIGHER))
+        results.append(result(f"{label} CPU per frame", cpu / max(frames, 1) * 1e6, 'us'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=int, default=5000,
+                        help='order book updates per second per instrument sent by the server')
+    parser.add_argument('--instruments', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    print_results(run(args.rate, args.instruments, args.seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+""" Order path latency against the local mock server: create and cancel round trips,
+the latency of every client stage and the pipelined order throughput.
+
+Run from the repository root:
+
+    python benchmarks/bench_orders.py [--count 2000] [--batch 100]
+"""
+
+import argparse
+import itertools
+import time
+
+from common import MockServerProcess, result, print_results, HIGHER
+
+from FlexfillsApi import FlexfillsApiClient, LatencyHistogram  # noqa: E402
+from FlexfillsApi.metrics import STAGES, quantile_name  # noqa: E402
+
+QUANTILES = (0.5, 0.99, 0.999)
+
+_ids = itertools.count(1)
+
+
+def order(order_type='MARKET'):
+    return {
+        "globalInstrumentCd": "BTC/USD",
+        "clientOrderId": f"bench-{next(_ids)}",
+        "exchange": "FLEXFILLS",
+        "direction": "BUY",
+        "orderType": order_type,
+        "timeInForce": "GTC",
+        "amount": "0.01",
+        "price": "10000",
+    }
+
+
+def timed(histogram, func, *args, **kwargs):
+    started = time.perf_counter_ns()
+    resp = func(*args, **kwargs)
+    histogram.record((time.perf_counter_ns() - started) // 1000)
+
+    return resp
+
+
+def quantile_results(name, histogram):
+    return [result(f"{name} {quantile_name(q)}", histogram.value_at_quantile(q) or 0, 'us')
+            for q in QUANTILES]
+
+
+def run(count=2000, batch=100):
+    results = []
+
+    with MockServerProcess('--book-rate', 0) as server:
+        client = FlexfillsApiClient('bench', socket_url=server.url, gateway_host=server.gateway_host)
+
+        try:
+            # Connects and subscribes TRADE_PRIVATE, outside of the measures
+            client.create_order([order()])
+            client.metrics.reset()
+
+            create = LatencyHistogram()
+            for _ in range(count):
+                timed(create, client.create_order, [order()])
+
+            results += quantile_results('create_order round trip', create)
+
+            for stage in STAGES:
+                histogram = client.metrics.histogram(stage, 'CREATE')
+                if histogram.count:
+                    results += quantile_results(f"create_order {stage}", histogram)
+
+            cancel = LatencyHistogram()
+            for _ in range(count // 10):
+                limit_order = order('LIMIT')
+                client.create_order([limit_order])
+                timed(cancel, client.cancel_order, [limit_order])
+
+            results += quantile_results('cancel_order round trip', cancel)
+
+            orders = [order() for _ in range(count)]
+            started = time.perf_counter()
+            for i in range(0, count, batch):
+                client.create_order(orders[i:i + batch], pipelined=True)
+
+            results.append(result('pipelined create_order throughput',
+                                  count / (time.perf_counter() - started), 'orders/s', HIGHER))
+        finally:
+            client.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=100)
+    args = parser.parse_args()
+
+    print_results(run(args.count, args.batch))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+""" Order scheduler against a rate limited mock server: rejected orders and accepted
+order throughput of a burst sent without and with the OrderScheduler, and the queue wait
+of cancels sent behind a backlog of new orders.
+
+Run from the repository root:
+
+    python benchmarks/bench_scheduler.py [--count 400] [--limit 200] [--burst 20]
+
+The server accepts burst orders at once then limit per second, a burst small enough
+for count orders sent at once to go over it whatever the count.
+"""
+
+import argparse
+import itertools
+import threading
+import time
+
+from common import MockServerProcess, result, print_results, HIGHER
+
+from FlexfillsApi import FlexfillsApiClient  # noqa: E402
+from FlexfillsApi.metrics import STAGE_QUEUE  # noqa: E402
+from FlexfillsApi.scheduler import OrderScheduler  # noqa: E402
+
+_ids = itertools.count(1)
+
+# Under the server limit, so the network jitter does not push a burst over it
+RATE_MARGIN = 0.9
+
+
+def order():
+    return {
+        "globalInstrumentCd": "BTC/USD",
+        "clientOrderId": f"bench-{next(_ids)}",
+        "exchange": "FLEXFILLS",
+        "direction": "BUY",
+        "orderType": "LIMIT",
+        "timeInForce": "GTC",
+        "amount": "0.01",
+        "price": "10000",
+    }
+
+
+def send_burst(client, count):
+    """ Sends count orders at once, returns the rejected orders and the accepted per second.
+    """
+
+    started = time.perf_counter()
+    resps = client.create_order([order() for _ in range(count)], pipelined=True,
+                                max_in_flight=count)
+    elapsed = time.perf_counter() - started
+
+    rejected = sum(1 for resp in resps if resp.get('event') == 'ERROR')
+
+    return rejected, (count - rejected) / elapsed
+
+
+def run(count=400, limit=200, burst=20):
+    results = []
+
+    def scheduler():
+        return OrderScheduler(rate=limit * RATE_MARGIN, burst=max(1, int(burst * RATE_MARGIN)))
+
+    with MockServerProcess('--book-rate', 0, '--order-rate', limit, '--order-burst', burst) as server:
+        for name, order_scheduler in (('unscheduled', None), ('scheduled', scheduler())):
+            client = FlexfillsApiClient('bench', socket_url=server.url,
+                                        gateway_host=server.gateway_host, scheduler=order_scheduler)
+
+            try:
+                # Connects and subscribes TRADE_PRIVATE, then lets the server bucket refill
+                client.create_order([order()])
+                time.sleep(1)
+
+                rejected, throughput = send_burst(client, count)
+                results.append(result(f"order burst {name} rejected", rejected, 'orders'))
+                results.append(result(f"order burst {name} accepted", throughput, 'orders/s', HIGHER))
+            finally:
+                client.close()
+
+        # Cancels of open orders sent while new orders are queued
+        client = FlexfillsApiClient('bench', socket_url=server.url, gateway_host=server.gateway_host,
+                                    scheduler=scheduler())
+
+        try:
+            opened = [order() for _ in range(20)]
+            client.create_order(opened, pipelined=True)
+            time.sleep(1)
+            client.metrics.reset()
+
+            backlog = threading.Thread(target=send_burst, args=(client, count))
+            backlog.start()
+            time.sleep(0.2)
+
+            client.cancel_order(opened, pipelined=True)
+            backlog.join()
+
+            for command in ('CANCEL', 'CREATE'):
+                histogram = client.metrics.histogram(STAGE_QUEUE, command)
+                results.append(result(f"scheduled {command.lower()} queue wait p99",
+                                      (histogram.value_at_quantile(0.99) or 0) / 1000, 'ms'))
+        finally:
+            client.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=400)
+    parser.add_argument('--limit', type=int, default=200,
+                        help='order messages per second allowed by the mock server')
+    parser.add_argument('--burst', type=int, default=20,
+                        help='order messages allowed at once by the mock server')
+    args = parser.parse_args()
+
+    print_results(run(args.count, args.limit, args.burst))
+
+
+if __name__ == '__main__':
+    main()
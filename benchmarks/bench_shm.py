@@ -0,0 +1,69 @@
+""" Per-record cost of the shared memory market data ring: publishing a 20 level book,
+reading it back in a reader, and the same for trades.
+
+Run from the repository root:
+
+    python benchmarks/bench_shm.py [--count 20000]
+"""
+
+import argparse
+import os
+import time
+
+from common import result, print_results
+
+from FlexfillsApi.orderbook import OrderBook  # noqa: E402
+from FlexfillsApi.shm import MarketDataPublisher, MarketDataReader  # noqa: E402
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+
+    return time.perf_counter() - start
+
+
+def run(count=20000, slots=4096, batch=1000):
+    book = OrderBook('BTC/USD')
+    book.update([(30000 - i * 0.5, 1 + i * 0.1) for i in range(20)],
+                [(30001 + i * 0.5, 1 + i * 0.1) for i in range(20)], 1700000000000)
+
+    def publish_books(publisher, count):
+        for _ in range(count):
+            publisher.publish_book(book)
+
+    def publish_trades(publisher, count):
+        for i in range(count):
+            publisher.publish_trade('BTC/USD', 30000.5, 0.25, 'BUY', 1700000000000, i)
+
+    results = []
+
+    with MarketDataPublisher(f"flexfills-bench-{os.getpid()}", slots) as publisher:
+        with MarketDataReader(publisher.name) as reader:
+            # Touches every page of the ring first, as a running gateway has
+            publish_books(publisher, slots)
+            reader.read()
+
+            for kind, publish in (('book', publish_books), ('trade', publish_trades)):
+                published = read = 0.0
+                for _ in range(max(count // batch, 1)):
+                    published += timed(publish, publisher, batch)
+                    read += timed(reader.read)
+
+                total = max(count // batch, 1) * batch
+                results.append(result(f"shm publish {kind}", published / total * 1e6, 'us'))
+                results.append(result(f"shm read {kind}", read / total * 1e6, 'us'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20000)
+    args = parser.parse_args()
+
+    print_results(run(args.count))
+
+
+if __name__ == '__main__':
+    main()
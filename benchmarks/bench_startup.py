@@ -0,0 +1,109 @@
+""" Startup latency: the import time of the package and the time from process start to
+the first answered request, with the eager initialize() and with initialize(lazy=True).
+Every measure runs in a fresh interpreter, so nothing is already imported or connected.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py [--runs 5] [--login-delay 0.2]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from common import MockServerProcess, ROOT, result, print_results
+
+IMPORT = """
+import time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+import json
+print('RESULT', json.dumps(elapsed))
+"""
+
+# Mirrors FlexfillsApi.login_flexfills: log in, create the client, warm up, then call
+EAGER = """
+import time
+started = time.perf_counter()
+from FlexfillsApi import FlexfillsApiClient, get_token_manager
+
+token_manager = get_token_manager('bench', 'bench', host={gateway_host!r})
+client = FlexfillsApiClient(token_manager.get_token(), warm_instruments=['BTC/USD'], socket_url={url!r},
+                            gateway_host={gateway_host!r}, token_manager=token_manager)
+client.warm_up()
+initialized = time.perf_counter() - started
+client.get_balance(['USD'])
+first = time.perf_counter() - started
+import json
+print('RESULT', json.dumps({{'initialize': initialized, 'first_request': first}}))
+client.close()
+"""
+
+LAZY = """
+import time
+started = time.perf_counter()
+from FlexfillsApi import LazyFlexfillsApi
+
+api = LazyFlexfillsApi('bench', 'bench', False, ['BTC/USD'], socket_url={url!r},
+                       gateway_host={gateway_host!r})
+initialized = time.perf_counter() - started
+api.get_balance(['USD'])
+first = time.perf_counter() - started
+import json
+print('RESULT', json.dumps({{'initialize': initialized, 'first_request': first}}))
+api.close()
+"""
+
+
+def run_child(code):
+    """ Runs the code in a new interpreter and returns the result it printed.
+    """
+
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                            stdout=subprocess.PIPE, text=True).stdout
+
+    line = next(line for line in output.splitlines() if line.startswith('RESULT '))
+
+    return json.loads(line[len('RESULT '):])
+
+
+def median_ms(values):
+    return statistics.median(values) * 1000
+
+
+def run(runs=5, login_delay=0.2):
+    results = []
+
+    for name, module in (('import FlexfillsApi', 'FlexfillsApi'),
+                         ('import FlexfillsApi.flexfillsapi', 'FlexfillsApi.flexfillsapi')):
+        times = [run_child(IMPORT.format(module=module)) for _ in range(runs)]
+        results.append(result(name, median_ms(times), 'ms'))
+
+    with MockServerProcess('--book-rate', 0, '--login-delay', login_delay) as server:
+        for name, code in (('eager', EAGER), ('lazy', LAZY)):
+            rows = [run_child(code.format(url=server.url, gateway_host=server.gateway_host))
+                    for _ in range(runs)]
+
+            results.append(result(f"startup {name} initialize",
+                                  median_ms([row['initialize'] for row in rows]), 'ms'))
+            results.append(result(f"startup {name} first request",
+                                  median_ms([row['first_request'] for row in rows]), 'ms'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--login-delay', type=float, default=0.2,
+                        help='seconds taken by the login of the mock server')
+    args = parser.parse_args()
+
+    print_results(run(args.runs, args.login_delay))
+
+
+if __name__ == '__main__':
+    main()
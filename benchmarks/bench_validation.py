@@ -0,0 +1,73 @@
+""" Per-order cost of validating a basket of create orders, given as a list of
+payloads or in columnar form (dict of lists, NumPy record array).
+
+Run from the repository root:
+
+    python benchmarks/bench_validation.py [--count 5000]
+"""
+
+import argparse
+import timeit
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from common import result, print_results
+
+from FlexfillsApi.validation import CREATE_ORDER_SCHEMA  # noqa: E402
+
+FIELDS = ['globalInstrumentCd', 'exchange', 'direction', 'orderType', 'timeInForce', 'amount',
+          'price']
+
+
+def basket(count):
+    """ Returns the columns of a basket of limit orders, as Python lists.
+    """
+
+    return {
+        'globalInstrumentCd': [('BTC/USD', 'ETH/USD')[i % 2] for i in range(count)],
+        'exchange': ['FLEXFILLS'] * count,
+        'direction': [('buy', 'SELL')[i % 2] for i in range(count)],
+        'orderType': ['LIMIT'] * count,
+        'timeInForce': ['GTC'] * count,
+        'amount': [0.01 * (1 + i % 100) for i in range(count)],
+        'price': [30000 + 0.5 * (i % 200) for i in range(count)],
+    }
+
+
+def per_order_us(func, count):
+    return min(timeit.repeat(func, number=3, repeat=5)) / 3 / count * 1e6
+
+
+def run(count=5000):
+    columns = basket(count)
+    payloads = [dict(zip(FIELDS, row)) for row in zip(*(columns[field] for field in FIELDS))]
+
+    results = [
+        result("validate order list", per_order_us(
+            lambda: CREATE_ORDER_SCHEMA.validate_batch(payloads), count), 'us'),
+        result("validate order columns", per_order_us(
+            lambda: CREATE_ORDER_SCHEMA.validate_columns(columns), count), 'us'),
+    ]
+
+    if np is not None:
+        records = np.rec.fromarrays([np.array(columns[field]) for field in FIELDS], names=FIELDS)
+
+        results.append(result("validate order record array", per_order_us(
+            lambda: CREATE_ORDER_SCHEMA.validate_columns(records), count), 'us'))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=5000)
+    args = parser.parse_args()
+
+    print_results(run(args.count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+""" Helpers shared by the benchmarks: the mock server process and the result rows.
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+LOWER = 'lower'  # Lower values are better (latency, CPU)
+HIGHER = 'higher'  # Higher values are better (throughput)
+
+
+def result(name, value, unit, better=LOWER):
+    return {'name': name, 'value': value, 'unit': unit, 'better': better}
+
+
+def print_results(results):
+    for row in results:
+        print(f"{row['name']:<44}{row['value']:>14.2f} {row['unit']}")
+
+
+class MockServerProcess:
+    """ Runs FlexfillsApi.mock_server in a child process, so its CPU time is not
+    counted in the benchmark process.
+    """
+
+    def __init__(self, *options):
+        self.options = [str(option) for option in options]
+        self.process = None
+        self.url = None
+        self.gateway_host = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'FlexfillsApi.mock_server', '--port', '0', '--rest-port', '0']
+            + self.options, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError('The mock server did not start')
+
+        self.url, self.gateway_host = line.split()[-2:]
+
+        return self
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.wait()
@@ -0,0 +1,96 @@
+""" Runs every benchmark against the local mock server and compares the results with
+a baseline, to catch performance regressions between releases in CI.
+
+Run from the repository root:
+
+    python benchmarks/run_all.py --output results.json
+    python benchmarks/run_all.py --baseline results.json [--tolerance 0.25]
+
+Exits with status 1 when a result is worse than its baseline by more than the tolerance.
+"""
+
+import argparse
+import json
+import platform
+
+from common import print_results, HIGHER
+
+import bench_backfill
+import bench_bars
+import bench_codec
+import bench_market_data
+import bench_orders
+import bench_scheduler
+import bench_shm
+import bench_startup
+import bench_validation
+
+
+def compare(results, baseline, tolerance, min_delta=0):
+    """ Returns the results worse than their baseline by more than the tolerance,
+    ignoring absolute changes under min_delta (timer resolution on tiny values).
+    """
+
+    baseline = {row['name']: row for row in baseline['results']}
+
+    regressions = []
+    for row in results:
+        previous = baseline.get(row['name'])
+        if previous is None or not previous['value']:
+            continue
+
+        if abs(row['value'] - previous['value']) < min_delta:
+            continue
+
+        change = (row['value'] - previous['value']) / previous['value']
+        if row['better'] == HIGHER:
+            change = -change
+
+        if change > tolerance:
+            regressions.append(dict(row, baseline=previous['value'], change=change))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative change allowed before a result counts as a regression')
+    parser.add_argument('--min-delta', type=float, default=5,
+                        help='absolute change always ignored, in the unit of the result')
+    parser.add_argument('--quick', action='store_true', help='shorter runs, for smoke tests')
+    args = parser.parse_args()
+
+    results = bench_codec.run(2000 if args.quick else 20000)
+    results += bench_validation.run(500 if args.quick else 5000)
+    results += bench_orders.run(200 if args.quick else 2000)
+    results += bench_scheduler.run(100 if args.quick else 400)
+    results += bench_bars.run(5000 if args.quick else 50000)
+    results += bench_shm.run(2000 if args.quick else 20000)
+    results += bench_backfill.run(10 if args.quick else 40)
+    results += bench_market_data.run(seconds=1 if args.quick else 5)
+    results += bench_startup.run(2 if args.quick else 5)
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta)
+
+        for row in regressions:
+            print(f"REGRESSION {row['name']}: {row['value']:.2f} {row['unit']} "
+                  f"(baseline {row['baseline']:.2f}, {row['change']:+.0%})")
+
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+
+from FlexfillsApi import AsyncFlexfillsApiClient
+from FlexfillsApi.exceptions import FlexfillsParamsException
+from FlexfillsApi.mock_server import MockFlexfillsServer
+
+
+class IterCandlesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockFlexfillsServer(book_rate=0, candle_delay=0.05).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def client(self):
+        return AsyncFlexfillsApiClient('test', socket_url=self.server.url,
+                                       gateway_host=self.server.gateway_host)
+
+    def test_overlapping_backfills_with_more_workers(self):
+        async def backfill(client, instruments, parallelism):
+            targets = [('FLEXFILLS', instrument, period)
+                       for instrument in instruments for period in ('ONE_MIN', 'FIVE_MIN')]
+
+            return [result async for result in client.iter_candles(
+                targets, 20, parallelism=parallelism, rate=None, page_size=5)]
+
+        async def main():
+            client = self.client()
+            try:
+                small = asyncio.ensure_future(
+                    backfill(client, ['BTC/USD', 'ETH/USD', 'LTC/USD'], 2))
+                await asyncio.sleep(0.1)
+
+                # Asks for a larger pool while the first backfill still uses the current one
+                large = await backfill(client, ['BTC/USD', 'ETH/USD'], 8)
+
+                return await small, large
+            finally:
+                await client.close()
+
+        small, large = asyncio.run(main())
+
+        self.assertEqual(len(small), 6)
+        self.assertEqual([result.error for result in small + large], [None] * 10)
+        self.assertEqual({len(result.rows) for result in small + large}, {20})
+
+    def test_count_should_be_positive(self):
+        async def main():
+            client = self.client()
+            try:
+                return [result async for result in client.iter_candles(
+                    [('FLEXFILLS', 'BTC/USD', 'ONE_MIN')], 0)]
+            finally:
+                await client.close()
+
+        with self.assertRaises(FlexfillsParamsException):
+            asyncio.run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import asyncio
+import unittest
+
+from FlexfillsApi import AsyncFlexfillsApiClient
+from FlexfillsApi.bars import AsyncBarFeed, CH_BARS
+from FlexfillsApi.dispatch import BLOCK
+
+
+class BarDeliveryTest(unittest.TestCase):
+
+    def test_bars_delivered_in_order_when_queue_is_full(self):
+        async def main():
+            client = AsyncFlexfillsApiClient('test', socket_url='ws://127.0.0.1:1')
+            client.dispatcher.set_policy(CH_BARS, BLOCK, 2)
+
+            feed = AsyncBarFeed(client, periods=['ONE_MIN'])
+
+            got = []
+
+            async def slow(frame):
+                await asyncio.sleep(0.01)
+                got.append(frame['data'][0]['timestamp'])
+
+            feed.add_listener(slow)
+
+            # Bars keep closing while earlier ones wait for space in the queue
+            for minute in range(30):
+                feed.builder.add_trade('BTC/USD', 1.0, 1.0, minute * 60000)
+                if minute % 3 == 0:
+                    await asyncio.sleep(0.015)
+
+            await asyncio.sleep(1)
+
+            self.assertEqual(got, [minute * 60000 for minute in range(29)])
+
+        asyncio.run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+
+from FlexfillsApi.candles import CandleStore
+
+BASE = 1700000040000  # A minute boundary, in epoch milliseconds
+MINUTE = 60000
+
+
+def candle(i, close):
+    return [BASE + i * MINUTE, close, close, close, close, 1]
+
+
+class CandleStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calls = []
+        self.store = CandleStore(self.tmp.name, self.fetch, page_size=10)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fetch(self, exchange, instrument, period, timestamp, count):
+        self.calls.append((timestamp, count))
+        first = (timestamp - BASE) // MINUTE - count + 1
+
+        return {'data': [candle(i, 3) for i in range(first, first + count)]}
+
+    def get(self, start, end, fetch=True):
+        return self.store.get('FLEXFILLS', 'BTC/USD', 'ONE_MIN',
+                              BASE + start * MINUTE, BASE + end * MINUTE, fetch=fetch)
+
+    def test_overlapping_page_keeps_the_newest_candles(self):
+        self.store.add('FLEXFILLS', 'BTC/USD', 'ONE_MIN', [candle(i, 1) for i in range(3)])
+        self.store.add('FLEXFILLS', 'BTC/USD', 'ONE_MIN', [candle(i, 2) for i in range(1, 4)])
+
+        columns = self.get(0, 3, fetch=False)
+
+        self.assertEqual(list(columns['timestamp']), [BASE + i * MINUTE for i in range(4)])
+        self.assertEqual(list(columns['close']), [1, 2, 2, 2])
+
+    def test_later_row_of_a_page_wins(self):
+        self.store.add('FLEXFILLS', 'BTC/USD', 'ONE_MIN', [candle(0, 1), candle(0, 2)])
+
+        self.assertEqual(list(self.get(0, 0, fetch=False)['close']), [2])
+
+    def test_only_missing_spans_are_fetched(self):
+        self.store.add('FLEXFILLS', 'BTC/USD', 'ONE_MIN', [candle(i, 1) for i in range(10, 20)],
+                       BASE + 10 * MINUTE, BASE + 19 * MINUTE)
+
+        self.assertEqual(self.store.missing('FLEXFILLS', 'BTC/USD', 'ONE_MIN',
+                                            BASE, BASE + 29 * MINUTE),
+                         [(BASE, BASE + 9 * MINUTE), (BASE + 20 * MINUTE, BASE + 29 * MINUTE)])
+
+        columns = self.get(0, 29)
+
+        self.assertEqual(sorted(self.calls),
+                         [(BASE + 9 * MINUTE, 10), (BASE + 29 * MINUTE, 10)])
+        self.assertEqual(len(columns['timestamp']), 30)
+        self.assertEqual(list(columns['close'][9:21]), [3] + [1] * 10 + [3])
+
+        self.calls.clear()
+        self.get(0, 29)
+
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+
+from FlexfillsApi import AsyncFlexfillsApiClient
+from FlexfillsApi.exceptions import FlexfillsParamsException
+from FlexfillsApi.history import BoundaryDeduplicator
+
+
+def fill(trade_id, order_id='order-1'):
+    return {"id": trade_id, "orderId": order_id, "globalInstrumentCd": "BTC/USD"}
+
+
+class BoundaryDeduplicatorTest(unittest.TestCase):
+
+    def test_records_repeated_by_adjacent_chunks_out_of_order(self):
+        deduplicator = BoundaryDeduplicator()
+
+        # Chunk 2 arrives first, then 0, then 1 which repeats the boundaries of both
+        last = deduplicator.filter(0, 2, 2, [fill('t4'), fill('t5')])
+        first = deduplicator.filter(0, 0, 2, [fill('t1'), fill('t2')])
+        middle = deduplicator.filter(0, 1, 2, [fill('t2'), fill('t3'), fill('t4')])
+
+        ids = [record['id'] for record in first + middle + last]
+        self.assertEqual(sorted(ids), ['t1', 't2', 't3', 't4', 't5'])
+        self.assertEqual([record['id'] for record in middle], ['t3'])
+
+    def test_fills_of_one_order_are_kept(self):
+        deduplicator = BoundaryDeduplicator()
+
+        first = deduplicator.filter(0, 0, 1, [fill('t1'), fill('t2')])
+        second = deduplicator.filter(0, 1, 1, [fill('t3')])
+
+        self.assertEqual(len(first + second), 3)
+
+    def test_only_neighbouring_chunks_and_groups_are_compared(self):
+        deduplicator = BoundaryDeduplicator()
+
+        first = deduplicator.filter(0, 0, 2, [fill('t1')])
+        last = deduplicator.filter(0, 2, 2, [fill('t1')])
+        other_group = deduplicator.filter(1, 1, 2, [fill('t1')])
+
+        self.assertEqual(len(first + last + other_group), 3)
+
+    def test_keys_are_forgotten_once_settled(self):
+        deduplicator = BoundaryDeduplicator()
+
+        for index in range(10):
+            deduplicator.filter(0, index, 9, [fill(f't{index}')])
+
+        self.assertEqual(deduplicator._keys, {})
+
+
+class IterHistoryTest(unittest.TestCase):
+
+    def test_parallelism_should_be_positive(self):
+        async def main():
+            client = AsyncFlexfillsApiClient('test', socket_url='ws://127.0.0.1:1')
+            return [record async for record in client.iter_trade_history(
+                '2024-01-01T00:00:00', '2024-01-02T00:00:00', ['BTC/USD'], parallelism=0)]
+
+        with self.assertRaises(FlexfillsParamsException):
+            asyncio.run(asyncio.wait_for(main(), 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
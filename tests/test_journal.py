@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from FlexfillsApi import AsyncFlexfillsApiClient
+from FlexfillsApi.journal import JournalWriter, journal_files, read_journal
+
+
+def frame(i):
+    return json.dumps({"channel": "TRADE_PUBLIC", "data": [{"instrument": "BTC/USD", "id": i}]})
+
+
+def read_all(path):
+    return [(timestamp, bytes(data)) for file in journal_files(path)
+            for timestamp, data in read_journal(file)]
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'feed.ffj')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip_across_rotation(self):
+        with JournalWriter(self.path, max_bytes=2000) as journal:
+            for i in range(200):
+                journal.record(frame(i), timestamp=i + 1)
+
+        self.assertGreater(len(journal_files(self.path)), 1)
+        self.assertEqual(read_all(self.path),
+                         [(i + 1, frame(i).encode('utf-8')) for i in range(200)])
+
+    def test_truncated_tail_ends_the_journal(self):
+        with JournalWriter(self.path) as journal:
+            for i in range(10):
+                journal.record(frame(i), timestamp=i + 1)
+
+        last = journal_files(self.path)[-1]
+        with open(last, 'r+b') as f:
+            f.truncate(os.path.getsize(last) - 3)
+
+        self.assertEqual([data for _timestamp, data in read_all(self.path)],
+                         [frame(i).encode('utf-8') for i in range(9)])
+
+    def test_flush_from_another_thread_keeps_records_whole(self):
+        journal = JournalWriter(self.path, buffer_size=1 << 20)
+        stopped = threading.Event()
+
+        def flush():
+            while not stopped.is_set():
+                journal.flush()
+
+        flusher = threading.Thread(target=flush)
+        flusher.start()
+
+        try:
+            for i in range(20000):
+                journal.record(frame(i))
+        finally:
+            stopped.set()
+            flusher.join()
+            journal.close()
+
+        self.assertEqual([data for _timestamp, data in read_all(self.path)],
+                         [frame(i).encode('utf-8') for i in range(20000)])
+
+    def test_quiet_feed_is_written_on_a_timer(self):
+        journal = JournalWriter(self.path, flush_interval=0.05)
+
+        try:
+            journal.record(frame(1))
+            time.sleep(0.5)
+
+            self.assertEqual(len(read_all(self.path)), 1)
+        finally:
+            journal.close()
+
+    def test_replay_leaves_pending_requests_alone(self):
+        with JournalWriter(self.path) as journal:
+            journal.record(json.dumps({"event": "ACK", "channel": "TRADE_PUBLIC",
+                                       "command": "SUBSCRIBE"}))
+            for i in range(5):
+                journal.record(frame(i))
+
+        async def main():
+            client = AsyncFlexfillsApiClient('test', socket_url='ws://127.0.0.1:1')
+
+            def resolve(frame):
+                raise AssertionError('a replayed frame was matched with the requests')
+
+            client._session._resolve = resolve
+
+            got = []
+            client.add_listener('TRADE_PUBLIC', got.append)
+
+            replayed = await client.replay(self.path)
+
+            return replayed, got
+
+        replayed, got = asyncio.run(main())
+
+        self.assertEqual(replayed, 6)
+        self.assertEqual([frame['data'][0]['id'] for frame in got if 'data' in frame],
+                         list(range(5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
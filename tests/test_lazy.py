@@ -0,0 +1,46 @@
+import time
+import unittest
+
+from FlexfillsApi import LazyFlexfillsApi, TokenManager
+from FlexfillsApi.auth import get_auth_token
+from FlexfillsApi.mock_server import MockFlexfillsServer
+
+
+class LazyLoginTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockFlexfillsServer(book_rate=0).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_next_call_retries_a_failed_login(self):
+        attempts = []
+
+        def fetch(*args, **kwargs):
+            attempts.append(True)
+            if len(attempts) == 1:
+                # Slow enough for wait() to be waiting for this attempt
+                time.sleep(0.3)
+                raise Exception('Could not connect to the login gateway')
+
+            return get_auth_token(*args, host=self.server.gateway_host, **kwargs)
+
+        api = LazyFlexfillsApi('user', 'password', token_manager=TokenManager(
+            'user', 'password', fetcher=fetch), socket_url=self.server.url,
+            gateway_host=self.server.gateway_host)
+
+        try:
+            with self.assertRaises(Exception):
+                api.wait()
+
+            api.wait(10)
+            self.assertTrue(api.ready)
+            self.assertEqual(len(attempts), 2)
+            self.assertIn('data', api.get_balance(['USD']))
+        finally:
+            api.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import asyncio
+import unittest
+
+from FlexfillsApi.scheduler import OrderScheduler
+
+
+def modify(price):
+    return {"globalInstrumentCd": "BTC/USD", "orderId": "1", "exchangeOrderId": "2",
+            "price": price}
+
+
+class ModifyCoalescingTest(unittest.TestCase):
+
+    def test_cancelled_replaced_caller_keeps_replacement(self):
+        async def main():
+            scheduler = OrderScheduler(rate=20, burst=1)
+
+            # Takes the only token, the modifies have to wait
+            await scheduler.schedule('CREATE', {"globalInstrumentCd": "BTC/USD"})
+
+            first = asyncio.ensure_future(scheduler.schedule('MODIFY', modify('101')))
+            await asyncio.sleep(0)
+
+            second = asyncio.ensure_future(scheduler.schedule('MODIFY', modify('102')))
+            await asyncio.sleep(0)
+
+            # The replaced caller goes away before it sees its REPLACED response
+            first.cancel()
+
+            data, response = await asyncio.wait_for(second, 1)
+
+            self.assertIsNone(response)
+            self.assertEqual(data['price'], '102')
+            self.assertEqual(scheduler.depth, 0)
+            self.assertEqual(scheduler.stats()['modify']['coalesced'], 1)
+
+        asyncio.run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import threading
+import time
+import unittest
+
+from FlexfillsApi import FlexfillsApiClient
+from FlexfillsApi.constants import CH_PRV_TRADE_PRIVATE
+from FlexfillsApi.exceptions import FlexfillsConnectException
+from FlexfillsApi.mock_server import MockFlexfillsServer
+from FlexfillsApi.session import EventLoopThread
+
+
+class ResponseMatchingTest(unittest.TestCase):
+
+    def setUp(self):
+        # Responses are sent half a second after the ACK, streamed fills arrive in between
+        self.server = MockFlexfillsServer(book_rate=0, response_delay=0.5).start()
+        self.client = FlexfillsApiClient('test', warm_instruments=['BTC/USD'],
+                                         socket_url=self.server.url,
+                                         gateway_host=self.server.gateway_host)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_streamed_fills_do_not_resolve_pending_get(self):
+        self.client.warm_up()
+        self.client.create_order([{
+            "globalInstrumentCd": "BTC/USD",
+            "clientOrderId": "open-1",
+            "exchange": "FLEXFILLS",
+            "direction": "BUY",
+            "orderType": "LIMIT",
+            "timeInForce": "GTC",
+            "amount": "0.01",
+            "price": "10000",
+        }])
+
+        resps = []
+        request = threading.Thread(
+            target=lambda: resps.append(self.client.get_open_orders_list(['BTC/USD'])))
+        request.start()
+
+        # Fills of an order made elsewhere, streamed on the TRADE_PRIVATE subscription
+        for i in range(5):
+            time.sleep(0.05)
+            self.server.push({"channel": CH_PRV_TRADE_PRIVATE, "data": [{
+                "globalInstrumentCd": "BTC/USD", "orderId": f"other-{i}", "status": "FILLED"}]})
+
+        request.join(10)
+
+        self.assertEqual(len(resps), 1)
+        self.assertEqual([order['clientOrderId'] for order in resps[0]['data']], ['open-1'])
+
+
+
+class ReaderFailureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockFlexfillsServer(book_rate=0).start()
+        self.failures = []
+        self.client = FlexfillsApiClient('test', warm_instruments=['BTC/USD'],
+                                         socket_url=self.server.url,
+                                         gateway_host=self.server.gateway_host,
+                                         recorder=self.record)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def record(self, frame):
+        if self.failures:
+            self.failures.pop()
+            raise OSError('disk full')
+
+    def test_failed_reader_fails_pending_and_reconnects(self):
+        self.client.warm_up()
+
+        self.failures.append(True)
+        started = time.monotonic()
+
+        # The reader dies on the response, the request fails at once instead of timing out
+        with self.assertRaises(FlexfillsConnectException):
+            self.client.get_open_orders_list(['BTC/USD'])
+
+        self.assertLess(time.monotonic() - started, 5)
+
+        # The subscriptions are restored on a new connection in the background
+        for _ in range(50):
+            if self.client._session.connected:
+                break
+            time.sleep(0.1)
+
+        self.assertEqual(self.server.stats['connections'], 2)
+        self.assertIn('data', self.client.get_open_orders_list(['BTC/USD']))
+
+
+class LoopIterateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop_thread = EventLoopThread('FlexfillsApiTestLoop')
+
+    def tearDown(self):
+        self.loop_thread.stop()
+
+    def test_items_are_pulled_one_at_a_time(self):
+        produced = []
+        closed = []
+
+        async def numbers():
+            try:
+                for i in range(200000):
+                    produced.append(i)
+                    yield i
+            finally:
+                closed.append(True)
+
+        items = self.loop_thread.iterate(numbers())
+
+        self.assertEqual(next(items), 0)
+        self.assertEqual(next(items), 1)
+        self.assertEqual(len(produced), 2)
+
+        items.close()
+        self.assertEqual(closed, [True])
+
+    def test_errors_are_raised_in_the_consumer(self):
+        async def failing():
+            yield 1
+            raise ValueError('boom')
+
+        items = self.loop_thread.iterate(failing())
+
+        self.assertEqual(next(items), 1)
+        with self.assertRaises(ValueError):
+            next(items)
+
+
+if __name__ == '__main__':
+    unittest.main()
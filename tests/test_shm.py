@@ -0,0 +1,74 @@
+import os
+import unittest
+
+from FlexfillsApi.shm import MarketDataPublisher, MarketDataReader
+
+
+class MarketDataRingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.name = f"flexfills-test-{os.getpid()}"
+        self.publisher = MarketDataPublisher(self.name, slots=8, depth=5)
+        self.reader = MarketDataReader(self.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.publisher.close()
+
+    def publish(self, count):
+        for i in range(count):
+            self.publisher.publish_trade('BTC/USD', 100 + i, 1, 'BUY', i, trade_id=f"t{i}")
+
+    def test_trades_round_trip(self):
+        self.publish(3)
+
+        records = self.reader.read()
+
+        self.assertEqual([record.trade_id for record in records], ['t0', 't1', 't2'])
+        self.assertEqual([record.sequence for record in records], [1, 2, 3])
+        self.assertEqual(records[1].price, 101)
+        self.assertEqual(self.reader.lag, 0)
+
+    def test_lapped_reader_counts_the_gap(self):
+        self.publish(20)
+
+        records = self.reader.read()
+        sequences = [record.sequence for record in records]
+
+        # Only the slots the writer is not about to overwrite are read
+        self.assertEqual(sequences, list(range(14, 21)))
+        self.assertEqual(self.reader.gaps, 1)
+        self.assertEqual(self.reader.missed, 13)
+
+        self.publish(2)
+        self.assertEqual([record.sequence for record in self.reader.read()], [21, 22])
+        self.assertEqual(self.reader.gaps, 1)
+
+    def test_record_being_written_is_not_read(self):
+        self.publish(1)
+
+        # The writer is inside the seqlock of the next slot
+        offset = self.publisher._begin()
+
+        self.assertEqual([record.sequence for record in self.reader.read()], [1])
+        self.assertEqual(self.reader.read(), [])
+
+        self.publisher._commit(offset)
+        self.assertEqual([record.sequence for record in self.reader.read()], [2])
+
+    def test_reader_follows_a_restarted_gateway(self):
+        self.publish(2)
+        self.reader.read()
+
+        self.publisher.close()
+        self.publisher = MarketDataPublisher(self.name, slots=8, depth=5)
+        self.publish(1)
+
+        records = self.reader.read()
+
+        self.assertEqual([record.trade_id for record in records], ['t0'])
+        self.assertEqual(self.reader.gaps, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
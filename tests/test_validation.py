@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+from FlexfillsApi.exceptions import FlexfillsParamsException
+from FlexfillsApi.validation import CREATE_ORDER_SCHEMA
+
+
+class ColumnValidationTest(unittest.TestCase):
+
+    def columns(self, **overrides):
+        columns = {
+            "globalInstrumentCd": ["BTC/USD", "BTC/USD"],
+            "exchange": ["FLEXFILLS", "FLEXFILLS"],
+            "direction": ["buy", "SELL"],
+            "orderType": ["LIMIT", "MARKET"],
+            "amount": np.array([0.5, 1.5]),
+        }
+        columns.update(overrides)
+
+        return columns
+
+    def test_object_column_with_none(self):
+        rows = CREATE_ORDER_SCHEMA.validate_columns(
+            self.columns(price=np.array(['1.5', None], dtype=object)))
+
+        self.assertEqual(rows[0]['price'], '1.5')
+        self.assertNotIn('price', rows[1])
+        self.assertEqual([row['direction'] for row in rows], ['BUY', 'SELL'])
+        self.assertEqual(rows[0]['class'], 'Order')
+
+    def test_object_column_with_nan(self):
+        rows = CREATE_ORDER_SCHEMA.validate_columns(
+            self.columns(price=np.array([1.5, float('nan')], dtype=object)))
+
+        self.assertEqual(rows[0]['price'], '1.5')
+        self.assertNotIn('price', rows[1])
+
+    def test_columns_match_payloads(self):
+        columns = self.columns(price=np.array([1.5, 2.5]))
+        payloads = [{key: column[i] for key, column in columns.items()} for i in range(2)]
+
+        self.assertEqual(CREATE_ORDER_SCHEMA.validate_columns(columns),
+                         CREATE_ORDER_SCHEMA.validate_batch(payloads))
+
+    def test_missing_required_value(self):
+        with self.assertRaises(FlexfillsParamsException):
+            CREATE_ORDER_SCHEMA.validate_columns(
+                self.columns(amount=np.array([0.5, None], dtype=object)))
+
+
+if __name__ == '__main__':
+    unittest.main()